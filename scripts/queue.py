@@ -10,7 +10,8 @@ usage: teuthology-queue -h
        teuthology-queue -m MACHINE_TYPE -D PATTERN
        teuthology-queue -p SECONDS [-m MACHINE_TYPE]
 
-List Jobs in queue.
+List Jobs in queue. Listing does not reserve the jobs, so it does not get in
+the way of workers.
 If -D is passed, then jobs with PATTERN in the job name are deleted from the
 queue.
 
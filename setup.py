@@ -88,6 +88,7 @@ setup(
             'python-neutronclient',
             'raven',
             'requests != 2.13.0',
+            'zstandard',  # for faster archive transfers
         ],
         'test': [
             'boto >= 2.0b4',       # for qa/tasks/radosgw_*.py
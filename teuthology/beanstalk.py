@@ -61,6 +61,258 @@ def walk_jobs(connection, tube_name, processor, pattern=None):
     processor.complete()
 
 
+def peek_jobs(connection, tube_name, processor, pattern=None, fields=None,
+              batch_size=1000):
+    """
+    Like walk_jobs(), but without reserving any job, so that workers are
+    never kept from the jobs being inspected.
+
+    Beanstalk can't list the jobs in a tube, so the ready jobs are found by
+    asking for the stats of every job id, newest first, until as many as
+    the tube holds have been found; the commands are pipelined, batch_size at
+    a time. The jobs are passed to the processor in the order a worker would
+    reserve them.
+
+    Jobs may be reserved or deleted while the ids are scanned, so whenever
+    a whole batch of ids turns out not to exist, the number of ready jobs is
+    looked up again. If fewer jobs are listed than the tube held to begin
+    with, a warning says so.
+
+    :param fields: If not None, only these top-level fields of each job's
+                   config are parsed; 'name' is always included.
+    """
+    if ',' in tube_name:
+        tube_name = 'multi'
+    log.info("Checking Beanstalk Queue...")
+    job_count = connection.stats_tube(tube_name)['current-jobs-ready']
+    if job_count == 0:
+        log.info('No jobs in Beanstalk Queue')
+        return
+    if fields is not None:
+        fields = set(fields) | set(['name'])
+
+    ready = sorted(_find_ready_jobs(connection, tube_name, job_count,
+                                    batch_size))
+    job_ids = [job_id for _, job_id in ready]
+    listed = 0
+    for i in range(0, len(job_ids), batch_size):
+        batch = job_ids[i:i + batch_size]
+        responses = _interact_pipelined(
+            connection, ['peek %d\r\n' % job_id for job_id in batch])
+        for job_id, (status, _, body) in zip(batch, responses):
+            if status != 'FOUND':
+                # it was reserved or deleted in the meantime
+                continue
+            listed += 1
+            if fields is None:
+                job_config = yaml.safe_load(body)
+            else:
+                job_config = parse_job_fields(body, fields)
+            if pattern is not None and pattern not in job_config['name']:
+                continue
+            job = beanstalkc.Job(connection, job_id, body, reserved=False)
+            processor.add_job(job_id, job_config, job)
+    processor.complete()
+    if listed < job_count:
+        log.warning("Only %d of the %d jobs that were ready in %s were "
+                    "listed; the others were reserved or deleted meanwhile",
+                    listed, job_count, tube_name)
+
+
+def _find_ready_jobs(connection, tube_name, job_count, batch_size):
+    """
+    Return a list of (priority, job_id) for the ready jobs in tube_name
+    """
+    found = list()
+
+    def scan(job_ids):
+        # Returns False if none of job_ids exist
+        any_found = False
+        responses = _interact_pipelined(
+            connection, ['stats-job %d\r\n' % job_id for job_id in job_ids])
+        for job_id, (status, _, body) in zip(job_ids, responses):
+            if status != 'OK':
+                continue
+            any_found = True
+            stats = _parse_stats(body)
+            if stats['tube'] == tube_name and stats['state'] == 'ready':
+                found.append((int(stats['pri']), job_id))
+        return any_found
+
+    # Job ids are allocated sequentially. total-jobs counts the jobs put
+    # since beanstalkd started, so after a restart with a binlog, there may
+    # be newer jobs than that; the ready job peeked at is a lower bound, too.
+    top = int(connection.stats()['total-jobs'])
+    connection.use(tube_name)
+    job = connection.peek_ready()
+    if job is not None:
+        top = max(top, job.jid)
+    job_id = top
+    while job_id > 0 and len(found) < job_count:
+        if not scan(list(range(job_id, max(job_id - batch_size, 0), -1))):
+            # If jobs were reserved or deleted since they were counted, as
+            # many as that will never be found. Jobs put since then are
+            # newer than top, and are looked for below.
+            job_count = min(
+                job_count,
+                connection.stats_tube(tube_name)['current-jobs-ready'])
+        job_id -= batch_size
+    job_id = top + 1
+    while len(found) < job_count:
+        if not scan(list(range(job_id, job_id + batch_size))):
+            break
+        job_id += batch_size
+    return found
+
+
+def _parse_stats(body):
+    """
+    Parse the flat yaml mapping returned by stats commands; much faster than
+    a yaml parser when looking at thousands of jobs
+    """
+    stats = dict()
+    for line in body.splitlines():
+        if ': ' in line:
+            key, value = line.split(': ', 1)
+            stats[key] = value.strip().strip('"')
+    return stats
+
+
+def parse_job_fields(body, fields):
+    """
+    Parse only some of the top-level fields of a job's yaml config
+
+    :param body:   The job's yaml config, as put into beanstalk
+    :param fields: The names of the fields to parse
+    :returns:      A dict of the fields that were present
+    """
+    lines = list()
+    wanted = False
+    for line in body.splitlines(True):
+        # top-level keys start in the first column; list items of a
+        # top-level key may too, but start with a dash
+        if line[:1] not in (' ', '\t', '-', '#', '\n') and ':' in line:
+            wanted = line.split(':', 1)[0] in fields
+        if wanted:
+            lines.append(line)
+    return yaml.safe_load(''.join(lines)) or dict()
+
+
+def put_jobs(connection, jobs, batch_size=100):
+    """
+    Put several jobs, sending up to batch_size commands before reading their
+    responses instead of waiting for each job to be acknowledged in turn.
+
+    If the connection fails, or beanstalkd answers unexpectedly, the jobs
+    put until then keep their ids, and every other job gets the error: it
+    is unknown whether beanstalkd took them. The connection is then closed,
+    since it can't be used any further.
+
+    :param connection: A beanstalkc.Connection
+    :param jobs:       A list of (tube, body, priority, ttr) tuples
+    :param batch_size: The most commands to send before reading responses
+    :returns:          A list holding, for each job, either its id or the
+                       beanstalkc.BeanstalkcException it failed with
+    """
+    if not (isinstance(connection, beanstalkc.Connection) and
+            all(hasattr(connection, name) for name in _PIPELINE_INTERNALS)):
+        # e.g. a wrapped or fake connection, or a beanstalkc without the
+        # internals pipelining relies on; put one job at a time
+        return _put_jobs_serially(connection, jobs)
+    results = list()
+    tube_used = None
+    try:
+        for i in range(0, len(jobs), batch_size):
+            commands = list()
+            for tube, body, priority, ttr in jobs[i:i + batch_size]:
+                if tube != tube_used:
+                    commands.append('use %s\r\n' % tube)
+                    tube_used = tube
+                commands.append('put %d %d %d %d\r\n%s\r\n' % (
+                    priority, 0, ttr, len(body), body))
+            # read lazily, so that the jobs before a failure keep their ids
+            responses = _iter_pipelined(connection, commands)
+            for command in commands:
+                status, response, _ = next(responses)
+                name = command.split()[0]
+                if name == 'use':
+                    if status != 'USING':
+                        raise beanstalkc.UnexpectedResponse(
+                            name, status, response)
+                elif status == 'INSERTED':
+                    results.append(int(response[0]))
+                elif status in ('JOB_TOO_BIG', 'BURIED', 'DRAINING'):
+                    results.append(
+                        beanstalkc.CommandFailed(name, status, response))
+                else:
+                    raise beanstalkc.UnexpectedResponse(
+                        name, status, response)
+    except (beanstalkc.SocketError, beanstalkc.UnexpectedResponse) as exc:
+        _abandon_puts(connection, jobs, results, exc)
+    return results
+
+
+def _put_jobs_serially(connection, jobs):
+    results = list()
+    tube_used = None
+    try:
+        for tube, body, priority, ttr in jobs:
+            if tube != tube_used:
+                connection.use(tube)
+                tube_used = tube
+            try:
+                results.append(
+                    connection.put(body, ttr=ttr, priority=priority))
+            except beanstalkc.CommandFailed as exc:
+                results.append(exc)
+    except (beanstalkc.SocketError, beanstalkc.UnexpectedResponse) as exc:
+        _abandon_puts(connection, jobs, results, exc)
+    return results
+
+
+def _abandon_puts(connection, jobs, results, exc):
+    """
+    Give exc as the result of the jobs put_jobs() got no result for, and
+    close the connection
+    """
+    log.error("Lost track of %d of %d jobs being put into beanstalk: %r",
+              len(jobs) - len(results), len(jobs), exc)
+    results.extend([exc] * (len(jobs) - len(results)))
+    connection.close()
+
+
+# the beanstalkc.Connection internals that _iter_pipelined() relies on
+_PIPELINE_INTERNALS = ('_socket', '_read_response', '_read_body')
+
+
+def _interact_pipelined(connection, commands):
+    """
+    Send all of commands to beanstalkd at once, then read their responses
+
+    :param connection: A beanstalkc.Connection
+    :param commands:   A list of complete commands, including their trailing
+                       CRLF
+    :returns:          A list of (status, results, body) tuples; body is None
+                       for responses without one
+    """
+    return list(_iter_pipelined(connection, commands))
+
+
+def _iter_pipelined(connection, commands):
+    """
+    Like _interact_pipelined(), but yield each response as it is read
+    """
+    beanstalkc.SocketError.wrap(connection._socket.sendall, ''.join(commands))
+    for _ in commands:
+        status, results = connection._read_response()
+        body = None
+        if status == 'OK':
+            body = connection._read_body(int(results[0]))
+        elif status in ('FOUND', 'RESERVED'):
+            body = connection._read_body(int(results[1]))
+        yield status, results, body
+
+
 def print_progress(index, total, message=None):
     msg = "{m} ".format(m=message) if message else ''
     sys.stderr.write("{msg}{i}/{total}\r".format(
@@ -203,11 +455,13 @@ def main(args):
             walk_jobs(connection, machine_type,
                       JobDeleter(delete))
         elif runs:
-            walk_jobs(connection, machine_type,
-                      RunPrinter())
+            peek_jobs(connection, machine_type,
+                      RunPrinter(), fields=['name'])
         else:
-            walk_jobs(connection, machine_type,
-                      JobPrinter(show_desc=show_desc, full=full))
+            fields = None if full else ['name', 'priority', 'description']
+            peek_jobs(connection, machine_type,
+                      JobPrinter(show_desc=show_desc, full=full),
+                      fields=fields)
     except KeyboardInterrupt:
         log.info("Interrupted.")
     finally:
@@ -160,8 +160,19 @@ class TeuthologyConfig(YamlConfig):
         'results_sending_email': 'teuthology',
         'results_timeout': 43200,
         'src_base_path': os.path.expanduser('~/src'),
+        'suite_cache': True,
+        'suite_package_cache_ttl': 24 * 60 * 60,
         'verify_host_keys': True,
+        'connect_workers': 16,
+        'ssh_max_exec_channels': 8,
+        'parallel_limit': 32,
+        'archive_bandwidth_limit': None,
+        'log_lines_per_second': 1000,
         'watchdog_interval': 120,
+        'heartbeat_spool_dir': '/tmp/teuthology-heartbeats',
+        'lock_queue_dir': '/tmp/teuthology-lock-queue',
+        'lock_queue_aging': 600,
+        'lock_status_cache_ttl': 60,
         'kojihub_url': 'http://koji.fedoraproject.org/kojihub',
         'kojiroot_url': 'http://kojipkgs.fedoraproject.org/packages',
         'koji_task_url': 'https://kojipkgs.fedoraproject.org/work/',
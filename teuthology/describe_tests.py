@@ -8,7 +8,8 @@ import sys
 import yaml
 
 from teuthology.exceptions import ParseError
-from teuthology.suite.build_matrix import build_matrix, combine_path
+from teuthology.suite.build_matrix import combine_path, iterate_matrix
+from teuthology.suite.cache import get_suite_cache
 
 
 def main(args):
@@ -23,6 +24,7 @@ def describe_tests(args):
     fields = args["--fields"].split(',')
     include_facet = args['--show-facet'] == 'yes'
     output_format = args['--format']
+    cache = get_suite_cache(suite_dir)
 
     if args['--combinations']:
         limit = int(args['--limit'])
@@ -37,11 +39,12 @@ def describe_tests(args):
             subset = map(int, args['--subset'].split('/'))
         headers, rows = get_combinations(suite_dir, fields, subset,
                                          limit, filter_in,
-                                         filter_out, include_facet)
+                                         filter_out, include_facet,
+                                         cache=cache)
         hrule = ALL
     else:
         headers, rows = describe_suite(suite_dir, fields, include_facet,
-                                       output_format)
+                                       output_format, cache=cache)
         hrule = FRAME
 
     output_results(headers, rows, output_format, hrule)
@@ -71,17 +74,18 @@ def output_results(headers, rows, output_format, hrule):
 
 def get_combinations(suite_dir, fields, subset,
                      limit, filter_in, filter_out,
-                     include_facet):
+                     include_facet, cache=None):
     """
     Describes the combinations of a suite, optionally limiting
     or filtering output based on the given parameters. Includes
     columns for the subsuite and facets when include_facet is True.
+    If a SuiteCache is given, the matrix and fragments are read from it.
 
     Returns a tuple of (headers, rows) where both elements are lists
     of strings.
     """
-    configs = [(combine_path(suite_dir, item[0]), item[1]) for item in
-               build_matrix(suite_dir, subset)]
+    configs = ((combine_path(suite_dir, item[0]), item[1]) for item in
+               iterate_matrix(suite_dir, subset, cache=cache))
 
     num_listed = 0
     rows = []
@@ -100,7 +104,7 @@ def get_combinations(suite_dir, fields, subset,
                                for path in fragment_paths]):
             continue
 
-        fragment_fields = [extract_info(path, fields)
+        fragment_fields = [extract_info(path, fields, cache)
                            for path in fragment_paths]
 
         # merge fields from multiple fragments by joining their values with \n
@@ -154,7 +158,8 @@ def get_combinations(suite_dir, fields, subset,
                             for row in rows])
 
 
-def describe_suite(suite_dir, fields, include_facet, output_format):
+def describe_suite(suite_dir, fields, include_facet, output_format,
+                   cache=None):
     """
     Describe a suite listing each subdirectory and file once as a
     separate row.
@@ -164,7 +169,7 @@ def describe_suite(suite_dir, fields, include_facet, output_format):
 
     """
     rows = tree_with_info(suite_dir, fields, include_facet, '', [],
-                          output_format=output_format)
+                          output_format=output_format, cache=cache)
 
     headers = ['path']
     if include_facet:
@@ -172,7 +177,7 @@ def describe_suite(suite_dir, fields, include_facet, output_format):
     return headers + fields, rows
 
 
-def extract_info(file_name, fields):
+def extract_info(file_name, fields, cache=None):
     """
     Read a yaml file and return a dictionary mapping the fields to the
     values of those fields in the file.
@@ -192,13 +197,18 @@ def extract_info(file_name, fields):
 
     If 'meta' is present but not in this format, prints an error
     message and raises ParseError.
+
+    If a SuiteCache is given, the parsed file is taken from it.
     """
     empty_result = {f: '' for f in fields}
     if os.path.isdir(file_name) or not file_name.endswith('.yaml'):
         return empty_result
 
-    with open(file_name, 'r') as f:
-        parsed = yaml.safe_load(f)
+    if cache is not None:
+        parsed = cache.get_fragment(file_name)
+    else:
+        with open(file_name, 'r') as f:
+            parsed = yaml.safe_load(f)
 
     if not isinstance(parsed, dict):
         return empty_result
@@ -228,7 +238,7 @@ def path_relative_to_suites(path):
 
 
 def tree_with_info(cur_dir, fields, include_facet, prefix, rows,
-                   output_format='plain'):
+                   output_format='plain', cache=None):
     """
     Gather fields from all files and directories in cur_dir.
     Returns a list of strings for each path containing:
@@ -253,7 +263,7 @@ def tree_with_info(cur_dir, fields, include_facet, prefix, rows,
         else:
             file_pad = '├── '
             dir_pad = '│   '
-        info = extract_info(path, fields)
+        info = extract_info(path, fields, cache)
         tree_node = prefix + file_pad + f
         if output_format != 'plain':
             tree_node = path_relative_to_suites(path)
@@ -264,5 +274,5 @@ def tree_with_info(cur_dir, fields, include_facet, prefix, rows,
         rows.append(row + meta)
         if os.path.isdir(path):
             tree_with_info(path, fields, include_facet,
-                           prefix + dir_pad, rows, output_format)
+                           prefix + dir_pad, rows, output_format, cache)
     return rows
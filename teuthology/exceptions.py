@@ -173,6 +173,32 @@ class MaxWhileTries(Exception):
     pass
 
 
+class WaitTimeout(MaxWhileTries):
+    """
+    Raised by teuthology.orchestra.run.wait() when processes are still
+    running at its timeout
+    """
+    def __init__(self, timeout, hosts):
+        self.timeout = timeout
+        self.hosts = hosts
+
+    def __str__(self):
+        return "{count} process(es) still running after {timeout}s " \
+            "on: {hosts}".format(
+                count=len(self.hosts),
+                timeout=self.timeout,
+                hosts=', '.join(sorted(set(self.hosts))),
+            )
+
+
+class ParallelTaskTimeout(Exception):
+    """
+    Raised in a function spawned by teuthology.parallel.parallel that ran
+    for longer than the timeout it was given
+    """
+    pass
+
+
 class ConsoleError(Exception):
     pass
 
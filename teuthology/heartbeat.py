@@ -0,0 +1,196 @@
+"""
+Coalescing of watchdog heartbeats.
+
+Rather than each job telling the results server that it is still alive
+every watchdog_interval, the workers on a host record their jobs'
+heartbeats in a spool directory (config.heartbeat_spool_dir). Whichever
+worker next finds that a flush is due pushes every heartbeat recorded since
+the previous flush, over a single session (see report.try_push_jobs_info()).
+A lock file ensures only one worker flushes at a time, and no separate
+daemon is needed.
+
+If the spool directory is not configured or can't be written to,
+heartbeats are pushed one job at a time, as they used to be.
+
+Each flush writes metrics.json to the spool directory, recording how late
+the heartbeats it pushed were.
+"""
+import errno
+import json
+import logging
+import os
+import tempfile
+import time
+
+from teuthology import report
+from teuthology.config import config
+from teuthology.util.flock import FileLock
+
+log = logging.getLogger(__name__)
+
+
+def get_spool():
+    """
+    Return the HeartbeatSpool for this host, or None if heartbeats are not
+    to be coalesced
+    """
+    if not config.heartbeat_spool_dir:
+        return None
+    return HeartbeatSpool(config.heartbeat_spool_dir)
+
+
+def beat(job_infos, spool=None):
+    """
+    Record that the jobs are still alive, and flush the spool if that is due
+
+    :param job_infos: A list of dicts with (at least) each job's name and
+                      job_id
+    :param spool:     The HeartbeatSpool to use; defaults to get_spool()
+    """
+    spool = spool or get_spool()
+    if spool is not None:
+        try:
+            for job_info in job_infos:
+                spool.record(job_info)
+            spool.flush()
+            return
+        except (IOError, OSError):
+            log.exception("Could not spool heartbeats in %s; pushing them "
+                          "directly", spool.path)
+    for job_info in job_infos:
+        # calling this without a status just updates the job's updated time
+        report.try_push_job_info(job_info)
+
+
+def forget(job_id, spool=None):
+    """
+    Stop sending heartbeats for a job that is no longer running
+    """
+    spool = spool or get_spool()
+    if spool is not None:
+        spool.remove(job_id)
+
+
+class HeartbeatSpool(object):
+    """
+    A directory holding the latest heartbeat of each job running on the host
+    """
+    lock_file = '.lock'
+    flush_file = '.last_flush'
+    metrics_file = 'metrics.json'
+
+    def __init__(self, path, interval=None):
+        """
+        :param path:     The spool directory
+        :param interval: The most seconds a heartbeat may wait to be pushed.
+                         Defaults to half of config.watchdog_interval.
+        """
+        self.path = path
+        if interval is None:
+            interval = config.watchdog_interval / 2.0
+        self.interval = interval
+
+    def _job_path(self, job_id):
+        return os.path.join(self.path, '%s.json' % job_id)
+
+    def _write(self, path, data):
+        with tempfile.NamedTemporaryFile(
+                'w', dir=self.path, prefix='.tmp-', delete=False) as f:
+            json.dump(data, f)
+        os.rename(f.name, path)
+
+    def record(self, job_info):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._write(
+            self._job_path(job_info['job_id']),
+            dict(name=job_info['name'], job_id=str(job_info['job_id']),
+                 time=time.time()),
+        )
+
+    def remove(self, job_id):
+        try:
+            os.remove(self._job_path(job_id))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                log.warning("Could not remove heartbeat of job %s: %s",
+                            job_id, e)
+
+    @property
+    def last_flush(self):
+        try:
+            return os.path.getmtime(os.path.join(self.path, self.flush_file))
+        except OSError:
+            return 0
+
+    def flush(self, force=False):
+        """
+        Push the heartbeats recorded since the last flush, if the last flush
+        is more than interval seconds old (or force is True) and no other
+        process is flushing
+
+        :returns: True if this call flushed the spool
+        """
+        now = time.time()
+        if not force and now - self.last_flush < self.interval:
+            return False
+        with FileLock(os.path.join(self.path, self.lock_file),
+                      blocking=False) as lock:
+            if not lock.acquired:
+                return False
+            # another process may have flushed while we waited for the lock
+            since = self.last_flush
+            if not force and now - since < self.interval:
+                return False
+            with open(os.path.join(self.path, self.flush_file), 'w'):
+                pass
+            heartbeats = self._collect(since, now)
+            report.try_push_jobs_info([
+                dict(name=heartbeat['name'], job_id=heartbeat['job_id'])
+                for heartbeat in heartbeats
+            ])
+            self._write_metrics(heartbeats, now)
+        return True
+
+    def _collect(self, since, now):
+        heartbeats = list()
+        for name in os.listdir(self.path):
+            if name.startswith('.') or not name.endswith('.json') or \
+                    name == self.metrics_file:
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                with open(path) as f:
+                    heartbeat = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if now - heartbeat['time'] > 3 * config.watchdog_interval:
+                # its worker went away without forgetting it
+                log.warning("Removing stale heartbeat of job %s",
+                            heartbeat['job_id'])
+                self.remove(heartbeat['job_id'])
+            elif heartbeat['time'] >= since:
+                heartbeats.append(heartbeat)
+        return heartbeats
+
+    def _write_metrics(self, heartbeats, now):
+        lags = [time.time() - heartbeat['time'] for heartbeat in heartbeats]
+        metrics = dict(
+            flush_time=now,
+            flush_duration=time.time() - now,
+            heartbeats=len(heartbeats),
+            max_lag=max(lags) if lags else 0,
+            mean_lag=sum(lags) / len(lags) if lags else 0,
+        )
+        log.debug("Flushed heartbeats: %s", metrics)
+        self._write(os.path.join(self.path, self.metrics_file), metrics)
+
+    def metrics(self):
+        """
+        Return the metrics of the last flush, or None if there is none
+        """
+        try:
+            with open(os.path.join(self.path, self.metrics_file)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
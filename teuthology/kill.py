@@ -1,17 +1,23 @@
 #!/usr/bin/python
+import argparse
 import os
 import sys
 import yaml
 import psutil
 import subprocess
-import tempfile
 import logging
 import getpass
 
+from prettytable import PrettyTable
+
+import teuthology.lock.ops
+import teuthology.lock.query
+import teuthology.nuke
 from teuthology import beanstalk
 from teuthology import report
 from teuthology.config import config
 from teuthology import misc
+from teuthology.parallel import parallel
 
 log = logging.getLogger(__name__)
 
@@ -31,15 +37,26 @@ def main(args):
         job = [split_spec[1]]
 
     if job:
-        for job_id in job:
-            kill_job(run_name, job_id, archive_base, owner)
+        outcomes = dict()
+        with parallel() as p:
+            for job_id in job:
+                p.spawn(kill_job, run_name, job_id, archive_base, owner)
+            for job_outcomes in p:
+                outcomes.update(job_outcomes)
     else:
-        kill_run(run_name, archive_base, owner, machine_type,
-                 preserve_queue=preserve_queue)
+        outcomes = kill_run(run_name, archive_base, owner, machine_type,
+                            preserve_queue=preserve_queue)
+    report_outcomes(outcomes)
 
 
 def kill_run(run_name, archive_base=None, owner=None, machine_type=None,
              preserve_queue=False):
+    """
+    Kill a run's jobs and nuke their targets
+
+    :returns: A dict mapping each target to what happened to it; see
+              nuke_targets()
+    """
     run_info = {}
     serializer = report.ResultsSerializer(archive_base)
     if archive_base:
@@ -56,12 +73,19 @@ def kill_run(run_name, archive_base=None, owner=None, machine_type=None,
         remove_beanstalk_jobs(run_name, machine_type)
         remove_paddles_jobs(run_name)
     kill_processes(run_name, run_info.get('pids'))
-    if owner is not None:
-        targets = find_targets(run_name, owner)
-        nuke_targets(targets, owner)
+    if owner is None:
+        return {}
+    targets = find_targets(run_name, owner)
+    return nuke_targets(targets, owner)
 
 
 def kill_job(run_name, job_id, archive_base=None, owner=None):
+    """
+    Kill a job and nuke its targets
+
+    :returns: A dict mapping each target to what happened to it; see
+              nuke_targets()
+    """
     serializer = report.ResultsSerializer(archive_base)
     job_info = serializer.job_info(run_name, job_id)
     if not owner:
@@ -72,7 +96,7 @@ def kill_job(run_name, job_id, archive_base=None, owner=None):
         owner = job_info['owner']
     kill_processes(run_name, [job_info.get('pid')])
     targets = dict(targets=job_info.get('targets', {}))
-    nuke_targets(targets, owner)
+    return nuke_targets(targets, owner)
 
 
 def find_run_info(serializer, run_name):
@@ -191,56 +215,72 @@ def find_pids(run_name):
 
 
 def find_targets(run_name, owner):
-    lock_args = [
-        'teuthology-lock',
-        '--list-targets',
-        '--desc-pattern',
-        '/' + run_name + '/',
-        '--status',
-        'up',
-        '--owner',
-        owner
+    """
+    Find the nodes that owner has locked for the run's jobs and that are up,
+    as 'teuthology-lock --list-targets' would.
+
+    :returns: A dict like {'targets': {name: ssh_pub_key}}, or an empty
+              dict if there are no such nodes
+    """
+    pattern = '/' + run_name + '/'
+    nodes = [
+        node for node in teuthology.lock.query.list_locks(locked=True)
+        if node['up'] and node['locked_by'] == owner and
+        node['description'] and pattern in node['description']
     ]
-    proc = subprocess.Popen(lock_args, stdout=subprocess.PIPE)
-    stdout, stderr = proc.communicate()
-    out_obj = yaml.safe_load(stdout)
-    if not out_obj or 'targets' not in out_obj:
+    if not nodes:
         return {}
-
-    return out_obj
+    targets = dict((node['name'], node['ssh_pub_key']) for node in nodes)
+    # VMs get new host keys when they are recreated
+    vms = [node['name'] for node in nodes
+           if teuthology.lock.query.is_vm(status=node)]
+    if vms:
+        targets.update(
+            teuthology.lock.ops.do_update_keys(vms, _raise=False)[1])
+    return dict(targets=targets)
 
 
 def nuke_targets(targets_dict, owner):
+    """
+    Nuke, reboot and unlock the targets, concurrently
+
+    :returns: A dict mapping each target to 'nuked' or 'failed'
+    """
     targets = targets_dict.get('targets')
     if not targets:
         log.info("No locked machines. Not nuking anything")
-        return
+        return {}
 
     to_nuke = []
     for target in targets:
         to_nuke.append(misc.decanonicalize_hostname(target))
 
-    target_file = tempfile.NamedTemporaryFile(delete=False)
-    target_file.write(yaml.safe_dump(targets_dict))
-    target_file.close()
-
     log.info("Nuking machines: " + str(to_nuke))
-    nuke_args = [
-        'teuthology-nuke',
-        '-t',
-        target_file.name,
-        '--unlock',
-        '-r',
-        '--owner',
-        owner
-    ]
-    proc = subprocess.Popen(
-        nuke_args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT)
-    for line in iter(proc.stdout.readline, ''):
-        line = line.replace('\r', '').replace('\n', '')
-        log.info(line)
-        sys.stdout.flush()
-
-    os.unlink(target_file.name)
+    ctx = argparse.Namespace(
+        config=dict(targets=dict(targets)),
+        owner=owner,
+        name=None,
+    )
+    try:
+        unnuked = teuthology.nuke.nuke(
+            ctx, should_unlock=True, sync_clocks=False, reboot_all=True)
+    except Exception:
+        log.exception("Could not nuke %s", ', '.join(to_nuke))
+        unnuked = targets
+    return dict(
+        (target, 'failed' if target in unnuked else 'nuked')
+        for target in targets
+    )
+
+
+def report_outcomes(outcomes):
+    """
+    Log a table of what happened to each target
+    """
+    if not outcomes:
+        return
+    table = PrettyTable(['target', 'outcome'])
+    table.align = 'l'
+    for target in sorted(outcomes):
+        table.add_row([target, outcomes[target]])
+    log.info("Targets:\n%s", table)
@@ -0,0 +1,241 @@
+"""
+Fair allocation of machines among the jobs on this host waiting to lock
+them.
+
+Rather than every waiting job asking the lock server for free machines
+every few seconds and racing the others to lock them, jobs queue up per
+machine type in a directory (config.lock_queue_dir). Only the job at the
+head of its queue talks to the lock server; the others wait their turn by
+looking at the queue directory, which costs nothing.
+
+The queue is ordered by job priority (lower is more urgent, as with
+teuthology-schedule), and a request gains one priority point for every
+config.lock_queue_aging seconds it has waited, so that neither low
+priority jobs nor jobs needing many machines starve behind a stream of
+others.
+
+Whenever machines are unlocked on this host, the waiting jobs are woken up
+at once (see notify_freed()) instead of at their next poll of the lock
+server.
+
+If the queue directory is not configured, or a job is not meant to wait
+for machines, every job asks the lock server directly, as they used to.
+"""
+import contextlib
+import errno
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from teuthology.config import config
+
+log = logging.getLogger(__name__)
+
+# what teuthology-schedule gives jobs by default
+DEFAULT_PRIORITY = 1000
+
+FREED_FILE = '.freed'
+
+
+@contextlib.contextmanager
+def waiting(machine_type, job_id, count, priority=None, enabled=True):
+    """
+    A context manager to wait for machines in. It yields a Ticket; the job
+    keeps its place in the queue until the with block is left.
+
+    :param machine_type: The machine type(s) the job needs
+    :param job_id:       The job's id
+    :param count:        How many machines the job needs
+    :param priority:     The job's priority. Defaults to DEFAULT_PRIORITY.
+    :param enabled:      If False, or there is no config.lock_queue_dir,
+                         the job doesn't queue.
+    """
+    queue = None
+    if enabled and config.lock_queue_dir:
+        queue = AllocationQueue(config.lock_queue_dir, machine_type)
+        try:
+            queue.enqueue(job_id, count, priority)
+        except (IOError, OSError):
+            log.exception("Could not queue for %s machines in %s",
+                          machine_type, queue.path)
+            queue = None
+    try:
+        yield Ticket(queue, job_id)
+    finally:
+        if queue is not None:
+            queue.dequeue(job_id)
+
+
+def notify_freed():
+    """
+    Wake up the jobs on this host that are waiting for machines
+    """
+    if not config.lock_queue_dir:
+        return
+    path = os.path.join(config.lock_queue_dir, FREED_FILE)
+    try:
+        with open(path, 'a'):
+            os.utime(path, None)
+    except (IOError, OSError) as e:
+        log.debug("Could not notify waiting jobs via %s: %s", path, e)
+
+
+def _freed_time(root):
+    try:
+        return os.path.getmtime(os.path.join(root, FREED_FILE))
+    except OSError:
+        return 0
+
+
+class Ticket(object):
+    """
+    A job's place in an AllocationQueue, or a stand-in for one if the job
+    isn't queueing
+    """
+    # how often to look at the queue while waiting
+    poll_interval = 1
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def wait_turn(self):
+        """
+        Return once this job is at the head of its queue
+        """
+        if self.queue is None:
+            return
+        reported = False
+        while True:
+            head = self.queue.head()
+            if head is None or head['job_id'] == str(self.job_id):
+                return
+            if not reported:
+                log.info("Waiting for job %s, ahead in the queue for %s "
+                         "machines, to lock its %d", head['job_id'],
+                         self.queue.machine_type, head['count'])
+                reported = True
+            time.sleep(self.poll_interval)
+
+    def sleep(self, seconds):
+        """
+        Sleep for seconds, or until machines are unlocked on this host
+        """
+        if self.queue is None:
+            time.sleep(seconds)
+            return
+        freed = _freed_time(self.queue.root)
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            time.sleep(min(self.poll_interval, deadline - time.time()))
+            if _freed_time(self.queue.root) != freed:
+                log.debug("Machines were freed; trying again")
+                return
+
+
+class AllocationQueue(object):
+    """
+    The jobs on this host waiting for machines of one type
+    """
+    def __init__(self, root, machine_type, aging=None):
+        """
+        :param root:         The queue directory
+        :param machine_type: The machine type(s) queued for
+        :param aging:        How many seconds of waiting are worth one
+                             priority point. Defaults to
+                             config.lock_queue_aging.
+        """
+        self.root = root
+        self.machine_type = machine_type
+        self.path = os.path.join(
+            root, re.sub('[^A-Za-z0-9_.-]', '_', machine_type))
+        self.aging = config.lock_queue_aging if aging is None else aging
+
+    def _request_path(self, job_id):
+        return os.path.join(self.path, '%s.json' % job_id)
+
+    def enqueue(self, job_id, count, priority=None):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        if priority is None:
+            priority = DEFAULT_PRIORITY
+        with tempfile.NamedTemporaryFile(
+                'w', dir=self.path, prefix='.tmp-', delete=False) as f:
+            json.dump(dict(job_id=str(job_id), count=count,
+                           priority=priority, time=time.time(),
+                           pid=os.getpid()), f)
+        os.rename(f.name, self._request_path(job_id))
+
+    def dequeue(self, job_id):
+        try:
+            os.remove(self._request_path(job_id))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                log.warning("Could not leave the queue for %s machines: %s",
+                            self.machine_type, e)
+
+    def requests(self):
+        """
+        Return the queued requests, removing those of jobs that have gone
+        away without leaving the queue
+        """
+        requests = list()
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return requests
+        for name in names:
+            if name.startswith('.') or not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, name)) as f:
+                    request = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if not self._is_alive(request['pid']):
+                log.warning("Removing the request of job %s, which is no "
+                            "longer running", request['job_id'])
+                self.dequeue(request['job_id'])
+                continue
+            requests.append(request)
+        return requests
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def effective_priority(self, request, now=None):
+        """
+        The request's priority, less one for every self.aging seconds it
+        has waited
+        """
+        if not self.aging:
+            return request['priority']
+        now = now or time.time()
+        return request['priority'] - (now - request['time']) / self.aging
+
+    def ordered(self, now=None):
+        """
+        Return the queued requests, the next to be served first
+        """
+        now = now or time.time()
+        return sorted(
+            self.requests(),
+            key=lambda request: (self.effective_priority(request, now),
+                                 request['time']),
+        )
+
+    def head(self):
+        """
+        Return the request to be served next, or None if there is none
+        """
+        ordered = self.ordered()
+        if ordered:
+            return ordered[0]
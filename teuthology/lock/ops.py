@@ -13,7 +13,7 @@ from teuthology.contextutil import safe_while
 from teuthology.task import console_log
 from teuthology.misc import canonicalize_hostname
 
-from teuthology.lock import util, query
+from teuthology.lock import broker, util, query
 
 log = logging.getLogger(__name__)
 
@@ -138,7 +138,8 @@ def lock_many(ctx, num, machine_type, user=None, description=None,
                 with console_log.task(
                         ctx, console_log_conf):
                     update_nodes(reimaged, True)
-                    with teuthology.parallel.parallel() as p:
+                    with teuthology.parallel.parallel(
+                            limit=config.parallel_limit) as p:
                         for machine in machines:
                             p.spawn(teuthology.provision.reimage, ctx,
                                     machine, machine_type)
@@ -194,6 +195,7 @@ def unlock_many(names, user):
     )
     if response.ok:
         log.debug("Unlocked: %s", ', '.join(names))
+        broker.notify_freed()
     else:
         log.error("Failed to unlock: %s", ', '.join(names))
     return response.ok
@@ -219,6 +221,7 @@ def unlock_one(ctx, name, user, description=None):
     success = response.ok
     if success:
         log.info('unlocked %s', name)
+        broker.notify_freed()
     else:
         try:
             reason = response.json().get('message')
@@ -288,12 +291,31 @@ def do_update_keys(machines, all_=False, _raise=True):
 
 
 def push_new_keys(keys_dict, reference):
+    """
+    Update the lock server's SSH host keys of the hosts in keys_dict whose
+    keys differ from those in reference, at most config.parallel_limit at a
+    time
+
+    :returns: 0 on success, 1 if any update failed
+    """
+    def push(hostname, pubkey):
+        log.info('New key found for %s. Updating...', hostname)
+        if not update_lock(hostname, ssh_pub_key=pubkey):
+            log.error('failed to update %s!', hostname)
+            return False
+        return True
+
+    new_keys = [
+        (hostname, pubkey) for hostname, pubkey in sorted(keys_dict.items())
+        if reference[hostname]['ssh_pub_key'] != pubkey
+    ]
+    log.info('Found new keys for %d of %d hosts', len(new_keys),
+             len(keys_dict))
     ret = 0
-    for hostname, pubkey in keys_dict.items():
-        log.info('Checking %s', hostname)
-        if reference[hostname]['ssh_pub_key'] != pubkey:
-            log.info('New key found. Updating...')
-            if not update_lock(hostname, ssh_pub_key=pubkey):
-                log.error('failed to update %s!', hostname)
+    with teuthology.parallel.parallel(limit=config.parallel_limit) as p:
+        for hostname, pubkey in new_keys:
+            p.spawn(push, hostname, pubkey)
+        for result in p:
+            if not result:
                 ret = 1
     return ret
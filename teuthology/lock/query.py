@@ -1,8 +1,11 @@
 import logging
 import os
+import time
 
+import gevent.pool
 import requests
 
+import teuthology.report
 from teuthology import misc
 from teuthology.config import config
 from teuthology.util.compat import urlencode
@@ -10,25 +13,77 @@ from teuthology.util.compat import urlencode
 
 log = logging.getLogger(__name__)
 
+# the statuses fetched by this process, keyed by node name; see get_status()
+_status_cache = dict()
+_session = None
 
-def get_status(name):
+
+def _get_session():
+    """
+    Return the requests.Session used to talk to the lock server, so that
+    connections to it are reused
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=config.parallel_limit)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def _cache_status(status):
+    _status_cache[status['name']] = (time.time(), status)
+
+
+def clear_status_cache():
+    _status_cache.clear()
+
+
+def get_status(name, cached=False):
+    """
+    Return the lock server's status of a node, or None if it could not be
+    found.
+
+    :param cached: If True, return the status fetched by this process (by
+                   get_status(), get_statuses() or list_locks()) if that was
+                   less than config.lock_status_cache_ttl seconds ago. Only
+                   for details that don't change while a node is locked,
+                   like its machine type; the lock itself may have changed.
+    """
     name = misc.canonicalize_hostname(name, user=None)
+    if cached and name in _status_cache:
+        fetched, status = _status_cache[name]
+        if time.time() - fetched < config.lock_status_cache_ttl:
+            return status
     uri = os.path.join(config.lock_server, 'nodes', name, '')
-    response = requests.get(uri)
+    response = _get_session().get(uri)
     success = response.ok
     if success:
-        return response.json()
+        status = response.json()
+        _cache_status(status)
+        return status
     log.warning(
         "Failed to query lock server for status of {name}".format(name=name))
     return None
 
 
-def get_statuses(machines):
+def get_statuses(machines, cached=False):
+    """
+    Return the statuses of machines, or of every node if machines is empty.
+
+    The machines are looked up concurrently, at most config.parallel_limit
+    at a time; see get_status() for the cached argument.
+    """
     if machines:
+        machines = [misc.canonicalize_hostname(machine)
+                    for machine in machines]
+        pool = gevent.pool.Pool(config.parallel_limit)
         statuses = []
-        for machine in machines:
-            machine = misc.canonicalize_hostname(machine)
-            status = get_status(machine)
+        for machine, status in zip(machines, pool.map(
+                lambda machine: get_status(machine, cached=cached),
+                machines)):
             if status:
                 statuses.append(status)
             else:
@@ -44,7 +99,7 @@ def is_vm(name=None, status=None):
         if name is None:
             raise ValueError("Must provide either name or status, or both")
         name = misc.canonicalize_hostname(name)
-        status = get_status(name)
+        status = get_status(name, cached=True)
     return status.get('is_vm', False)
 
 
@@ -60,18 +115,21 @@ def list_locks(keyed_by_name=False, **kwargs):
             kwargs['machine_type'] = kwargs['machine_type'].replace(',','|')
         uri += '?' + urlencode(kwargs)
     try:
-        response = requests.get(uri)
+        response = _get_session().get(uri)
     except requests.ConnectionError:
         success = False
         log.exception("Could not contact lock server: %s", config.lock_server)
     else:
         success = response.ok
     if success:
+        nodes = response.json()
+        for node in nodes:
+            _cache_status(node)
         if not keyed_by_name:
-            return response.json()
+            return nodes
         else:
             return {node['name']: node
-                    for node in response.json()}
+                    for node in nodes}
     return dict()
 
 
@@ -108,36 +166,64 @@ def find_stale_locks(owner=None):
         nodes = [node for node in nodes if node['locked_by'] == owner]
     nodes = filter(might_be_stale, nodes)
 
-    def node_job_is_active(node, cache):
-        """
-        Is this node's job active (e.g. running or waiting)?
-
-        :param node:  The node dict as returned from the lock server
-        :param cache: A set() used for caching results
-        :returns:     True or False
-        """
-        description = node['description']
-        if description in cache:
-            return True
-        (name, job_id) = description.split('/')[-2:]
-        url = os.path.join(config.results_server, 'runs', name, 'jobs', job_id,
-                           '')
-        resp = requests.get(url)
-        if not resp.ok:
-            return False
-        job_info = resp.json()
-        if job_info['status'] in ('running', 'waiting'):
-            cache.add(description)
-            return True
-        return False
+    # Group the nodes' jobs by run, so that a single query covers all the
+    # jobs of a run
+    job_ids = dict()
+    for node in nodes:
+        (name, job_id) = node['description'].split('/')[-2:]
+        job_ids.setdefault(name, set()).add(job_id)
+    active_jobs = find_active_jobs(job_ids)
 
     result = list()
     # Here we build the list of of nodes that are locked, for a job (as opposed
     # to being locked manually for random monkeying), where the job is not
     # running
-    active_jobs = set()
     for node in nodes:
-        if node_job_is_active(node, active_jobs):
+        (name, job_id) = node['description'].split('/')[-2:]
+        if (name, job_id) in active_jobs:
             continue
         result.append(node)
     return result
+
+
+def find_active_jobs(job_ids):
+    """
+    Find out which of the given jobs are active (e.g. running or waiting),
+    querying the results server for the runs concurrently, at most
+    config.parallel_limit at a time
+
+    :param job_ids: A dict mapping run names to sets of job ids
+    :returns:       A set of the (run name, job id) tuples of active jobs.
+                    Jobs of runs the results server doesn't know are not
+                    active.
+    """
+    reporter = teuthology.report.ResultsReporter()
+    timings = dict()
+
+    def get_statuses(run_name):
+        start = time.time()
+        try:
+            jobs = reporter.get_jobs(run_name, fields=['status'])
+        except requests.HTTPError as e:
+            log.debug("Could not get the jobs of %s: %s", run_name, e)
+            jobs = []
+        finally:
+            timings[run_name] = time.time() - start
+        return run_name, jobs
+
+    start = time.time()
+    active = set()
+    pool = gevent.pool.Pool(config.parallel_limit)
+    for run_name, jobs in pool.imap_unordered(get_statuses, job_ids):
+        for job in jobs:
+            job_id = str(job['job_id'])
+            if job_id in job_ids[run_name] and \
+                    job.get('status') in ('running', 'waiting'):
+                active.add((run_name, job_id))
+    if timings:
+        slowest = max(timings, key=timings.get)
+        log.info("Checked %d jobs of %d runs in %.1fs (slowest run: %s, "
+                 "%.1fs); %d are active",
+                 sum(len(ids) for ids in job_ids.values()), len(job_ids),
+                 time.time() - start, slowest, timings[slowest], len(active))
+    return active
@@ -0,0 +1,98 @@
+"""
+A stand-in for the lock server, for testing how jobs share machines
+"""
+import contextlib
+
+from mock import patch
+
+from teuthology import misc
+from teuthology.lock import broker
+
+
+class FakeLockServer(object):
+    """
+    Holds its nodes in memory, and answers the lock.query and lock.ops
+    calls that lock_machines makes
+    """
+    def __init__(self, machine_types):
+        """
+        :param machine_types: A dict mapping node names to machine types.
+                              The names are canonicalized, as the lock
+                              server's are.
+        """
+        self.nodes = dict(
+            (name, dict(name=name, machine_type=machine_type, up=True,
+                        locked=False, locked_by=None, is_vm=False,
+                        ssh_pub_key='ssh-rsa %s' % name))
+            for name, machine_type in (
+                (misc.canonicalize_hostname(name, user=None), machine_type)
+                for name, machine_type in machine_types.items()
+            )
+        )
+        # how often list_locks() was called
+        self.queries = 0
+
+    def _free(self, machine_type):
+        machine_types = machine_type.replace(',', '|').split('|')
+        return sorted(
+            name for name, node in self.nodes.items()
+            if node['up'] and not node['locked'] and
+            node['machine_type'] in machine_types
+        )
+
+    def list_locks(self, keyed_by_name=False, machine_type=None, up=None,
+                   locked=None, count=None):
+        self.queries += 1
+        nodes = [self.nodes[name] for name in sorted(self.nodes)]
+        if machine_type is not None:
+            machine_types = machine_type.replace(',', '|').split('|')
+            nodes = [node for node in nodes
+                     if node['machine_type'] in machine_types]
+        if up is not None:
+            nodes = [node for node in nodes if node['up'] == up]
+        if locked is not None:
+            nodes = [node for node in nodes if node['locked'] == locked]
+        if count is not None:
+            nodes = nodes[:count]
+        nodes = [dict(node) for node in nodes]
+        if keyed_by_name:
+            return dict((node['name'], node) for node in nodes)
+        return nodes
+
+    def lock(self, name, user):
+        name = misc.canonicalize_hostname(name, user=None)
+        self.nodes[name].update(locked=True, locked_by=user)
+
+    def lock_many(self, ctx, num, machine_type, user=None, description=None,
+                  os_type=None, os_version=None, arch=None):
+        """
+        Lock num free nodes of machine_type, or none if there are fewer
+        """
+        free = self._free(machine_type)
+        if len(free) < num:
+            return dict()
+        locked = dict()
+        for name in free[:num]:
+            self.lock(name, user)
+            locked[name] = self.nodes[name]['ssh_pub_key']
+        return locked
+
+    def unlock_one(self, ctx, name, user, description=None):
+        name = misc.canonicalize_hostname(name, user=None)
+        self.nodes[name].update(locked=False, locked_by=None)
+        broker.notify_freed()
+        return True
+
+    def get_status(self, name, cached=False):
+        return dict(self.nodes[misc.canonicalize_hostname(name, user=None)])
+
+    @contextlib.contextmanager
+    def patched(self):
+        """
+        A context manager in which lock_machines talks to this server
+        """
+        with patch('teuthology.lock.query.list_locks', self.list_locks), \
+                patch('teuthology.lock.query.get_status', self.get_status), \
+                patch('teuthology.lock.ops.lock_many', self.lock_many), \
+                patch('teuthology.lock.ops.unlock_one', self.unlock_one):
+            yield self
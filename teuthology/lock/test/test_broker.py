@@ -0,0 +1,154 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import gevent
+import gevent.event
+
+from mock import patch
+
+from teuthology import misc
+from teuthology.config import config, FakeNamespace
+from teuthology.lock import broker
+from teuthology.lock.test.fake_lock_server import FakeLockServer
+from teuthology.task.internal.lock_machines import lock_machines
+
+
+class TestAllocationQueue(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='test_broker-')
+        self.queue = broker.AllocationQueue(self.root, 'plana,mira', aging=60)
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_order(self):
+        now = time.time()
+        with patch('teuthology.lock.broker.time.time', return_value=now):
+            self.queue.enqueue(1, 2, priority=100)
+            self.queue.enqueue(2, 8, priority=50)
+        with patch('teuthology.lock.broker.time.time',
+                   return_value=now + 1):
+            self.queue.enqueue(3, 1, priority=50)
+            assert [r['job_id'] for r in self.queue.ordered()] == \
+                ['2', '3', '1']
+        self.queue.dequeue(2)
+        self.queue.dequeue(3)
+        # after an hour, job 1 has aged past more urgent newcomers
+        with patch('teuthology.lock.broker.time.time',
+                   return_value=now + 3600):
+            self.queue.enqueue(4, 1, priority=50)
+            assert self.queue.head()['job_id'] == '1'
+        self.queue.dequeue(1)
+        self.queue.dequeue(1)
+        assert self.queue.head()['job_id'] == '4'
+        assert os.path.basename(self.queue.path) == 'plana_mira'
+
+    def test_gone(self):
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        with patch('teuthology.lock.broker.os.getpid',
+                   return_value=proc.pid):
+            self.queue.enqueue(1, 1, priority=1)
+        self.queue.enqueue(2, 1, priority=100)
+        assert self.queue.head()['job_id'] == '2'
+        assert os.listdir(self.queue.path) == ['2.json']
+
+    def test_disabled(self):
+        with patch.object(config, 'lock_queue_dir', None):
+            with broker.waiting('plana', 1, 1) as ticket:
+                assert ticket.queue is None
+                ticket.wait_turn()
+
+
+class TestLockMachines(object):
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix='test_broker-')
+        self.patchers = [
+            patch.object(config, 'lock_queue_dir', self.root),
+            patch.object(config, 'reserve_machines', 0),
+            patch.object(broker.Ticket, 'poll_interval', 0.01),
+            patch('teuthology.report.try_push_job_info'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.server = FakeLockServer(
+            dict(('node%d' % i, 'plana') for i in range(3)))
+        # someone else has two of the nodes
+        self.server.lock('node0', 'someone')
+        self.server.lock('node1', 'someone')
+
+    def teardown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.root)
+
+    def make_ctx(self, job_id, priority):
+        ctx = FakeNamespace()
+        ctx.config = dict(job_id=job_id, priority=priority)
+        ctx.block = True
+        ctx.owner = 'scheduled_%s' % job_id
+        ctx.archive = None
+        ctx.summary = dict(success=True)
+        return ctx
+
+    def run_job(self, ctx, count, locked, release):
+        with lock_machines(ctx, [count, 'plana']):
+            locked.append((ctx.config['job_id'], sorted(
+                misc.decanonicalize_hostname(name)
+                for name in ctx.config['targets']
+            )))
+            release.wait()
+
+    def test_big_job_is_not_starved(self):
+        locked = []
+        big_done = gevent.event.Event()
+        small_done = gevent.event.Event()
+        with self.server.patched():
+            big = gevent.spawn(self.run_job, self.make_ctx('big', 100), 3,
+                               locked, big_done)
+            gevent.sleep(0.05)
+            small = gevent.spawn(self.run_job, self.make_ctx('small', 100),
+                                 1, locked, small_done)
+            gevent.sleep(0.2)
+            # node2 is free, but the job ahead needs all three
+            assert locked == []
+            queries = self.server.queries
+            gevent.sleep(0.2)
+            # only the job at the head of the queue asks the lock server,
+            # and it waits to be told that nodes were unlocked
+            assert self.server.queries == queries
+            self.server.unlock_one(None, 'node0', 'someone')
+            self.server.unlock_one(None, 'node1', 'someone')
+            gevent.sleep(0.2)
+            assert locked == [('big', ['node0', 'node1', 'node2'])]
+            big_done.set()
+            big.get(timeout=5)
+            gevent.sleep(0.2)
+            assert locked[1] == ('small', ['node0'])
+            small_done.set()
+            small.get(timeout=5)
+        assert os.listdir(os.path.join(self.root, 'plana')) == []
+
+    def test_vms_come_up_outside_the_queue(self):
+        queue_dir = os.path.join(self.root, 'plana')
+        queued = []
+
+        def ssh_keyscan(hostnames):
+            queued.append(os.listdir(queue_dir))
+            return dict((name, 'key') for name in hostnames)
+
+        self.server.unlock_one(None, 'node0', 'someone')
+        with self.server.patched(), \
+                patch('teuthology.lock.query.is_vm', return_value=True), \
+                patch('teuthology.misc.ssh_keyscan', ssh_keyscan), \
+                patch('teuthology.lock.ops.do_update_keys',
+                      return_value=(0, dict())), \
+                patch('teuthology.task.internal.lock_machines.time.sleep'):
+            with lock_machines(self.make_ctx('vm', 100), [1, 'plana']):
+                pass
+        # the job had left the queue by the time it waited for its VM
+        assert queued == [[]]
+
@@ -1,7 +1,110 @@
+import requests
+
+from mock import patch, Mock
+
+import teuthology.lock.ops
+import teuthology.lock.query
 import teuthology.lock.util
+from teuthology.config import config
+
 
 class TestLock(object):
 
     def test_locked_since_seconds(self):
         node = { "locked_since": "2013-02-07 19:33:55.000000" }
         assert teuthology.lock.util.locked_since_seconds(node) > 3600
+
+
+class TestQuery(object):
+    def setup(self):
+        teuthology.lock.query.clear_status_cache()
+        self.patcher = patch('teuthology.lock.query._get_session')
+        self.m_session = self.patcher.start().return_value
+
+        def get(uri):
+            name = uri.rstrip('/').split('/')[-1]
+            response = Mock(ok=not name.startswith('unknown'))
+            response.json.return_value = dict(name=name, machine_type='smithi')
+            return response
+
+        self.m_session.get.side_effect = get
+
+    def teardown(self):
+        self.patcher.stop()
+        teuthology.lock.query.clear_status_cache()
+
+    def test_get_statuses(self):
+        statuses = teuthology.lock.query.get_statuses(
+            ['smithi001', 'unknown002', 'smithi003'])
+        assert [s['name'] for s in statuses] == [
+            'smithi001.front.sepia.ceph.com',
+            'smithi003.front.sepia.ceph.com',
+        ]
+        assert self.m_session.get.call_count == 3
+
+    def test_cached(self):
+        teuthology.lock.query.get_statuses(['smithi001'])
+        assert teuthology.lock.query.get_status(
+            'smithi001', cached=True)['machine_type'] == 'smithi'
+        assert not teuthology.lock.query.is_vm('smithi001')
+        assert self.m_session.get.call_count == 1
+        # uncached lookups always go to the lock server
+        teuthology.lock.query.get_status('smithi001')
+        assert self.m_session.get.call_count == 2
+        with patch.object(config, 'lock_status_cache_ttl', 0):
+            teuthology.lock.query.get_status('smithi001', cached=True)
+        assert self.m_session.get.call_count == 3
+
+    @patch('teuthology.report.ResultsReporter')
+    @patch('teuthology.lock.query.list_locks')
+    def test_find_stale_locks(self, m_list_locks, m_reporter):
+        def node(name, description, locked_by='scheduled_x'):
+            return dict(name=name, description=description, locked=True,
+                        locked_by=locked_by)
+
+        m_list_locks.return_value = [
+            node('n1', '/archive/run1/1'),
+            node('n2', '/archive/run1/1'),
+            node('n3', '/archive/run1/2'),
+            node('n4', '/archive/run2/3'),
+            node('n5', '/archive/gone/4'),
+            node('n6', 'manually locked'),
+            node('n7', '/archive/run2/5', locked_by='someone'),
+        ]
+        jobs = dict(
+            run1=[dict(job_id=1, status='running'),
+                  dict(job_id=2, status='fail'),
+                  dict(job_id=9, status='running')],
+            run2=[dict(job_id='3', status='waiting'),
+                  dict(job_id='5', status='dead')],
+        )
+
+        def get_jobs(run_name, fields=None):
+            if run_name not in jobs:
+                raise requests.HTTPError('404')
+            return jobs[run_name]
+
+        m_reporter.return_value.get_jobs.side_effect = get_jobs
+        stale = teuthology.lock.query.find_stale_locks('scheduled_x')
+        assert [n['name'] for n in stale] == ['n3', 'n5']
+        # one query per run
+        assert m_reporter.return_value.get_jobs.call_count == 3
+
+
+class TestOps(object):
+    @patch('teuthology.lock.ops.update_lock')
+    def test_push_new_keys(self, m_update_lock):
+        m_update_lock.side_effect = lambda name, ssh_pub_key: name != 'n3'
+        reference = dict(
+            n1=dict(ssh_pub_key='old'),
+            n2=dict(ssh_pub_key='same'),
+            n3=dict(ssh_pub_key='old'),
+        )
+        keys = dict(n1='new', n2='same', n3='new')
+        assert teuthology.lock.ops.push_new_keys(keys, reference) == 1
+        assert sorted(call[0][0] for call in m_update_lock.call_args_list) \
+            == ['n1', 'n3']
+        m_update_lock.side_effect = None
+        m_update_lock.return_value = True
+        assert teuthology.lock.ops.push_new_keys(
+            dict(n1='new'), reference) == 0
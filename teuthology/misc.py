@@ -31,6 +31,11 @@ from teuthology.orchestra.opsys import DEFAULT_OS_VERSION
 
 from six import reraise
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 log = logging.getLogger(__name__)
 
 import datetime
@@ -755,16 +760,143 @@ def get_file(remote, path, sudo=False, dest_dir='/tmp'):
     return file_data
 
 
-def pull_directory(remote, remotedir, localdir):
+class RateLimiter(object):
+    """
+    Limits the rate at which bytes are consumed, across all the greenlets
+    sharing it.
+    """
+    def __init__(self, rate):
+        """
+        :param rate: The most bytes per second
+        """
+        self.rate = float(rate)
+        self._next = time.time()
+
+    def consume(self, nbytes):
+        """
+        Account for nbytes, sleeping if they are ahead of the rate
+        """
+        now = time.time()
+        self._next = max(now, self._next) + nbytes / self.rate
+        if self._next > now:
+            time.sleep(self._next - now)
+
+
+class _CountingReader(object):
+    """
+    Wraps a file-like object, counting the bytes read from it and
+    optionally throttling them with a RateLimiter
+    """
+    def __init__(self, fileobj, limiter=None):
+        self.fileobj = fileobj
+        self.limiter = limiter
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.count += len(data)
+        if self.limiter is not None and data:
+            self.limiter.consume(len(data))
+        return data
+
+
+def choose_archive_compression(remote, remotedir):
+    """
+    Decide how to compress a transfer of remotedir: not at all if most of
+    its content is already compressed, with zstd if it is available on both
+    ends, or else with gzip.
+
+    :returns: None, 'zstd' or 'gz'; see pull_directory()
+    """
+    script = (
+        "sudo find {path} -type f -printf '%s %f\\n' | "
+        "awk '{{ t += $1 }} /\\.(gz|xz|bz2|zst)$/ {{ c += $1 }} "
+        "END {{ print c + 0, t + 0 }}'; "
+        "command -v zstd > /dev/null && echo zstd || true"
+    ).format(path=run.quote([remotedir]))
+    try:
+        out = remote.sh(script).split()
+        compressed, total = int(out[0]), int(out[1])
+    except Exception:
+        log.exception("Could not inspect %s:%s", remote.shortname, remotedir)
+        return 'gz'
+    if compressed * 2 > total:
+        return None
+    if 'zstd' in out and zstandard is not None:
+        return 'zstd'
+    return 'gz'
+
+
+def pull_directory(remote, remotedir, localdir, compress='gz', limiter=None,
+                   done=None):
     """
     Copy a remote directory to a local directory.
+
+    :param compress: How to compress the transfer: 'gz', 'zstd' (which
+                     needs the zstandard module here, and zstd on the
+                     remote), or None
+    :param limiter:  A RateLimiter to throttle the transfer with
+    :param done:     A dict mapping the members (e.g. './ceph-osd.0.log')
+                     already transferred to their sizes. Those are skipped,
+                     and those transferred are added, so that a failed
+                     transfer can be resumed by calling this again with the
+                     same dict. The remote tar of a failed transfer is
+                     stopped before this returns.
+    :returns:        The number of (possibly compressed) bytes transferred
     """
     log.debug('Transferring archived files from %s:%s to %s',
               remote.shortname, remotedir, localdir)
     if not os.path.exists(localdir):
         os.mkdir(localdir)
-    r = remote.get_tar_stream(remotedir, sudo=True)
-    tar = tarfile.open(mode='r|gz', fileobj=r.stdout)
+    if done is None:
+        done = dict()
+    exclude_from = None
+    if done:
+        exclude_from = remote.mktemp()
+        write_file(remote, exclude_from,
+                   ''.join(name + '\n' for name in sorted(done)))
+    try:
+        r = remote.get_tar_stream(remotedir, sudo=True, compress=compress,
+                                  exclude_from=exclude_from)
+        stream = _CountingReader(r.stdout, limiter)
+        try:
+            if compress == 'zstd':
+                tar = tarfile.open(
+                    mode='r|',
+                    fileobj=zstandard.ZstdDecompressor().stream_reader(
+                        stream))
+            else:
+                tar = tarfile.open(
+                    mode='r|gz' if compress == 'gz' else 'r|',
+                    fileobj=stream)
+            _extract_tar_stream(tar, localdir, done)
+        except Exception:
+            _stop_tar_stream(remote, r)
+            raise
+    finally:
+        if exclude_from:
+            try:
+                remote.remove(exclude_from)
+            except Exception:
+                log.debug("Could not remove %s:%s", remote.shortname,
+                          exclude_from, exc_info=True)
+    return stream.count
+
+
+def _stop_tar_stream(remote, proc, timeout=60):
+    """
+    Stop a remote tar whose output is no longer read, so that it doesn't
+    race a new attempt. Closing its channel has it die of SIGPIPE at its
+    next write.
+    """
+    try:
+        proc.stdout.channel.close()
+        run.wait([proc], timeout=timeout)
+    except Exception as e:
+        log.debug("Stopped the tar on %s: %s", remote.shortname, e)
+
+
+def _extract_tar_stream(tar, localdir, done):
     while True:
         ti = tar.next()
         if ti is None:
@@ -778,6 +910,7 @@ def pull_directory(remote, remotedir, localdir):
             sub = safepath.munge(ti.name)
             safepath.makedirs(root=localdir, path=os.path.dirname(sub))
             tar.makefile(ti, targetpath=os.path.join(localdir, sub))
+            done[ti.name] = ti.size
         else:
             if ti.isdev():
                 type_ = 'device'
@@ -1107,18 +1240,17 @@ def ssh_keyscan(hostnames, _raise=True):
     hostnames = [canonicalize_hostname(name, user=None) for name in
                  hostnames]
     keys_dict = dict()
-    for hostname in hostnames:
-        with safe_while(
-            sleep=1,
-            tries=5 if _raise else 1,
-            _raise=_raise,
-            action="ssh_keyscan " + hostname,
-        ) as proceed:
-            while proceed():
-                key = _ssh_keyscan(hostname)
-                if key:
-                    keys_dict[hostname] = key
-                    break
+    missing = list(hostnames)
+    # every try scans all the hosts still missing at once
+    with safe_while(
+        sleep=1,
+        tries=5 if _raise else 1,
+        _raise=_raise,
+        action="ssh_keyscan " + ' '.join(hostnames),
+    ) as proceed:
+        while missing and proceed():
+            keys_dict.update(_ssh_keyscan_many(missing))
+            missing = [name for name in missing if name not in keys_dict]
     if len(keys_dict) != len(hostnames):
         missing = set(hostnames) - set(keys_dict.keys())
         msg = "Unable to scan these host keys: %s" % ' '.join(missing)
@@ -1136,20 +1268,37 @@ def _ssh_keyscan(hostname):
     :param hostname: The hostname
     :returns: The host key
     """
-    args = ['ssh-keyscan', '-T', '1', '-t', 'rsa', hostname]
+    return _ssh_keyscan_many([hostname]).get(hostname)
+
+
+def _ssh_keyscan_many(hostnames):
+    """
+    Fetch the SSH public keys of hosts, with a single ssh-keyscan, which
+    scans them all in parallel
+
+    :param hostnames: A list of hostnames
+    :returns: A dict keyed by the hostnames that answered, with their host
+              keys as values
+    """
+    args = ['ssh-keyscan', '-T', '1', '-t', 'rsa'] + list(hostnames)
     p = subprocess.Popen(
         args=args,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
-    p.wait()
-    for line in p.stderr.readlines():
+    stdout, stderr = p.communicate()
+    for line in stderr.splitlines():
         line = line.strip()
         if line and not line.startswith('#'):
             log.error(line)
-    for line in p.stdout.readlines():
-        host, key = line.strip().split(' ', 1)
-        return key
+    keys_dict = dict()
+    for line in stdout.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        host, key = line.split(' ', 1)
+        keys_dict.setdefault(host, key)
+    return keys_dict
 
 
 def ssh_keyscan_wait(hostname):
@@ -11,7 +11,7 @@ import teuthology
 from teuthology import provision
 from teuthology.lock.ops import unlock_one
 from teuthology.lock.query import is_vm, list_locks, \
-    find_stale_locks, get_status
+    find_stale_locks, get_status, get_statuses
 from teuthology.lock.util import locked_since_seconds
 from teuthology.nuke.actions import (
     check_console, clear_firewall, shutdown_daemons, remove_installed_packages,
@@ -29,7 +29,7 @@ from teuthology.misc import (
 from teuthology.openstack import OpenStack, OpenStackInstance, enforce_json_dictionary
 from teuthology.orchestra.remote import Remote
 from teuthology.parallel import parallel
-from teuthology.task.internal import check_lock, add_remotes, connect
+from teuthology.task.internal import check_lock, add_remotes
 
 log = logging.getLogger(__name__)
 
@@ -236,8 +236,13 @@ def main(args):
 
 
 def nuke(ctx, should_unlock, sync_clocks=True, reboot_all=True, noipmi=False):
+    """
+    Nuke ctx.config['targets'], at most config.parallel_limit at a time
+
+    :returns: A dict of the targets that could not be nuked
+    """
     if 'targets' not in ctx.config:
-        return
+        return {}
     total_unnuked = {}
     targets = dict(ctx.config['targets'])
     if ctx.name:
@@ -252,7 +257,10 @@ def nuke(ctx, should_unlock, sync_clocks=True, reboot_all=True, noipmi=False):
                         log.info(
                             "Not nuking %s because description doesn't match",
                             lock['name'])
-    with parallel() as p:
+    else:
+        # fetch the targets' statuses for nuke_helper() all at once
+        get_statuses(list(ctx.config['targets']))
+    with parallel(limit=config.parallel_limit) as p:
         for target, hostkey in ctx.config['targets'].items():
             p.spawn(
                 nuke_one,
@@ -273,6 +281,7 @@ def nuke(ctx, should_unlock, sync_clocks=True, reboot_all=True, noipmi=False):
                               yaml.safe_dump(
                                   total_unnuked,
                                   default_flow_style=False).splitlines()))
+    return total_unnuked
 
 
 def nuke_one(ctx, target, should_unlock, synch_clocks, reboot_all,
@@ -313,7 +322,7 @@ def nuke_helper(ctx, should_unlock):
         # does not check to ensure if the node is 'up'
         # we want to be able to nuke a downed node
         check_lock.check_lock(ctx, None, check_up=False)
-    status = get_status(host)
+    status = get_status(host, cached=True)
     if status['machine_type'] in provision.fog.get_types():
         remote = Remote(host)
         remote.console.power_off()
@@ -332,7 +341,8 @@ def nuke_helper(ctx, should_unlock):
             remote = Remote(host)
             remote.connect()
     add_remotes(ctx, None)
-    connect(ctx, None)
+    # ctx.archive is the nuked job's, so leave its connect_times.yaml alone
+    ctx.cluster.connect()
     clear_firewall(ctx)
     shutdown_daemons(ctx)
     kill_valgrind(ctx)
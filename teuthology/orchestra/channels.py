@@ -0,0 +1,128 @@
+"""
+Management of the SSH channels a Remote opens over its connection
+"""
+import contextlib
+import logging
+
+import gevent.lock
+
+from teuthology.config import config
+
+log = logging.getLogger(__name__)
+
+
+class ChannelManager(object):
+    """
+    Keeps track of the channels opened over one SSH connection.
+
+    A single SFTP session is opened on demand and reused until the connection
+    changes, instead of one per file transfer. At most max_exec command
+    channels may be being opened at a time, which is what sshd's MaxStartups
+    and MaxSessions throttle; the rest wait for one of those to open. Once
+    open, a channel doesn't count against the limit, however long its
+    command runs.
+    """
+    def __init__(self, max_exec=None):
+        """
+        :param max_exec: The most command channels to open at once. Defaults
+                         to config.ssh_max_exec_channels.
+        """
+        self.max_exec = max_exec or config.ssh_max_exec_channels
+        self._exec_slots = gevent.lock.BoundedSemaphore(self.max_exec)
+        self._sftp = None
+        self._sftp_transport = None
+        self.stats = dict(
+            # channels opened for commands, in total
+            exec_channels=0,
+            # waited-for commands currently running, and the most at once
+            exec_active=0,
+            exec_peak=0,
+            # commands that had to wait for other channels to open first
+            exec_waits=0,
+            # SFTP sessions opened, in total
+            sftp_channels=0,
+        )
+
+    def get_sftp(self, ssh):
+        """
+        Return an SFTP session over ssh, opening one if there is none yet or
+        the connection has changed since it was opened
+        """
+        transport = ssh.get_transport()
+        if self._sftp is None or self._sftp_transport is not transport or \
+                self._sftp.get_channel().closed:
+            self.close()
+            self._sftp = ssh.open_sftp()
+            self._sftp_transport = transport
+            self.stats['sftp_channels'] += 1
+        return self._sftp
+
+    def client(self, ssh):
+        """
+        Return ssh, wrapped so that opening a channel for a command waits for
+        one of the max_exec slots
+        """
+        return _ThrottledClient(ssh, self)
+
+    @contextlib.contextmanager
+    def opening_channel(self):
+        """
+        A context manager to open a command's channel in, holding one of the
+        max_exec slots
+        """
+        if self._exec_slots.locked():
+            self.stats['exec_waits'] += 1
+            log.debug("Waiting for one of %d SSH channels to open",
+                      self.max_exec)
+        with self._exec_slots:
+            yield
+
+    @contextlib.contextmanager
+    def exec_channel(self, wait=True):
+        """
+        A context manager to run a command in, counting it as active for its
+        duration if wait is True
+        """
+        self.stats['exec_channels'] += 1
+        if not wait:
+            yield
+            return
+        self.stats['exec_active'] += 1
+        self.stats['exec_peak'] = max(
+            self.stats['exec_peak'], self.stats['exec_active'])
+        try:
+            yield
+        finally:
+            self.stats['exec_active'] -= 1
+
+    def close(self):
+        """
+        Close the SFTP session, if there is one
+        """
+        if self._sftp is not None:
+            try:
+                self._sftp.close()
+            except Exception:
+                log.debug("Error closing SFTP session", exc_info=True)
+        self._sftp = None
+        self._sftp_transport = None
+
+
+class _ThrottledClient(object):
+    """
+    An SSH client whose exec_command() holds one of a ChannelManager's slots
+    while the channel opens
+    """
+    def __init__(self, ssh, manager):
+        self._ssh = ssh
+        self._manager = manager
+
+    def exec_command(self, *args, **kwargs):
+        with self._manager.opening_channel():
+            return self._ssh.exec_command(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._ssh, name)
+
+    def __repr__(self):
+        return repr(self._ssh)
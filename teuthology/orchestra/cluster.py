@@ -2,7 +2,39 @@
 Cluster definition
 part of context, Cluster is used to save connection information.
 """
+import hashlib
+import logging
+import sys
+import time
+
+import gevent.pool
+
+from six import reraise
+
 import teuthology.misc
+from teuthology.config import config
+
+log = logging.getLogger(__name__)
+
+
+def _shares_streams(kwargs):
+    """
+    Whether the keyword arguments to run() give it streams, which the nodes
+    of a cluster would have to share
+    """
+    return any(kwargs.get(name) is not None
+               for name in ('stdin', 'stdout', 'stderr'))
+
+
+def _file_checksum(path):
+    """
+    Return the SHA-256 checksum of a local file, as a hex string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 class Cluster(object):
@@ -50,48 +82,263 @@ class Cluster(object):
                 )
         self.remotes[remote] = list(roles)
 
+    def apply(self, func, workers=None):
+        """
+        Call func(remote) for every node in this cluster concurrently, at
+        most `workers` at a time (default: all of them).
+
+        Returns a `ClusterResults` holding the return values in alphabetical
+        order of the nodes, and the exceptions raised for any that failed.
+        Exceptions are not raised; see `ClusterResults.raise_first`.
+        """
+        remotes = sorted(self.remotes.keys(), key=lambda rem: rem.name)
+        results = ClusterResults(remotes)
+
+        def call(index, remote):
+            try:
+                results[index] = func(remote)
+            except Exception:
+                results.failures[remote] = sys.exc_info()
+
+        if workers:
+            group = gevent.pool.Pool(workers)
+        else:
+            group = gevent.pool.Group()
+        for index, remote in enumerate(remotes):
+            group.spawn(call, index, remote)
+        group.join()
+        return results
+
+    def connect(self, timeout=None, workers=None):
+        """
+        Connect to all the nodes in this cluster, at most `workers` (default:
+        config.connect_workers) at a time.
+
+        A node that is slow to answer doesn't hold up connecting to the
+        others. If any connection fails, the first failure is raised once
+        every attempt has finished.
+
+        Returns a dict mapping each node's name to the seconds it took to
+        connect to it.
+        """
+        timings = dict()
+
+        def connect_one(remote):
+            log.debug('connecting to %s', remote.name)
+            start = time.time()
+            try:
+                remote.connect(timeout=timeout)
+            finally:
+                timings[remote.name] = time.time() - start
+
+        results = self.apply(
+            connect_one, workers=workers or config.connect_workers)
+        for remote, exc_info in results.failures.items():
+            log.error('Failed to connect to %s: %s', remote.name, exc_info[1])
+        results.raise_first()
+        return timings
+
+    def gather_facts(self, workers=None):
+        """
+        Have every node in this cluster gather its facts (see
+        `Remote.gather_facts`) concurrently, at most `workers` (default:
+        config.connect_workers) at a time.
+
+        A node whose facts can't be gathered only gets a warning; its facts
+        are looked up one at a time when needed, as before.
+
+        Returns a dict mapping each node's name to its `RemoteFacts`.
+        """
+        results = self.apply(
+            lambda remote: remote.gather_facts(),
+            workers=workers or config.connect_workers)
+        for remote, exc_info in results.failures.items():
+            log.warning('Failed to gather facts of %s: %s', remote.name,
+                        exc_info[1])
+        return dict(
+            (remote.name, facts)
+            for remote, facts in results.by_remote().items()
+            if remote not in results.failures
+        )
+
     def run(self, **kwargs):
         """
         Run a command on all the nodes in this cluster.
 
         Goes through nodes in alphabetical order.
 
-        If you don't specify wait=False, this will be sequentially.
+        Unless you specify wait=False, the command runs on all the nodes
+        concurrently, and this returns once it has finished everywhere, even
+        where it failed on some of them. If it failed anywhere, the first
+        failure is then raised.
+
+        If stdout, stderr or stdin is given, the nodes would share it, so
+        the command runs on one node at a time instead, as it used to, and
+        the first failure is raised at once.
 
         Returns a list of `RemoteProcess`.
         """
         remotes = sorted(self.remotes.keys(), key=lambda rem: rem.name)
-        return [remote.run(**kwargs) for remote in remotes]
+        if not kwargs.get('wait', True) or _shares_streams(kwargs):
+            return [remote.run(**kwargs) for remote in remotes]
+        results = self.apply(lambda remote: remote.run(**kwargs))
+        results.raise_first()
+        return results
 
     def sh(self, **kwargs):
         """
-        Run a command on all the nodes in this cluster.
-
-        Goes through nodes in alphabetical order.
+        Run a command on all the nodes in this cluster concurrently, or one
+        node at a time if stdin is given (see `run`).
 
-        Returns a list of the command outputs correspondingly.
+        Returns a list of the command outputs, in alphabetical order of the
+        nodes. If the command failed anywhere, the first failure is raised
+        once it has finished everywhere.
         """
-        remotes = sorted(self.remotes.keys(), key=lambda rem: rem.name)
-        return [remote.sh(**kwargs) for remote in remotes]
+        if _shares_streams(kwargs):
+            remotes = sorted(self.remotes.keys(), key=lambda rem: rem.name)
+            return [remote.sh(**kwargs) for remote in remotes]
+        results = self.apply(lambda remote: remote.sh(**kwargs))
+        results.raise_first()
+        return results
 
     def write_file(self, file_name, content, sudo=False, perms=None, owner=None):
         """
-        Write text to a file on each node.
+        Write text to a file on each node, concurrently.
 
         :param file_name: file name
-        :param content: file content
+        :param content: file content, as a string or a file-like object
         :param sudo: use sudo
         :param perms: file permissions (passed to chmod) ONLY if sudo is True
         """
-        remotes = sorted(self.remotes.keys(), key=lambda rem: rem.name)
-        for remote in remotes:
+        if not sudo and (perms is not None or owner is not None):
+            raise ValueError("To specify perms or owner, sudo must be True")
+        if hasattr(content, 'read'):
+            # each node needs its own copy to read from
+            content = content.read()
+
+        def write(remote):
             if sudo:
                 teuthology.misc.sudo_write_file(remote, file_name, content, perms=perms, owner=owner)
             else:
-                if perms is not None or owner is not None:
-                    raise ValueError("To specify perms or owner, sudo must be True")
                 teuthology.misc.write_file(remote, file_name, content)
 
+        self.apply(write).raise_first()
+
+    def put_file(self, local_path, dest_path, sudo=False, perms=None,
+                 owner=None, relay=False, workers=None):
+        """
+        Copy a local file to the same path on each node, concurrently.
+
+        Nodes that already have an identical file (going by its SHA-256
+        checksum) only have its owner and perms set. With relay=True, meant
+        for large files, the file is uploaded to only one node; nodes that
+        have it then copy it on to the others (see `misc.copy_file`),
+        doubling the number of copies each round. A node that can't be
+        relayed to has the file uploaded to it directly instead.
+
+        :param local_path: the file to copy
+        :param dest_path: where to put it on each node
+        :param sudo: use sudo
+        :param perms: file permissions (passed to chmod) ONLY if sudo is True
+        :param owner: file owner (passed to chown) ONLY if sudo is True
+        :param relay: copy the file between nodes, rather than from here to
+                      each of them
+        :param workers: the most nodes to upload to at once (default: all)
+        :returns: a dict mapping each node's name to 'unchanged', 'uploaded'
+                  or 'relayed'
+        """
+        if not sudo and (perms is not None or owner is not None):
+            raise ValueError("To specify perms or owner, sudo must be True")
+        checksum = _file_checksum(local_path)
+        remote_checksums = self.apply(
+            lambda remote: remote.get_checksum(dest_path, sudo=sudo),
+            workers=workers,
+        ).by_remote()
+        methods = dict()
+        unchanged = list()
+        stale = list()
+        for remote in sorted(remote_checksums, key=lambda rem: rem.name):
+            if remote_checksums[remote] == checksum:
+                methods[remote.name] = 'unchanged'
+                unchanged.append(remote)
+            else:
+                stale.append(remote)
+
+        def set_attrs(remote):
+            if owner:
+                remote.run(args=['sudo', 'chown', owner, dest_path])
+            if perms:
+                remote.run(args=['sudo', 'chmod', perms, dest_path])
+
+        if unchanged and (owner or perms):
+            # the content is right, but the owner and mode may not be
+            self._subset(unchanged).apply(
+                set_attrs, workers=workers).raise_first()
+
+        def upload(remote):
+            remote.put_file(local_path, dest_path, sudo=sudo)
+            set_attrs(remote)
+
+        def relay_to(source, target):
+            temp_path = target.mktemp()
+            try:
+                teuthology.misc.copy_file(source, dest_path, target, temp_path)
+                if target.get_checksum(temp_path) != checksum:
+                    raise RuntimeError(
+                        "Checksum mismatch after copying {path} from "
+                        "{source}".format(path=dest_path, source=source.name))
+                # copied into place for the reasons Remote.put_file() is
+                target.chmod(temp_path, '0666')
+                args = ['cp', '--', temp_path, dest_path]
+                if sudo:
+                    args.insert(0, 'sudo')
+                target.run(args=args)
+            finally:
+                target.run(args=['rm', '-f', temp_path], check_status=False)
+            set_attrs(target)
+
+        direct = stale
+        if relay and len(stale) > 1:
+            seed, pending = stale[0], stale[1:]
+            upload(seed)
+            methods[seed.name] = 'uploaded'
+            holders = [seed]
+            direct = list()
+            while pending:
+                sources = dict(
+                    (target, source)
+                    for source, target in zip(holders, pending)
+                )
+                pending = pending[len(sources):]
+                results = self._subset(sources).apply(
+                    lambda target: relay_to(sources[target], target))
+                for target in sorted(sources, key=lambda rem: rem.name):
+                    if target in results.failures:
+                        log.warning(
+                            'Could not relay %s to %s: %s; uploading it',
+                            dest_path, target.name,
+                            results.failures[target][1])
+                        direct.append(target)
+                    else:
+                        methods[target.name] = 'relayed'
+                        holders.append(target)
+        if direct:
+            self._subset(direct).apply(upload, workers=workers).raise_first()
+            for remote in direct:
+                methods[remote.name] = 'uploaded'
+        log.info('Copied %s to %s on %d nodes (%d relayed, %d unchanged)',
+                 local_path, dest_path, len(methods),
+                 list(methods.values()).count('relayed'),
+                 list(methods.values()).count('unchanged'))
+        return methods
+
+    def _subset(self, remotes):
+        """
+        Return a cluster of the given nodes of this one, with their roles
+        """
+        return self.__class__(
+            remotes=[(remote, self.remotes[remote]) for remote in remotes])
+
     def only(self, *roles):
         """
         Return a cluster with only the remotes that have all of given roles.
@@ -144,3 +391,39 @@ class Cluster(object):
             if remote not in matches.remotes:
                 c.add(remote, has_roles)
         return c
+
+
+class ClusterResults(list):
+    """
+    The results of calling a function on every node of a `Cluster`, in
+    alphabetical order of the nodes.
+
+    The entries for nodes where the function raised an exception are None;
+    the exceptions are kept in `failures`, a dict mapping those nodes to
+    the `sys.exc_info()` of their exception.
+    """
+    def __init__(self, remotes):
+        super(ClusterResults, self).__init__([None] * len(remotes))
+        self.remotes = remotes
+        self.failures = dict()
+
+    def by_remote(self):
+        """
+        Return a dict mapping each node to its result
+        """
+        return dict(zip(self.remotes, self))
+
+    @property
+    def failed(self):
+        """
+        The nodes where the function raised an exception, in order
+        """
+        return [remote for remote in self.remotes if remote in self.failures]
+
+    def raise_first(self):
+        """
+        Raise the exception of the first node that failed, if any did
+        """
+        failed = self.failed
+        if failed:
+            reraise(*self.failures[failed[0]])
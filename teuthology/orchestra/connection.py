@@ -37,6 +37,30 @@ def create_key(keytype, key):
         raise ValueError('keytype must be ssh-rsa or ssh-dss (DSA)')
 
 
+_ssh_configs = dict()
+
+
+def get_ssh_config(path="~/.ssh/config"):
+    """
+    Return the parsed ssh config file at path, or None if there is none.
+
+    The result is kept until the file changes, so that connecting to many
+    hosts doesn't parse it for each of them.
+    """
+    path = os.path.expanduser(path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _ssh_configs.get(path)
+    if cached is None or cached[0] != mtime:
+        ssh_config = paramiko.SSHConfig()
+        with open(path) as f:
+            ssh_config.parse(f)
+        cached = _ssh_configs[path] = (mtime, ssh_config)
+    return cached[1]
+
+
 def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
             _SSHClient=None, _create_key=None, retry=True, key_filename=None):
     """
@@ -80,10 +104,8 @@ def connect(user_at_host, host_key=None, keep_alive=False, timeout=60,
         timeout=timeout
     )
 
-    ssh_config_path = os.path.expanduser("~/.ssh/config")
-    if os.path.exists(ssh_config_path):
-        ssh_config = paramiko.SSHConfig()
-        ssh_config.parse(open(ssh_config_path))
+    ssh_config = get_ssh_config()
+    if ssh_config is not None:
         opts = ssh_config.lookup(host)
         if not key_filename and 'identityfile' in opts:
             key_filename = opts['identityfile']
@@ -6,6 +6,7 @@ import teuthology.lock.util
 from teuthology.orchestra import run
 from teuthology.orchestra import connection
 from teuthology.orchestra import console
+from teuthology.orchestra.channels import ChannelManager
 from teuthology.orchestra.opsys import OS
 from teuthology import misc
 from teuthology.exceptions import CommandFailedError
@@ -13,15 +14,58 @@ from teuthology.misc import host_shortname
 import time
 import re
 import logging
+from collections import namedtuple
 from cStringIO import StringIO
 import os
 import pwd
 import tempfile
+import uuid
 import netaddr
 
 log = logging.getLogger(__name__)
 
 
+BatchResult = namedtuple('BatchResult', ['command', 'stdout', 'exitstatus'])
+
+
+class RemoteFacts(object):
+    """
+    What teuthology knows about a remote host, as found by
+    Remote.gather_facts(). Facts that could not be determined are None.
+    """
+    __slots__ = ['hostname', 'arch', 'os_type', 'os_version', 'os_codename',
+                 'package_type', 'system_type', 'init_system', 'interface',
+                 'cidr', 'machine_type']
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def from_dict(cls, facts):
+        return cls(**dict(
+            (name, value) for name, value in facts.items()
+            if name in cls.__slots__
+        ))
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, RemoteFacts) and \
+            self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{classname}({facts})'.format(
+            classname=self.__class__.__name__,
+            facts=', '.join('{0}={1!r}'.format(name, getattr(self, name))
+                            for name in self.__slots__),
+        )
+
+
 class Remote(object):
 
     """
@@ -51,6 +95,8 @@ class Remote(object):
         self.keep_alive = keep_alive
         self._console = console
         self.ssh = ssh
+        self._channels = None
+        self.facts = None
 
     def connect(self, timeout=None, create_key=None, context='connect'):
         args = dict(user_at_host=self.name, host_key=self._host_key,
@@ -66,6 +112,8 @@ class Remote(object):
         if timeout:
             args['timeout'] = timeout
 
+        if getattr(self, '_channels', None) is not None:
+            self._channels.close()
         self.ssh = connection.connect(**args)
         return self.ssh
 
@@ -75,6 +123,7 @@ class Remote(object):
         for failure.
         """
         if self.ssh is not None:
+            self.channels.close()
             self.ssh.close()
         if not timeout:
             return self._reconnect(timeout=socket_timeout)
@@ -100,6 +149,15 @@ class Remote(object):
             log.debug(e)
             return False
 
+    @property
+    def channels(self):
+        """
+        The ChannelManager for this remote's SSH connection
+        """
+        if getattr(self, '_channels', None) is None:
+            self._channels = ChannelManager()
+        return self._channels
+
     @property
     def ip_address(self):
         return self.ssh.get_transport().getpeername()[0]
@@ -123,7 +181,12 @@ class Remote(object):
         return self._cidr
 
     def _set_iface_and_cidr(self):
-        ip_addr_show = self.sh('PATH=/sbin:/usr/sbin ip addr show')
+        ip_addr_show = getattr(self, '_ip_addr_show', None)
+        if ip_addr_show is None:
+            self._probe()
+            ip_addr_show = getattr(self, '_ip_addr_show', None)
+        if ip_addr_show is None:
+            ip_addr_show = self.sh('PATH=/sbin:/usr/sbin ip addr show')
         regexp = 'inet.? %s' % self.ip_address
         for line in ip_addr_show.split('\n'):
             line = line.strip()
@@ -136,6 +199,8 @@ class Remote(object):
 
     @property
     def hostname(self):
+        if not hasattr(self, '_hostname'):
+            self._probe()
         if not hasattr(self, '_hostname'):
             self._hostname = self.sh('hostname --fqdn').strip()
         return self._hostname
@@ -143,7 +208,8 @@ class Remote(object):
     @property
     def machine_type(self):
         if not getattr(self, '_machine_type', None):
-            remote_info = teuthology.lock.query.get_status(self.hostname)
+            remote_info = teuthology.lock.query.get_status(
+                self.hostname, cached=True)
             if not remote_info:
                 return None
             self._machine_type = remote_info.get("machine_type", None)
@@ -172,9 +238,49 @@ class Remote(object):
     @property
     def system_type(self):
         """
-        System type decorator
+        'deb' or 'rpm', or the name of the distro if it uses neither
+        """
+        if not getattr(self, '_system_type', None):
+            package_type = getattr(self.os, 'package_type', None)
+            if package_type in ('deb', 'rpm'):
+                self._system_type = package_type
+            else:
+                self._system_type = misc.get_system_type(self)
+        return self._system_type
+
+    def gather_facts(self):
+        """
+        Find out everything teuthology looks up about the remote, using as
+        few commands as possible, so that later lookups are answered from
+        memory.
+
+        :returns: A RemoteFacts object, which is also kept in self.facts
         """
-        return misc.get_system_type(self)
+        self._probe()
+        try:
+            interface, cidr = self.interface, self.cidr
+        except RuntimeError:
+            interface, cidr = None, None
+        try:
+            machine_type = self.machine_type
+        except Exception:
+            log.debug("Could not look up the machine type of %s", self.name,
+                      exc_info=True)
+            machine_type = None
+        self.facts = RemoteFacts(
+            hostname=self.hostname,
+            arch=self.arch,
+            os_type=self.os.name,
+            os_version=self.os.version,
+            os_codename=self.os.codename,
+            package_type=self.os.package_type,
+            system_type=self.system_type,
+            init_system=self.init_system,
+            interface=interface,
+            cidr=cidr,
+            machine_type=machine_type,
+        )
+        return self.facts
 
     def __str__(self):
         return self.name
@@ -195,7 +301,9 @@ class Remote(object):
            not self.ssh.get_transport() or \
            not self.ssh.get_transport().is_active():
             self.reconnect()
-        r = self._runner(client=self.ssh, name=self.shortname, **kwargs)
+        with self.channels.exec_channel(wait=kwargs.get('wait', True)):
+            r = self._runner(client=self.channels.client(self.ssh),
+                             name=self.shortname, **kwargs)
         r.remote = self
         return r
 
@@ -242,6 +350,96 @@ class Remote(object):
         proc=self.run(**kwargs)
         return proc.stdout.getvalue()
 
+    def run_batch(self, commands, check_status=True, **kwargs):
+        """
+        Run several short commands, one after the other, in a single exec.
+
+        Each command runs in its own subshell with no stdin; its stderr is
+        logged as usual.
+
+        Usage:
+            hostname, kernel = remote.run_batch(['hostname', 'uname -r'])
+            if hostname.exitstatus == 0:
+                print(hostname.stdout)
+
+        :param commands:     A list of commands, each a string or a list of
+                             arguments (see run())
+        :param check_status: Whether to raise CommandFailedError for the
+                             first command that failed
+        :returns:            A list of BatchResult tuples holding each
+                             command, its stdout and its exit status
+        """
+        marker = 'teuthology-batch-' + uuid.uuid4().hex
+        commands = list(commands)
+        script = '\n'.join(
+            "( {cmd} ) < /dev/null; printf '\\n{marker} %d\\n' $?".format(
+                cmd=run.quote(cmd) if isinstance(cmd, list) else cmd,
+                marker=marker,
+            )
+            for cmd in commands
+        )
+        output = self.sh(['sh', '-c', script], **kwargs)
+        results = []
+        separator = '\n' + marker + ' '
+        for cmd in commands:
+            stdout, found, output = output.partition(separator)
+            if not found:
+                raise RuntimeError(
+                    "Output of batched commands on {host} was cut short "
+                    "at: {cmd}".format(host=self.shortname, cmd=cmd))
+            status, _, output = output.partition('\n')
+            results.append(BatchResult(cmd, stdout, int(status)))
+        if check_status:
+            for result in results:
+                if result.exitstatus != 0:
+                    raise CommandFailedError(
+                        command=result.command,
+                        exitstatus=result.exitstatus,
+                        node=self.shortname,
+                    )
+        return results
+
+    def _probe(self):
+        """
+        Find out the remote's hostname, architecture, OS, init system and
+        network addresses with a single command, keeping whichever of them
+        are not known yet.
+
+        Failures are only logged; the properties using these fall back to
+        running their own commands. Either way, the remote is only probed
+        once.
+        """
+        if getattr(self, '_probed', False):
+            return
+        self._probed = True
+        try:
+            hostname, arch, os_release, lsb_release, systemctl, ip_addr = \
+                self.run_batch([
+                    'hostname --fqdn',
+                    'uname -m',
+                    'cat /etc/os-release',
+                    'test -e /etc/os-release || lsb_release -a',
+                    'which systemctl',
+                    'PATH=/sbin:/usr/sbin ip addr show',
+                ], check_status=False)
+        except Exception:
+            log.debug("Could not probe %s", self.name, exc_info=True)
+            return
+        if not hasattr(self, '_hostname') and hostname.exitstatus == 0:
+            self._hostname = hostname.stdout.strip()
+        if not hasattr(self, '_arch') and arch.exitstatus == 0:
+            self._arch = arch.stdout.strip()
+        if not hasattr(self, '_os'):
+            if os_release.exitstatus == 0:
+                self._os = OS.from_os_release(os_release.stdout.strip())
+            elif lsb_release.exitstatus == 0:
+                self._os = OS.from_lsb_release(lsb_release.stdout.strip())
+        if not hasattr(self, '_init_system'):
+            self._init_system = \
+                'systemd' if systemctl.exitstatus == 0 else None
+        if ip_addr.exitstatus == 0:
+            self._ip_addr_show = ip_addr.stdout
+
 
     def sh_file(self, script, label="script", sudo=False, **kwargs):
         """
@@ -304,7 +502,7 @@ class Remote(object):
         """
         Use the paramiko.SFTPClient to put a file. Returns the remote filename.
         """
-        sftp = self.ssh.open_sftp()
+        sftp = self.channels.get_sftp(self.ssh)
         sftp.put(local_path, remote_path)
         return
 
@@ -316,7 +514,7 @@ class Remote(object):
             self._sftp_get_size(remote_path)
         ).strip()
         log.debug("{}:{} is {}".format(self.shortname, remote_path, file_size))
-        sftp = self.ssh.open_sftp()
+        sftp = self.channels.get_sftp(self.ssh)
         sftp.get(remote_path, local_path)
         return local_path
 
@@ -325,7 +523,7 @@ class Remote(object):
         Use the paramiko.SFTPClient to open a file. Returns a
         paramiko.SFTPFile object.
         """
-        sftp = self.ssh.open_sftp()
+        sftp = self.channels.get_sftp(self.ssh)
         return sftp.open(remote_path)
 
     def _sftp_get_size(self, remote_path):
@@ -352,12 +550,37 @@ class Remote(object):
     def put_file(self, path, dest_path, sudo=False):
         """
         Copy a local filename to a remote file
+
+        :param sudo: Use sudo on the remote end to write a file that
+                     requires it. Defaults to False.
         """
-        if sudo:
-            raise NotImplementedError("sudo not supported")
+        if not sudo:
+            self._sftp_put_file(path, dest_path)
+            return
+        temp_path = self.mktemp()
+        try:
+            self._sftp_put_file(path, temp_path)
+            # Copy rather than move the file into place, so that as with
+            # misc.sudo_write_file, a new file is owned by root and has the
+            # usual mode, while an existing one keeps its owner and mode
+            self.chmod(temp_path, '0666')
+            self.run(args=['sudo', 'cp', '--', temp_path, dest_path])
+        finally:
+            self.run(args=['rm', '-f', temp_path], check_status=False)
 
-        self._sftp_put_file(path, dest_path)
-        return
+    def get_checksum(self, path, sudo=False):
+        """
+        Return the SHA-256 checksum of a remote file, as a hex string, or
+        None if it could not be read
+        """
+        args = ['sha256sum', '--', path]
+        if sudo:
+            args.insert(0, 'sudo')
+        proc = self.run(args=args, stdout=StringIO(), stderr=StringIO(),
+                        check_status=False)
+        if proc.exitstatus != 0:
+            return None
+        return proc.stdout.getvalue().split()[0]
 
     def get_file(self, path, sudo=False, dest_dir='/tmp'):
         """
@@ -421,26 +644,41 @@ class Remote(object):
         self._sftp_get_file(remote_temp_path, to_path)
         self.remove(remote_temp_path)
 
-    def get_tar_stream(self, path, sudo=False):
+    def get_tar_stream(self, path, sudo=False, compress='gz',
+                       exclude_from=None):
         """
         Tar-compress a remote directory and return the RemoteProcess
         for streaming
+
+        :param compress:     'gz', 'zstd', or None to not compress
+        :param exclude_from: The path of a remote file listing the members
+                             (e.g. './foo/bar.log') to leave out
         """
         args = []
         if sudo:
             args.append('sudo')
         args.extend([
             'tar',
-            'cz',
+            'cz' if compress == 'gz' else 'c',
             '-f', '-',
             '-C', path,
+            ])
+        if exclude_from:
+            args.extend(['--no-wildcards', '-X', exclude_from])
+        args.extend([
             '--',
             '.',
             ])
+        if compress == 'zstd':
+            args.extend([run.Raw('|'), 'zstd', '-q', '-T0', '-3'])
+        elif compress not in ('gz', None):
+            raise ValueError("Unknown compression: {0}".format(compress))
         return self.run(args=args, wait=False, stdout=run.PIPE)
 
     @property
     def os(self):
+        if not hasattr(self, '_os'):
+            self._probe()
         if not hasattr(self, '_os'):
             try:
                 os_release = self.sh('cat /etc/os-release').strip()
@@ -455,6 +693,8 @@ class Remote(object):
 
     @property
     def arch(self):
+        if not hasattr(self, '_arch'):
+            self._probe()
         if not hasattr(self, '_arch'):
             self._arch = self.sh('uname -m').strip()
         return self._arch
@@ -498,6 +738,8 @@ class Remote(object):
 
         :returns: 'systemd' or None
         """
+        if not hasattr(self, '_init_system'):
+            self._probe()
         if not hasattr(self, '_init_system'):
             self._init_system = None
             proc = self.run(
@@ -510,6 +752,8 @@ class Remote(object):
 
     def __del__(self):
         if self.ssh is not None:
+            if getattr(self, '_channels', None) is not None:
+                self._channels.close()
             self.ssh.close()
 
 
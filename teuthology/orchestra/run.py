@@ -6,17 +6,31 @@ from paramiko import ChannelFile
 
 import gevent
 import gevent.event
+import itertools
 import socket
 import pipes
 import logging
+import os
 import shutil
+import time
 
-from teuthology.contextutil import safe_while
+from teuthology.config import config
 from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
-                                   ConnectionLostError)
+                                   ConnectionLostError, WaitTimeout)
 
 log = logging.getLogger(__name__)
 
+# how much remote output is read at a time
+CHUNK_SIZE = 64 * 1024
+# longer lines of remote output are logged in pieces
+MAX_LINE_LENGTH = 1024 * 1024
+
+# see set_output_dir()
+_output_dir = None
+_output_files = dict()
+# numbers the commands whose output goes to the output files
+_output_ids = itertools.count(1)
+
 
 class RemoteProcess(object):
     """
@@ -28,7 +42,7 @@ class RemoteProcess(object):
         '_stdin_buf', '_stdout_buf', '_stderr_buf',
         'returncode', 'exitstatus', 'timeout',
         'greenlets',
-        '_wait', 'logger',
+        '_wait', 'logger', 'raw_output', 'output_id',
         # for orchestra.remote.Remote to place a backreference
         'remote',
         'label',
@@ -37,7 +51,8 @@ class RemoteProcess(object):
     deadlock_warning = "Using PIPE for %s without wait=False would deadlock"
 
     def __init__(self, client, args, check_status=True, hostname=None,
-                 label=None, timeout=None, wait=True, logger=None, cwd=None):
+                 label=None, timeout=None, wait=True, logger=None, cwd=None,
+                 raw_output=False):
         """
         Create the object. Does not initiate command execution.
 
@@ -56,6 +71,9 @@ class RemoteProcess(object):
         :param logger:       Alternative logger to use (optional)
         :param cwd:          Directory in which the command will be executed
                              (optional)
+        :param raw_output:   Whether to only write output that isn't captured
+                             to the host's output file (see set_output_dir()),
+                             rather than also logging it
         """
         self.client = client
         self.args = args
@@ -82,6 +100,8 @@ class RemoteProcess(object):
         self.returncode = self.exitstatus = None
         self._wait = wait
         self.logger = logger or log
+        self.raw_output = raw_output
+        self.output_id = None
 
     def execute(self):
         """
@@ -89,6 +109,18 @@ class RemoteProcess(object):
         """
         for line in self.command.split('\n'):
             log.getChild(self.hostname).info('%s> %s' % (self.label or '', line))
+        output_file = get_output_file(self.hostname)
+        if output_file is not None:
+            # The output of concurrent commands is interleaved in the file,
+            # so each line of it is marked with the command's number
+            self.output_id = next(_output_ids)
+            header = ''.join(
+                '[%d] $ %s\n' % (self.output_id, line)
+                for line in self.command.split('\n'))
+            if not isinstance(header, bytes):
+                header = header.encode('utf-8')
+            output_file.write(header)
+            output_file.flush()
 
         if hasattr(self, 'timeout'):
             (self._stdin_buf, self._stdout_buf, self._stderr_buf) = \
@@ -123,6 +155,9 @@ class RemoteProcess(object):
                     getattr(self, stream_name),
                     stream_log,
                     stream_obj,
+                    output_file=get_output_file(self.hostname),
+                    raw=self.raw_output,
+                    output_label='%s %s' % (self.output_id, stream_name),
                 )
             )
             setattr(self, stream_name, stream_obj)
@@ -256,29 +291,160 @@ def quote(args):
         return args
 
 
-def copy_to_log(f, logger, loglevel=logging.INFO, capture=None):
+def set_output_dir(path):
+    """
+    Also write the output of remote commands to <path>/<hostname>.log, as it
+    arrives. Commands that produce a lot of output then have only some of
+    it logged (see copy_to_log()), and may skip logging it altogether (see
+    run()'s raw_output).
+
+    Each command is numbered, and written to the file as "[<number>] $
+    <command>" when it starts; each line of its output is then marked with
+    "[<number> stdout]" or "[<number> stderr]".
+
+    :param path: The directory, or None to stop writing output files
+    """
+    global _output_dir
+    for output_file in _output_files.values():
+        output_file.close()
+    _output_files.clear()
+    _output_dir = path
+
+
+def get_output_file(hostname):
+    """
+    Return the file object to write the output of commands run on hostname
+    to, or None if set_output_dir() wasn't called
     """
-    Copy line by line from file in f to the log from logger
+    if _output_dir is None:
+        return None
+    if hostname not in _output_files:
+        if not os.path.isdir(_output_dir):
+            os.makedirs(_output_dir)
+        _output_files[hostname] = open(
+            os.path.join(_output_dir, '{0}.log'.format(hostname)), 'ab')
+    return _output_files[hostname]
+
+
+def _read_chunks(f):
+    """
+    Yield the data in f as it arrives, in chunks of up to CHUNK_SIZE bytes
+    """
+    if isinstance(f, ChannelFile):
+        # Bypass paramiko's buffering, which waits for a whole chunk
+        if f._rbuffer:
+            data, f._rbuffer = f._rbuffer, bytes()
+            yield data
+        read = f._read
+    else:
+        read = f.read
+    while True:
+        try:
+            data = read(CHUNK_SIZE)
+        except EOFError:
+            return
+        if not data:
+            return
+        yield data
+
+
+class _LineLimiter(object):
+    """
+    Allows at most max_lines lines to be logged a second, counting the rest
+    """
+    def __init__(self, max_lines):
+        self.max_lines = max_lines
+        self.second = None
+        self.lines = 0
+        self.suppressed = 0
+
+    def allow(self):
+        if not self.max_lines:
+            return True
+        second = int(time.time())
+        if second != self.second:
+            self.second = second
+            self.lines = 0
+        self.lines += 1
+        if self.lines > self.max_lines:
+            self.suppressed += 1
+            return False
+        return True
+
+
+def copy_to_log(f, logger, loglevel=logging.INFO, capture=None,
+                output_file=None, raw=False, max_lines=None,
+                output_label=None):
+    """
+    Copy the output in f to the log from logger, line by line. The output
+    is read in large chunks, and each is decoded just once.
 
     :param f: source stream object
     :param logger: the destination logger object
     :param loglevel: the level of logging data
     :param capture: an optional stream object for data copy
+    :param output_file: an optional file object to write all the output to,
+                        undecoded, a line at a time
+    :param raw: only write the output to output_file, rather than logging it
+    :param max_lines: when output_file is given, log at most this many lines
+                      a second; the rest are only written to output_file.
+                      Defaults to config.log_lines_per_second.
+    :param output_label: if given, each line written to output_file starts
+                         with "[<output_label>] "
     """
-    # Work-around for http://tracker.ceph.com/issues/8313
-    if isinstance(f, ChannelFile):
-        f._flags += ChannelFile.FLAG_BINARY
-
-    for line in f:
+    if output_file is None:
+        raw = False
+        max_lines = 0
+    elif max_lines is None:
+        max_lines = config.log_lines_per_second
+    limiter = _LineLimiter(max_lines)
+    written = 0
+    partial = bytes()
+    prefix = bytes()
+    where = None
+    if output_file is not None:
+        where = output_file.name
+        if output_label:
+            prefix = ('[%s] ' % output_label).encode('utf-8')
+            where = '%s [%s]' % (where, output_label)
+
+    def write_lines(data):
+        if output_file is not None:
+            # whole lines only, so that other commands' output can't end
+            # up in the middle of them
+            output_file.write(
+                prefix + data.replace(b'\n', b'\n' + prefix) + b'\n')
+            output_file.flush()
+        if raw:
+            return
+        for line in data.decode('utf-8', 'replace').split(u'\n'):
+            if limiter.allow():
+                logger.log(loglevel, line.rstrip())
+
+    for chunk in _read_chunks(f):
         if capture:
-            capture.write(line)
-        line = line.rstrip()
-        # Second part of work-around for http://tracker.ceph.com/issues/8313
-        try:
-            line = unicode(line, 'utf-8', 'replace').encode('utf-8')
-            logger.log(loglevel, line.decode('utf-8'))
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            logger.exception("Encountered unprintable line in command output")
+            capture.write(chunk)
+        if output_file is not None:
+            written += len(chunk)
+        data = partial + chunk
+        end = data.rfind(b'\n')
+        if end == -1 and len(data) < MAX_LINE_LENGTH:
+            partial = data
+            continue
+        if end == -1:
+            end = len(data)
+        # no UTF-8 character contains a newline byte, so this is safe to
+        # decode by itself
+        write_lines(data[:end])
+        partial = data[end + 1:]
+    if partial:
+        write_lines(partial)
+    if raw and written:
+        logger.log(loglevel, '[%d bytes of output written to %s]',
+                   written, where)
+    elif limiter.suppressed:
+        logger.log(loglevel, '[%d lines of output only written to %s]',
+                   limiter.suppressed, where)
 
 
 def copy_and_close(src, fdst):
@@ -292,15 +458,22 @@ def copy_and_close(src, fdst):
     fdst.close()
 
 
-def copy_file_to(src, logger, stream=None):
+def copy_file_to(src, logger, stream=None, output_file=None, raw=False,
+                 output_label=None):
     """
     Copy file
     :param src: file to be copied.
     :param logger: the logger object
     :param stream: an optional file-like object which will receive a copy of
                    src.
+    :param output_file: an optional file object to write all of src to; see
+                        copy_to_log()
+    :param raw: whether to only write src to output_file
+    :param output_label: marks the lines written to output_file; see
+                         copy_to_log()
     """
-    copy_to_log(src, logger, capture=stream)
+    copy_to_log(src, logger, capture=stream, output_file=output_file,
+                raw=raw, output_label=output_label)
 
 def spawn_asyncresult(fn, *args, **kwargs):
     """
@@ -374,7 +547,8 @@ def run(
     timeout=None,
     cwd=None,
     # omit_sudo is used by vstart_runner.py
-    omit_sudo=False
+    omit_sudo=False,
+    raw_output=False,
 ):
     """
     Run a command remotely.  If any of 'args' contains shell metacharacters
@@ -407,6 +581,10 @@ def run(
     :param timeout: timeout value for args to complete on remote channel of
                     paramiko
     :param cwd: Directory in which the command should be executed.
+    :param raw_output: Whether to write output that isn't captured only to
+                       the host's output file (see set_output_dir()), rather
+                       than also logging it. Useful for very chatty
+                       commands.
     """
     try:
         transport = client.get_transport()
@@ -424,7 +602,7 @@ def run(
         log.info("Running command with timeout %d", timeout)
     r = RemoteProcess(client, args, check_status=check_status, hostname=name,
                       label=label, timeout=timeout, wait=wait, logger=logger,
-                      cwd=cwd)
+                      cwd=cwd, raw_output=raw_output)
     r.execute()
     r.setup_stdin(stdin)
     r.setup_output_stream(stderr, 'stderr')
@@ -434,24 +612,40 @@ def run(
     return r
 
 
-def wait(processes, timeout=None):
+def wait(processes, timeout=None, fail_fast=False):
     """
     Wait for all given processes to exit.
 
-    Raise if any one of them fails.
+    Raise if any one of them fails: once they have all exited, or as soon
+    as the first one fails if fail_fast is True.
+
+    Optionally, timeout after 'timeout' seconds, raising WaitTimeout, which
+    names the hosts whose processes are still running.
 
-    Optionally, timeout after 'timeout' seconds.
+    Rather than polling, this waits on each process's exit status.
     """
+    processes = list(processes)
     if timeout:
         log.info("waiting for %d", timeout)
-    if timeout and timeout > 0:
-        with safe_while(tries=(timeout / 6)) as check_time:
-            not_ready = list(processes)
-            while len(not_ready) > 0:
-                check_time()
-                for proc in list(not_ready):
-                    if proc.finished:
-                        not_ready.remove(proc)
+    if not timeout or timeout <= 0:
+        timeout = None
+    if timeout or fail_fast:
+        waiters = dict(
+            (gevent.spawn(proc._get_exitstatus), proc) for proc in processes)
+        try:
+            for waiter in gevent.iwait(list(waiters), timeout=timeout):
+                if fail_fast and not (waiter.successful() and
+                                      waiter.value == 0):
+                    # raises if the process failed and check_status is set
+                    waiters[waiter].wait()
+            running = [proc.hostname for waiter, proc in waiters.items()
+                       if not waiter.ready()]
+            if running:
+                raise WaitTimeout(timeout, running)
+        finally:
+            gevent.killall(
+                [waiter for waiter in waiters if not waiter.ready()],
+                block=False)
 
     for proc in processes:
         proc.wait()
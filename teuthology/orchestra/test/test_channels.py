@@ -0,0 +1,69 @@
+import gevent
+
+from mock import Mock
+
+from teuthology.orchestra.channels import ChannelManager
+
+
+class TestChannelManager(object):
+    def setup(self):
+        self.ssh = Mock()
+        self.ssh.open_sftp.side_effect = lambda: Mock(
+            **{'get_channel.return_value.closed': False})
+        self.channels = ChannelManager(max_exec=2)
+
+    def test_sftp_reused(self):
+        sftp = self.channels.get_sftp(self.ssh)
+        assert self.channels.get_sftp(self.ssh) is sftp
+        assert self.ssh.open_sftp.call_count == 1
+        assert self.channels.stats['sftp_channels'] == 1
+
+    def test_sftp_reopened(self):
+        sftp = self.channels.get_sftp(self.ssh)
+        sftp.get_channel.return_value.closed = True
+        new_sftp = self.channels.get_sftp(self.ssh)
+        assert new_sftp is not sftp
+        # a new connection gets its own session
+        self.ssh.get_transport.return_value = Mock()
+        assert self.channels.get_sftp(self.ssh) is not new_sftp
+        assert sftp.close.called
+        assert new_sftp.close.called
+        assert self.channels.stats['sftp_channels'] == 3
+
+    def test_exec_counted(self):
+        def run():
+            with self.channels.exec_channel():
+                gevent.sleep(0.01)
+
+        greenlets = [gevent.spawn(run) for i in range(5)]
+        # a daemon isn't counted as active
+        with self.channels.exec_channel(wait=False):
+            gevent.joinall(greenlets)
+        stats = self.channels.stats
+        assert stats['exec_channels'] == 6
+        # long-running commands don't keep others from starting
+        assert stats['exec_peak'] == 5
+        assert stats['exec_active'] == 0
+
+    def test_opening_limited(self):
+        opening = []
+        peak = []
+
+        def exec_command(command):
+            opening.append(command)
+            peak.append(len(opening))
+            gevent.sleep(0.01)
+            opening.remove(command)
+            return command
+
+        self.ssh.exec_command.side_effect = exec_command
+        client = self.channels.client(self.ssh)
+        greenlets = [gevent.spawn(client.exec_command, 'cmd%d' % i)
+                     for i in range(5)]
+        gevent.joinall(greenlets, raise_error=True)
+        assert [g.value for g in greenlets] == \
+            ['cmd%d' % i for i in range(5)]
+        assert max(peak) == 2
+        assert self.channels.stats['exec_waits'] == 3
+        # everything else goes straight to the SSH client
+        assert client.get_transport() is self.ssh.get_transport()
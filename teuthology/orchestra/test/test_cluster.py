@@ -1,7 +1,11 @@
 import fudge
+import hashlib
+import gevent
 import pytest
+import tempfile
 
-from mock import patch, Mock
+from mock import call, patch, Mock
+from six import StringIO
 
 from teuthology.orchestra import cluster, remote
 
@@ -209,6 +213,78 @@ class TestCluster(object):
         assert c_foo.remotes == {r2: ['bar'], r3: ['foo']}
 
 
+class TestApply(object):
+    """ Tests for cluster.apply and the methods built on it """
+    def setup(self):
+        self.remotes = [Mock(name='r%d' % i) for i in range(3)]
+        for i, r in enumerate(self.remotes):
+            r.name = 'r%d' % i
+        self.c = cluster.Cluster(
+            remotes=[(r, ['role%d' % i]) for i, r in enumerate(self.remotes)],
+        )
+
+    def test_concurrent(self):
+        running = []
+        peak = []
+
+        def func(remote):
+            running.append(remote)
+            peak.append(len(running))
+            gevent.sleep(0.01)
+            running.remove(remote)
+            return remote.name
+
+        results = self.c.apply(func)
+        assert results == ['r0', 'r1', 'r2']
+        assert max(peak) == 3
+        assert not results.failures
+        results.raise_first()
+        assert self.c.apply(func, workers=1) == ['r0', 'r1', 'r2']
+        assert max(peak[3:]) == 1
+
+    def test_failures(self):
+        def func(remote):
+            if remote.name != 'r0':
+                raise RuntimeError(remote.name)
+            return 'ok'
+
+        results = self.c.apply(func)
+        assert results == ['ok', None, None]
+        assert results.failed == self.remotes[1:]
+        assert results.by_remote()[self.remotes[0]] == 'ok'
+        with pytest.raises(RuntimeError) as excinfo:
+            results.raise_first()
+        assert str(excinfo.value) == 'r1'
+
+    def test_run_waits_for_all(self):
+        self.remotes[0].run.side_effect = RuntimeError('failed')
+        with pytest.raises(RuntimeError):
+            self.c.run(args=['test'])
+        for r in self.remotes:
+            r.run.assert_called_once_with(args=['test'])
+
+    def test_run_shared_stdout(self):
+        # with one stdout for all the nodes, they run one after the other
+        stdout = StringIO()
+        self.remotes[1].run.side_effect = RuntimeError('failed')
+        with pytest.raises(RuntimeError):
+            self.c.run(args=['test'], stdout=stdout)
+        self.remotes[0].run.assert_called_once_with(
+            args=['test'], stdout=stdout)
+        assert not self.remotes[2].run.called
+
+    def test_sh(self):
+        for r in self.remotes:
+            r.sh.return_value = r.name + '\n'
+        assert self.c.sh(script='hostname') == ['r0\n', 'r1\n', 'r2\n']
+
+    @patch("teuthology.misc.write_file")
+    def test_write_file_object(self, m_write_file):
+        self.c.write_file("filename", StringIO("content"))
+        for r in self.remotes:
+            m_write_file.assert_any_call(r, "filename", "content")
+
+
 class TestWriteFile(object):
     """ Tests for cluster.write_file """
     def setup(self):
@@ -238,3 +314,119 @@ class TestWriteFile(object):
     def test_with_sudo(self, m_sudo_write_file):
         self.c.write_file("filename", "content", sudo=True)
         m_sudo_write_file.assert_called_with(self.r1, "filename", "content", owner=None, perms=None)
+
+
+class TestConnect(object):
+    """ Tests for cluster.connect """
+    def setup(self):
+        self.remotes = [Mock(name='r%d' % i) for i in range(5)]
+        for i, r in enumerate(self.remotes):
+            r.name = 'r%d' % i
+        self.c = cluster.Cluster(
+            remotes=[(r, ['role%d' % i]) for i, r in enumerate(self.remotes)],
+        )
+
+    def test_connect(self):
+        connecting = []
+        peak = []
+
+        def connect(timeout=None):
+            connecting.append(True)
+            peak.append(len(connecting))
+            gevent.sleep(0.01)
+            connecting.pop()
+
+        for r in self.remotes:
+            r.connect.side_effect = connect
+        timings = self.c.connect(timeout=5, workers=2)
+        assert sorted(timings) == ['r0', 'r1', 'r2', 'r3', 'r4']
+        assert max(peak) == 2
+        for r in self.remotes:
+            r.connect.assert_called_once_with(timeout=5)
+
+    def test_connect_failure(self):
+        self.remotes[1].connect.side_effect = RuntimeError('r1 is down')
+        with pytest.raises(RuntimeError):
+            self.c.connect()
+        # the other hosts are still attempted
+        for r in self.remotes:
+            assert r.connect.called
+
+    def test_gather_facts(self):
+        for r in self.remotes:
+            r.gather_facts.return_value = r.name + '-facts'
+        self.remotes[2].gather_facts.side_effect = RuntimeError('r2 is down')
+        facts = self.c.gather_facts(workers=2)
+        # a failure doesn't stop the others, nor is it raised
+        assert facts == dict(r0='r0-facts', r1='r1-facts', r3='r3-facts',
+                             r4='r4-facts')
+        for r in self.remotes:
+            r.gather_facts.assert_called_once_with()
+
+
+class TestPutFile(object):
+    """ Tests for cluster.put_file """
+    def setup(self):
+        self.local = tempfile.NamedTemporaryFile()
+        self.local.write(b'payload')
+        self.local.flush()
+        self.checksum = hashlib.sha256(b'payload').hexdigest()
+        self.remotes = [Mock(name='r%d' % i) for i in range(5)]
+        for i, r in enumerate(self.remotes):
+            r.name = 'r%d' % i
+            r.get_checksum.return_value = None
+            r.mktemp.return_value = '/tmp/tmp.%d' % i
+        # r0 already has the file
+        self.remotes[0].get_checksum.return_value = self.checksum
+        self.c = cluster.Cluster(
+            remotes=[(r, ['role%d' % i]) for i, r in enumerate(self.remotes)],
+        )
+
+    def teardown(self):
+        self.local.close()
+
+    def test_direct(self):
+        methods = self.c.put_file(self.local.name, '/etc/f', sudo=True,
+                                  owner='ceph', perms='0600')
+        assert methods == dict(r0='unchanged', r1='uploaded', r2='uploaded',
+                               r3='uploaded', r4='uploaded')
+        assert not self.remotes[0].put_file.called
+        for r in self.remotes[1:]:
+            r.put_file.assert_called_once_with(
+                self.local.name, '/etc/f', sudo=True)
+        # even where the file was already there, its owner and mode are set
+        for r in self.remotes:
+            r.run.assert_any_call(args=['sudo', 'chown', 'ceph', '/etc/f'])
+            r.run.assert_any_call(args=['sudo', 'chmod', '0600', '/etc/f'])
+
+    def test_perms_need_sudo(self):
+        with pytest.raises(ValueError):
+            self.c.put_file(self.local.name, '/etc/f', perms='0600')
+
+    @patch('teuthology.misc.copy_file')
+    def test_relay(self, m_copy_file):
+        copies = []
+
+        def copy_file(source, from_path, target, to_path):
+            copies.append((source.name, target.name))
+            if target.name == 'r4':
+                raise RuntimeError('no route to r4')
+            target.get_checksum.return_value = self.checksum
+
+        m_copy_file.side_effect = copy_file
+        methods = self.c.put_file(self.local.name, '/f', relay=True)
+        assert methods == dict(r0='unchanged', r1='uploaded', r2='relayed',
+                               r3='relayed', r4='uploaded')
+        # r1 seeds r2, then both pass it on
+        assert copies[0] == ('r1', 'r2')
+        assert sorted(copies[1:]) == [('r1', 'r3'), ('r2', 'r4')]
+        self.remotes[2].chmod.assert_called_once_with('/tmp/tmp.2', '0666')
+        assert self.remotes[2].run.call_args_list == [
+            call(args=['cp', '--', '/tmp/tmp.2', '/f']),
+            call(args=['rm', '-f', '/tmp/tmp.2'], check_status=False),
+        ]
+        # r4 got it directly once relaying to it failed
+        self.remotes[4].put_file.assert_called_once_with(
+            self.local.name, '/f', sudo=False)
+        self.remotes[4].run.assert_called_once_with(
+            args=['rm', '-f', '/tmp/tmp.4'], check_status=False)
@@ -1,4 +1,7 @@
 import fudge
+import os
+import shutil
+import tempfile
 
 from teuthology import config
 from teuthology.orchestra import connection
@@ -104,3 +107,21 @@ class TestConnection(object):
             _create_key=create_key,
             )
         assert got is ssh
+
+    def test_get_ssh_config(self):
+        temp_dir = tempfile.mkdtemp(prefix='test_connection-')
+        try:
+            path = os.path.join(temp_dir, 'config')
+            assert connection.get_ssh_config(path) is None
+            with open(path, 'w') as f:
+                f.write('Host foo\n  User bar\n')
+            ssh_config = connection.get_ssh_config(path)
+            assert ssh_config.lookup('foo')['user'] == 'bar'
+            assert connection.get_ssh_config(path) is ssh_config
+            with open(path, 'w') as f:
+                f.write('Host foo\n  User baz\n')
+            os.utime(path, (0, 0))
+            assert connection.get_ssh_config(path).lookup('foo')['user'] == \
+                'baz'
+        finally:
+            shutil.rmtree(temp_dir)
@@ -1,7 +1,11 @@
+import subprocess
+
 from mock import patch, Mock, MagicMock
+from pytest import raises
 
 from cStringIO import StringIO
 
+from teuthology.exceptions import CommandFailedError
 from teuthology.orchestra import remote
 from teuthology.orchestra import opsys
 from teuthology.orchestra.run import RemoteProcess
@@ -176,6 +180,149 @@ class TestRemote(object):
             rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
             assert rem._sftp_get_size('/fake/file') == 42
 
+    def test_sftp_session_reused(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        m_sftp = self.m_ssh.open_sftp.return_value
+        m_sftp.get_channel.return_value.closed = False
+        m_sftp.open.return_value.__enter__.return_value.stat.return_value.\
+            st_size = 42
+        rem._sftp_put_file('/local', '/remote')
+        rem._sftp_get_file('/remote', '/local')
+        m_sftp.put.assert_called_once_with('/local', '/remote')
+        m_sftp.get.assert_called_once_with('/remote', '/local')
+        assert self.m_ssh.open_sftp.call_count == 1
+
+    def test_put_file_sudo(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        with patch.object(rem, '_sftp_put_file') as m_put, \
+                patch.object(rem, 'mktemp', return_value='/tmp/tmp.x'), \
+                patch.object(rem, 'run') as m_run:
+            rem.put_file('/local', '/etc/remote', sudo=True)
+        m_put.assert_called_once_with('/local', '/tmp/tmp.x')
+        # copied, not moved, so that the file isn't owned by jdoe
+        assert [c[1]['args'] for c in m_run.call_args_list] == [
+            ['sudo', 'chmod', '0666', '/tmp/tmp.x'],
+            ['sudo', 'cp', '--', '/tmp/tmp.x', '/etc/remote'],
+            ['rm', '-f', '/tmp/tmp.x'],
+        ]
+
+    def test_get_checksum(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        with patch.object(rem, 'run') as m_run:
+            m_run.return_value.exitstatus = 0
+            m_run.return_value.stdout.getvalue.return_value = 'abc123  /f\n'
+            assert rem.get_checksum('/f', sudo=True) == 'abc123'
+            assert m_run.call_args[1]['args'] == \
+                ['sudo', 'sha256sum', '--', '/f']
+            m_run.return_value.exitstatus = 1
+            assert rem.get_checksum('/f') is None
+
+    def local_runner(self, calls):
+        def runner(args, stdout, **kwargs):
+            calls.append(args)
+            proc = Mock(stdout=stdout)
+            stdout.write(subprocess.check_output(args))
+            return proc
+        return runner
+
+    def test_run_batch(self):
+        calls = []
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        rem._runner = self.local_runner(calls)
+        results = rem.run_batch(
+            ['echo foo', ['printf', 'a b'], 'exit 3', 'cat'],
+            check_status=False)
+        assert len(calls) == 1
+        assert results == [
+            remote.BatchResult('echo foo', 'foo\n', 0),
+            remote.BatchResult(['printf', 'a b'], 'a b', 0),
+            remote.BatchResult('exit 3', '', 3),
+            remote.BatchResult('cat', '', 0),
+        ]
+        with raises(CommandFailedError):
+            rem.run_batch(['true', 'false'])
+
+    def test_probe(self):
+        calls = []
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        rem._runner = self.local_runner(calls)
+        with patch.object(remote.Remote, 'run_batch') as m_run_batch, \
+                patch.object(remote.Remote, 'ip_address', '10.0.0.2'):
+            m_run_batch.return_value = [
+                remote.BatchResult('hostname', 'host.example.com\n', 0),
+                remote.BatchResult('uname', 'x86_64\n', 0),
+                remote.BatchResult('cat', 'ID=ubuntu\nVERSION_ID="16.04"\n', 0),
+                remote.BatchResult('lsb_release', '', 0),
+                remote.BatchResult('which', '/bin/systemctl\n', 0),
+                remote.BatchResult('ip', '    inet 10.0.0.2/24 brd x eth1\n', 0),
+            ]
+            assert rem.arch == 'x86_64'
+            assert rem.init_system == 'systemd'
+            assert rem.os.name == 'ubuntu'
+            assert rem.os.version == '16.04'
+            assert rem.interface == 'eth1'
+            assert rem.cidr == '10.0.0.0/24'
+            # the hostname was given by the name, so it is kept
+            assert rem.hostname == 'xyzzy.example.com'
+            assert m_run_batch.call_count == 1
+        assert calls == []
+
+    def test_probe_failed(self):
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        with patch.object(remote.Remote, 'run_batch') as m_run_batch, \
+                patch.object(remote.Remote, 'sh') as m_sh:
+            m_run_batch.side_effect = RuntimeError('connection lost')
+            m_sh.side_effect = ['x86_64\n', 'ID=ubuntu\nVERSION_ID="16.04"\n']
+            assert rem.arch == 'x86_64'
+            assert rem.os.name == 'ubuntu'
+            # each property falls back to its own command, without trying
+            # the probe again
+            assert m_run_batch.call_count == 1
+            assert m_sh.call_count == 2
+
+    def test_gather_facts(self):
+        calls = []
+        rem = remote.Remote(name='jdoe@xyzzy.example.com', ssh=self.m_ssh)
+        rem._runner = self.local_runner(calls)
+        with patch.object(remote.Remote, 'run_batch') as m_run_batch, \
+                patch.object(remote.Remote, 'ip_address', '10.0.0.3'), \
+                patch('teuthology.lock.query.get_status') as m_get_status, \
+                patch('teuthology.misc.get_system_type') as m_system_type:
+            m_run_batch.return_value = [
+                remote.BatchResult('hostname', 'host.example.com\n', 0),
+                remote.BatchResult('uname', 'aarch64\n', 0),
+                remote.BatchResult('cat', 'ID=centos\nVERSION_ID="7"\n', 0),
+                remote.BatchResult('lsb_release', '', 0),
+                remote.BatchResult('which', '', 1),
+                remote.BatchResult('ip', '    inet 10.0.0.2/24 brd x eth1\n', 0),
+            ]
+            m_get_status.return_value = dict(machine_type='smithi')
+            facts = rem.gather_facts()
+            # later lookups are answered from memory
+            assert rem.system_type == 'rpm'
+            assert rem.machine_type == 'smithi'
+            assert rem.facts is facts
+            assert m_run_batch.call_count == 1
+            assert m_get_status.call_count == 1
+            assert not m_system_type.called
+        assert facts.to_dict() == dict(
+            hostname='xyzzy.example.com',
+            arch='aarch64',
+            os_type='centos',
+            os_version='7',
+            os_codename='core',
+            package_type='rpm',
+            system_type='rpm',
+            init_system=None,
+            # the SSH connection's address isn't on any interface
+            interface=None,
+            cidr=None,
+            machine_type='smithi',
+        )
+        assert remote.RemoteFacts.from_dict(
+            dict(facts.to_dict(), unknown='x')) == facts
+        assert calls == []
+
     def test_format_size(self):
         assert remote.Remote._format_size(1023).strip() == '1023B'
         assert remote.Remote._format_size(1024).strip() == '1KB'
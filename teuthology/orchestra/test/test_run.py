@@ -1,14 +1,20 @@
 from StringIO import StringIO
 
+import os
+import shutil
+import tempfile
+import time
+
+import gevent
 import paramiko
 import socket
 
-from mock import MagicMock, patch
+from mock import MagicMock, Mock, patch
 from pytest import raises
 
 from teuthology.orchestra import run
 from teuthology.exceptions import (CommandCrashedError, CommandFailedError,
-                                   ConnectionLostError)
+                                   ConnectionLostError, WaitTimeout)
 
 
 def set_buffer_contents(buf, contents):
@@ -109,6 +115,28 @@ class TestRun(object):
         assert proc.stdout.read() == output
         assert proc.stdout.getvalue() == output
 
+    def test_output_file(self):
+        set_buffer_contents(self.m_stdout_buf, 'foo\nbar')
+        self.m_stdout_buf.channel.recv_exit_status.return_value = 0
+        temp_dir = tempfile.mkdtemp(prefix='test_run-')
+        try:
+            run.set_output_dir(temp_dir)
+            proc = run.run(
+                client=self.m_ssh,
+                args=['foo', 'bar baz'],
+                name='host',
+                raw_output=True,
+            )
+            run.set_output_dir(None)
+            with open(os.path.join(temp_dir, 'host.log')) as f:
+                assert f.read() == (
+                    "[{0}] $ foo 'bar baz'\n"
+                    "[{0} stdout] foo\n"
+                    "[{0} stdout] bar\n".format(proc.output_id))
+        finally:
+            run.set_output_dir(None)
+            shutil.rmtree(temp_dir)
+
     def test_capture_stderr_newline(self):
         output = 'foo\nbar\n'
         set_buffer_contents(self.m_stderr_buf, output)
@@ -258,6 +286,128 @@ class TestRun(object):
         assert proc.exitstatus == 0
 
 
+class TestCopyToLog(object):
+    def setup(self):
+        self.logger = MagicMock()
+
+    def logged(self):
+        return [c[0][1] for c in self.logger.log.call_args_list]
+
+    def test_lines(self):
+        src = StringIO('foo\nb\xc3\xa4r  \n\nbaz')
+        capture = StringIO()
+        with patch('teuthology.orchestra.run.CHUNK_SIZE', 5):
+            run.copy_to_log(src, self.logger, capture=capture)
+        assert self.logged() == [u'foo', u'b\xe4r', u'', u'baz']
+        assert capture.getvalue() == 'foo\nb\xc3\xa4r  \n\nbaz'
+
+    def test_max_lines(self):
+        src = StringIO(''.join('line %d\n' % i for i in range(10)))
+        output_file = StringIO()
+        output_file.name = 'host.log'
+        run.copy_to_log(src, self.logger, output_file=output_file,
+                        max_lines=3)
+        assert self.logged() == [
+            u'line 0', u'line 1', u'line 2',
+            '[%d lines of output only written to %s]']
+        assert self.logger.log.call_args[0][2:] == (7, 'host.log')
+        assert output_file.getvalue() == src.getvalue()
+
+    def test_raw(self):
+        src = StringIO('\xff' * 10)
+        output_file = StringIO()
+        output_file.name = 'host.log'
+        run.copy_to_log(src, self.logger, output_file=output_file, raw=True,
+                        output_label='3 stdout')
+        assert self.logged() == ['[%d bytes of output written to %s]']
+        assert self.logger.log.call_args[0][2:] == (
+            10, 'host.log [3 stdout]')
+        assert output_file.getvalue() == '[3 stdout] ' + '\xff' * 10 + '\n'
+
+    def test_output_label(self):
+        # the lines of two streams written to the same file as they arrive
+        # stay whole, and say where they came from
+        class SlowStringIO(StringIO):
+            def read(self, size=-1):
+                gevent.sleep(0.001)
+                return StringIO.read(self, size)
+
+        output_file = StringIO()
+        output_file.name = 'host.log'
+        with patch('teuthology.orchestra.run.CHUNK_SIZE', 4):
+            copiers = [
+                gevent.spawn(run.copy_to_log, SlowStringIO(text), self.logger,
+                             output_file=output_file, raw=True,
+                             output_label=label)
+                for text, label in (('one\ntwo\n', '1 stdout'),
+                                    ('three\nfour', '2 stderr'))
+            ]
+            gevent.joinall(copiers, raise_error=True)
+        assert sorted(output_file.getvalue().splitlines()) == [
+            '[1 stdout] one', '[1 stdout] two',
+            '[2 stderr] four', '[2 stderr] three',
+        ]
+
+    def test_output_dir(self):
+        temp_dir = tempfile.mkdtemp(prefix='test_run-')
+        try:
+            run.set_output_dir(os.path.join(temp_dir, 'output'))
+            output_file = run.get_output_file('host')
+            assert run.get_output_file('host') is output_file
+            assert output_file.name == os.path.join(
+                temp_dir, 'output', 'host.log')
+        finally:
+            run.set_output_dir(None)
+            shutil.rmtree(temp_dir)
+        assert output_file.closed
+        assert run.get_output_file('host') is None
+
+
+class TestWait(object):
+    def make_proc(self, hostname, seconds, status=0):
+        proc = Mock(hostname=hostname)
+
+        def get_exitstatus():
+            gevent.sleep(seconds)
+            return status
+
+        def wait():
+            proc.waited = True
+            if status != 0:
+                raise CommandFailedError('foo', status, node=hostname)
+            return status
+
+        proc._get_exitstatus.side_effect = get_exitstatus
+        proc.wait.side_effect = wait
+        proc.waited = False
+        return proc
+
+    def test_wait(self):
+        procs = [self.make_proc('host%d' % i, 0.01 * i) for i in range(3)]
+        run.wait(iter(procs), timeout=5)
+        assert all(proc.waited for proc in procs)
+
+    def test_timeout(self):
+        procs = [self.make_proc('host0', 0), self.make_proc('host1', 5),
+                 self.make_proc('host2', 5)]
+        start = time.time()
+        with raises(WaitTimeout) as exc:
+            run.wait(procs, timeout=0.05)
+        assert time.time() - start < 1
+        assert sorted(exc.value.hosts) == ['host1', 'host2']
+        assert str(exc.value) == \
+            "2 process(es) still running after 0.05s on: host1, host2"
+
+    def test_fail_fast(self):
+        procs = [self.make_proc('host0', 5), self.make_proc('host1', 0, 1)]
+        start = time.time()
+        with raises(CommandFailedError) as exc:
+            run.wait(procs, fail_fast=True)
+        assert time.time() - start < 1
+        assert exc.value.node == 'host1'
+        assert not procs[0].waited
+
+
 class TestQuote(object):
     def test_quote_simple(self):
         got = run.quote(['a b', ' c', 'd e '])
@@ -1,12 +1,16 @@
 import logging
 import sys
+import time
 
 import gevent
 import gevent.pool
 import gevent.queue
 
+import six
 from six import reraise
 
+from teuthology.exceptions import ParallelTaskTimeout
+
 log = logging.getLogger(__name__)
 
 
@@ -37,6 +41,22 @@ def resurrect_traceback(exc):
     reraise(*exc_info)
 
 
+def describe(func, args):
+    """
+    Return a short description of func being called with args, naming the
+    host or target it works on if one is recognizable
+    """
+    name = getattr(func, '__name__', repr(func))
+    for arg in args:
+        if hasattr(arg, 'shortname'):
+            return '{0}({1})'.format(name, arg.shortname)
+        elif isinstance(arg, six.string_types):
+            return '{0}({1})'.format(name, arg)
+        elif isinstance(arg, dict) and arg:
+            return '{0}({1})'.format(name, ', '.join(map(str, arg.keys())))
+    return name
+
+
 class parallel(object):
     """
     This class is a context manager for running functions in parallel.
@@ -47,7 +67,8 @@ class parallel(object):
             for foo in bar:
                 p.spawn(quux, foo, baz=True)
 
-    You can iterate over the results (which are in arbitrary order)::
+    You can iterate over the results (which are in arbitrary order, unless
+    ordered=True is given; then they are in the order they were spawned)::
 
         with parallel() as p:
             for foo in bar:
@@ -61,20 +82,57 @@ class parallel(object):
     At the end of the with block, the main thread waits until all
     spawned functions have completed, or, if one exited with an exception,
     kills the rest and raises the exception.
+
+    To avoid overwhelming a shared service, pass limit to run at most that
+    many functions at once; spawn() then blocks until one of them finishes.
+    Pass timeout to make each function raise ParallelTaskTimeout if it runs
+    for longer than that many seconds.
+
+    How long each function took is kept, in the order they finished, in
+    the latencies list as (description, seconds) tuples.
     """
 
-    def __init__(self):
-        self.group = gevent.pool.Group()
+    # tasks slower than this are logged when the with block ends
+    slow_task_seconds = 60
+
+    def __init__(self, limit=None, timeout=None, ordered=False):
+        if limit:
+            self.group = gevent.pool.Pool(limit)
+        else:
+            self.group = gevent.pool.Group()
         self.results = gevent.queue.Queue()
         self.count = 0
         self.any_spawned = False
         self.iteration_stopped = False
+        self.timeout = timeout
+        self.ordered = ordered
+        self.latencies = []
+        self._spawned = 0
+        self._next_index = 0
+        self._pending = {}
 
     def spawn(self, func, *args, **kwargs):
         self.count += 1
         self.any_spawned = True
-        greenlet = self.group.spawn(capture_traceback, func, *args, **kwargs)
-        greenlet.link(self._finish)
+        index = self._spawned
+        self._spawned += 1
+        greenlet = self.group.spawn(
+            self._run, describe(func, args), func, *args, **kwargs)
+        greenlet.link(lambda greenlet: self._finish(greenlet, index))
+
+    def _run(self, description, func, *args, **kwargs):
+        start = time.time()
+        try:
+            if not self.timeout:
+                return capture_traceback(func, *args, **kwargs)
+            exc = ParallelTaskTimeout(
+                "{0} timed out after {1}s".format(description, self.timeout))
+            with gevent.Timeout(self.timeout, exc):
+                return capture_traceback(func, *args, **kwargs)
+        finally:
+            latency = time.time() - start
+            log.debug('%s took %.1fs', description, latency)
+            self.latencies.append((description, latency))
 
     def __enter__(self):
         return self
@@ -87,32 +145,42 @@ class parallel(object):
         for result in self:
             log.debug('result is %s', repr(result))
 
+        if len(self.latencies) > 1:
+            description, latency = max(self.latencies, key=lambda l: l[1])
+            if latency > self.slow_task_seconds:
+                log.info('Slowest of %d parallel tasks was %s (%.1fs)',
+                         len(self.latencies), description, latency)
         return True
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if not self.any_spawned or self.iteration_stopped:
-            raise StopIteration()
-        result = self.results.get()
-
-        try:
-            resurrect_traceback(result)
-        except StopIteration:
-            self.iteration_stopped = True
-            raise
-
-        return result
+        while True:
+            if self.ordered and self._next_index in self._pending:
+                self._next_index += 1
+                return self._pending.pop(self._next_index - 1)
+            if not self.any_spawned or self.iteration_stopped or \
+                    (self.count <= 0 and self.results.empty()):
+                self.iteration_stopped = True
+                raise StopIteration()
+            index, result = self.results.get()
+
+            try:
+                resurrect_traceback(result)
+            except StopIteration:
+                self.iteration_stopped = True
+                raise
+
+            if not self.ordered:
+                return result
+            self._pending[index] = result
 
     next = __next__
 
-    def _finish(self, greenlet):
+    def _finish(self, greenlet, index):
+        self.count -= 1
         if greenlet.successful():
-            self.results.put(greenlet.value)
+            self.results.put((index, greenlet.value))
         else:
-            self.results.put(greenlet.exception)
-
-        self.count -= 1
-        if self.count <= 0:
-            self.results.put(StopIteration())
+            self.results.put((index, greenlet.exception))
@@ -10,6 +10,7 @@ from datetime import datetime
 import teuthology
 from teuthology.config import config
 from teuthology.job_status import get_status, set_status
+from teuthology.parallel import parallel
 
 report_exceptions = (requests.exceptions.RequestException, socket.error)
 
@@ -484,24 +485,63 @@ def try_push_job_info(job_config, extra_info=None):
         log.warning('No job_id found; not reporting results')
         return
 
-    run_name = job_config['name']
-    job_id = job_config['job_id']
-
-    if extra_info is not None:
-        job_info = extra_info.copy()
-        job_info.update(job_config)
-    else:
-        job_info = job_config
-
     try:
         log.debug("Pushing job info to %s", config.results_server)
-        push_job_info(run_name, job_id, job_info)
+        push_job_info(job_config['name'], job_config['job_id'],
+                      _job_info(job_config, extra_info))
         return
     except report_exceptions:
         log.exception("Could not report results to %s",
                       config.results_server)
 
 
+def try_push_jobs_info(job_configs, extra_info=None, batch_size=10):
+    """
+    Like try_push_job_info(), but for several jobs: they are pushed over a
+    single keep-alive session, batch_size of them concurrently. A job that
+    can't be reported is logged and doesn't prevent reporting the others.
+
+    :param job_configs: A list of job configs to push
+    :param extra_info:  Optional second dict to push with each of them
+    :param batch_size:  How many jobs to push at once
+    """
+    log = init_logging()
+
+    if not config.results_server:
+        log.warning('No results_server in config; not reporting results')
+        return
+
+    reporter = ResultsReporter()
+    if not reporter.base_uri:
+        return
+
+    def push(job_config):
+        if job_config.get('job_id') is None:
+            log.warning('No job_id found; not reporting results')
+            return
+        try:
+            reporter.report_job(job_config['name'], job_config['job_id'],
+                                _job_info(job_config, extra_info))
+        except report_exceptions:
+            log.exception("Could not report results for job %s to %s",
+                          job_config['job_id'], config.results_server)
+
+    log.debug("Pushing info for %d jobs to %s", len(job_configs),
+              config.results_server)
+    for i in range(0, len(job_configs), batch_size):
+        with parallel() as p:
+            for job_config in job_configs[i:i + batch_size]:
+                p.spawn(push, job_config)
+
+
+def _job_info(job_config, extra_info):
+    if extra_info is None:
+        return job_config
+    job_info = extra_info.copy()
+    job_info.update(job_config)
+    return job_info
+
+
 def try_delete_jobs(run_name, job_ids, delete_empty_run=True):
     """
     Using the same error checking and retry mechanism as try_push_job_info(),
@@ -9,6 +9,7 @@ from teuthology import report
 from teuthology.job_status import get_status
 from teuthology.misc import get_user, merge_configs
 from teuthology.nuke import nuke
+from teuthology.orchestra import run as orchestra_run
 from teuthology.run_tasks import run_tasks
 from teuthology.repo_utils import fetch_qa_suite
 from teuthology.results import email_results
@@ -27,6 +28,7 @@ def set_up_logging(verbose, archive):
             os.mkdir(archive)
 
         teuthology.setup_log_file(os.path.join(archive, 'teuthology.log'))
+        orchestra_run.set_output_dir(os.path.join(archive, 'remote_output'))
 
     install_except_hook()
 
@@ -1,3 +1,5 @@
+import docopt
+import logging
 import pprint
 import yaml
 
@@ -5,8 +7,79 @@ import teuthology.beanstalk
 from teuthology.misc import get_user, merge_configs
 from teuthology import report
 
+log = logging.getLogger(__name__)
 
-def main(args):
+doc = """
+usage: teuthology-schedule -h
+       teuthology-schedule [options] --name <name> [--] [<conf_file> ...]
+
+Schedule ceph integration tests
+
+positional arguments:
+  <conf_file>                          Config file to read
+
+optional arguments:
+  -h, --help                           Show this help message and exit
+  -v, --verbose                        Be more verbose
+  -n <name>, --name <name>             Name of suite run the job is part of
+  -d <desc>, --description <desc>      Job description
+  -o <owner>, --owner <owner>          Job owner
+  -w <worker>, --worker <worker>       Which worker to use (type of machine)
+                                       [default: plana]
+  -p <priority>, --priority <priority> Job priority (lower is sooner)
+                                       [default: 1000]
+  -N <num>, --num <num>                Number of times to run/queue the job
+                                       [default: 1]
+
+  --first-in-suite                     Mark the first job in a suite so suite
+                                       can note down the rerun-related info
+                                       [default: False]
+  --last-in-suite                      Mark the last job in a suite so suite
+                                       post-processing can be run
+                                       [default: False]
+  --email <email>                      Where to send the results of a suite.
+                                       Only applies to the last job in a suite.
+  --timeout <timeout>                  How many seconds to wait for jobs to
+                                       finish before emailing results. Only
+                                       applies to the last job in a suite.
+  --seed <seed>                        The random seed for rerunning the suite.
+                                       Only applies to the last job in a suite.
+  --subset <subset>                    The subset option passed to teuthology-suite.
+                                       Only applies to the last job in a suite.
+  --dry-run                            Instead of scheduling, just output the
+                                       job config.
+
+"""
+
+
+def parse_args(argv):
+    """
+    Parse teuthology-schedule's arguments, as given on its command line
+    """
+    return docopt.docopt(doc, argv=argv)
+
+
+def main(args, connection=None, conf_dict=None):
+    """
+    Schedule a job, given the parsed arguments to teuthology-schedule
+
+    :param connection: The beanstalk connection to use; see schedule_job()
+    :param conf_dict:  The merged contents of the job's config files; see
+                       build_config()
+    """
+    check_args(args)
+    job_config = build_config(args, conf_dict)
+    if args['--dry-run']:
+        pprint.pprint(job_config)
+    else:
+        schedule_job(job_config, args['--num'], connection)
+
+
+def check_args(args):
+    """
+    Raise ValueError if the parsed arguments to teuthology-schedule are
+    invalid
+    """
     if not args['--first-in-suite']:
         first_job_args = ['subset', 'seed']
         for arg in first_job_args:
@@ -26,19 +99,19 @@ def main(args):
     name = args['--name']
     if not name or name.isdigit():
         raise ValueError("Please use a more descriptive value for --name")
-    job_config = build_config(args)
-    if args['--dry-run']:
-        pprint.pprint(job_config)
-    else:
-        schedule_job(job_config, args['--num'])
 
 
-def build_config(args):
+def build_config(args, conf_dict=None):
     """
     Given a dict of arguments, build a job config
+
+    :param conf_dict: The merged contents of the files in args['<conf_file>'],
+                      for callers that have already parsed them. If None, the
+                      files are read and merged here.
     """
-    config_paths = args.get('<conf_file>', list())
-    conf_dict = merge_configs(config_paths)
+    if conf_dict is None:
+        config_paths = args.get('<conf_file>', list())
+        conf_dict = merge_configs(config_paths)
     # strip out targets; the worker will allocate new ones when we run
     # the job with --lock.
     if 'targets' in conf_dict:
@@ -75,26 +148,60 @@ def build_config(args):
     return job_config
 
 
-def schedule_job(job_config, num=1):
+def schedule_job(job_config, num=1, connection=None):
     """
     Schedule a job.
 
     :param job_config: The complete job dict
     :param num:      The number of times to schedule the job
+    :param connection: The beanstalk connection to use. If None, a new one is
+                       opened; callers scheduling many jobs should pass one in
+                       to avoid reconnecting for each of them.
+    """
+    schedule_jobs([job_config] * int(num), connection)
+    job_config.pop('tube')
+
+
+def schedule_jobs(job_configs, connection=None):
+    """
+    Schedule several jobs at once.
+
+    The jobs are put into beanstalk without waiting for each put to be
+    acknowledged before sending the next, and their queued status is then
+    pushed to the results server in concurrent batches.
+
+    :param job_configs: A list of complete job dicts. A dict may appear more
+                        than once, to schedule the same job several times.
+    :param connection:  The beanstalk connection to use. If None, a new one is
+                        opened.
+    :returns:           The list of scheduled job ids
+    :raises:            The error of the first job that couldn't be put, once
+                        the jobs that were put have been printed and reported
     """
-    num = int(num)
-    job = yaml.safe_dump(job_config)
-    tube = job_config.pop('tube')
-    beanstalk = teuthology.beanstalk.connect()
-    beanstalk.use(tube)
-    while num > 0:
-        jid = beanstalk.put(
-            job,
-            ttr=60 * 60 * 24,
-            priority=job_config['priority'],
-        )
+    beanstalk = connection or teuthology.beanstalk.connect()
+    results = teuthology.beanstalk.put_jobs(beanstalk, [
+        (job_config['tube'], yaml.safe_dump(job_config),
+         job_config['priority'], 60 * 60 * 24)
+        for job_config in job_configs
+    ])
+    job_ids = list()
+    queued = list()
+    failure = None
+    for job_config, result in zip(job_configs, results):
+        if isinstance(result, Exception):
+            log.error("Failed to schedule job with name %s and description "
+                      "%s: %s", job_config['name'],
+                      job_config.get('description'), result)
+            failure = failure or result
+            continue
         print('Job scheduled with name {name} and ID {jid}'.format(
-            name=job_config['name'], jid=jid))
-        job_config['job_id'] = str(jid)
-        report.try_push_job_info(job_config, dict(status='queued'))
-        num -= 1
+            name=job_config['name'], jid=result))
+        job_ids.append(str(result))
+        job_info = dict(job_config)
+        job_info.pop('tube')
+        job_info['job_id'] = str(result)
+        queued.append(job_info)
+    report.try_push_jobs_info(queued, dict(status='queued'))
+    if failure is not None:
+        raise failure
+    return job_ids
@@ -2,12 +2,14 @@ import logging
 import os
 import random
 
+from six.moves import range
+
 from teuthology.suite import matrix
 
 log = logging.getLogger(__name__)
 
 
-def build_matrix(path, subset=None, seed=None):
+def build_matrix(path, subset=None, seed=None, cache=None):
     """
     Return a list of items descibed by path such that if the list of
     items is chunked into mincyclicity pieces, each piece is still a
@@ -47,24 +49,71 @@ def build_matrix(path, subset=None, seed=None):
     :param path:        The path to search for yaml fragments
     :param subset:	(index, outof)
     :param seed:        The seed for repeatable random test
+    :param cache:       An optional teuthology.suite.cache.SuiteCache
+    """
+    return list(iterate_matrix(path, subset, seed, cache))
+
+
+def iterate_matrix(path, subset=None, seed=None, cache=None):
+    """
+    Like build_matrix(), but return a lazy Combinations object instead
+    of a list.  The matrix itself is built eagerly (so that the number
+    of combinations is known), but the (description, [file list])
+    tuples are only generated as they are consumed.
+
+    :param path:        The path to search for yaml fragments
+    :param subset:	(index, outof)
+    :param seed:        The seed for repeatable random test
+    :param cache:       An optional teuthology.suite.cache.SuiteCache
     """
     if subset:
         log.info(
             'Subset=%s/%s' %
             (str(subset[0]), str(subset[1]))
         )
-    random.seed(seed)
-    mat, first, matlimit = _get_matrix(path, subset)
-    return generate_combinations(path, mat, first, matlimit)
+    mat, first, matlimit = _get_matrix(path, subset, cache)
+    return Combinations(path, mat, first, matlimit, seed)
 
 
-def _get_matrix(path, subset=None):
+class Combinations(object):
+    """
+    A re-iterable, lazily generated sequence of (description, [file
+    list]) tuples for the indices [first, matlimit) of a matrix.
+
+    Each iteration re-seeds the random module with the same seed so
+    that every pass (e.g. each --newest backtrack) yields the same
+    PickRandom selections.
+    """
+    def __init__(self, path, mat, first, matlimit, seed=None):
+        self.path = path
+        self.mat = mat
+        self.first = first
+        self.matlimit = matlimit
+        self.seed = seed
+
+    def __len__(self):
+        return self.matlimit - self.first
+
+    def __iter__(self):
+        random.seed(self.seed)
+        return iterate_combinations(
+            self.path, self.mat, self.first, self.matlimit)
+
+
+def _get_matrix(path, subset=None, cache=None):
+    def build(mincyclicity=0):
+        if cache is None:
+            return _build_matrix(path, mincyclicity=mincyclicity)
+        return cache.get_matrix(
+            mincyclicity,
+            lambda: _build_matrix(path, mincyclicity=mincyclicity))
+
     mat = None
     first = None
     matlimit = None
     if subset:
         (index, outof) = subset
-        mat = _build_matrix(path, mincyclicity=outof)
+        mat = build(mincyclicity=outof)
         first = (mat.size() // outof) * index
         if index == outof or index == outof - 1:
             matlimit = mat.size()
@@ -72,7 +121,7 @@ def _get_matrix(path, subset=None):
             matlimit = (mat.size() // outof) * (index + 1)
     else:
         first = 0
-        mat = _build_matrix(path)
+        mat = build()
         matlimit = mat.size()
     return mat, first, matlimit
 
@@ -181,13 +230,19 @@ def generate_combinations(path, mat, generate_from, generate_to):
     component will appear as a file with braces listing the selection
     of chosen subitems.
     """
-    ret = []
+    return list(iterate_combinations(path, mat, generate_from, generate_to))
+
+
+def iterate_combinations(path, mat, generate_from, generate_to):
+    """
+    Generator version of generate_combinations(); yields one
+    (description, [file list]) tuple at a time.
+    """
     for i in range(generate_from, generate_to):
         output = mat.index(i)
-        ret.append((
+        yield (
             matrix.generate_desc(combine_path, output),
-            matrix.generate_paths(path, output, combine_path)))
-    return ret
+            matrix.generate_paths(path, output, combine_path))
 
 
 def combine_path(left, right):
@@ -0,0 +1,298 @@
+"""
+On-disk caches used when scheduling suites.
+
+Built suite matrices and parsed yaml fragments live under
+<src_base_path>/suite_cache and are keyed by the content of the suite tree:
+when the suite lives in a clean git checkout, the key is derived from the
+checkout's HEAD tree (so identical checkouts of different branches share an
+entry); otherwise it is derived from the path, size and mtime of every file
+below the suite directory, following symlinks.
+
+The package versions found for ceph sha1s are kept alongside, in
+package_versions.json, for suite_package_cache_ttl seconds.
+"""
+import copy
+import errno
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+import yaml
+
+from six.moves import cPickle as pickle
+
+from teuthology.config import config
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+log = logging.getLogger(__name__)
+
+# Bump this whenever the pickled format of matrices or entries changes
+CACHE_VERSION = 1
+
+
+def load_fragment(path):
+    """
+    Parse the yaml fragment at path, using libyaml's CSafeLoader when it is
+    available
+    """
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def get_suite_cache(path):
+    """
+    Return a SuiteCache for the suite at path, or None if the cache is
+    disabled via the 'suite_cache' config option.
+    """
+    if not config.suite_cache:
+        return None
+    return SuiteCache(path)
+
+
+def _git_tree_key(path):
+    """
+    Return a key based on the git HEAD tree of the checkout containing path,
+    or None if path is not in a git checkout or the checkout has local
+    changes.
+    """
+    def git(*args):
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ('git',) + args, cwd=path, stderr=devnull).strip()
+    try:
+        tree = git('rev-parse', 'HEAD^{tree}')
+        prefix = git('rev-parse', '--show-prefix')
+        dirty = git('status', '--porcelain')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if dirty:
+        return None
+    return 'git-' + hashlib.sha1(tree + b'\0' + prefix).hexdigest()
+
+
+def _stat_key(path):
+    """
+    Return a key based on the path, size and mtime of every file below path
+    """
+    digest = hashlib.sha1(os.path.abspath(path).encode('utf-8'))
+    for root, dirs, files in os.walk(path, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                # e.g. a dangling symlink
+                continue
+            digest.update(('%s\0%d\0%r\0' % (
+                os.path.relpath(file_path, path), st.st_size, st.st_mtime,
+            )).encode('utf-8'))
+    return 'stat-' + digest.hexdigest()
+
+
+def tree_key(path):
+    """
+    Return a string identifying the current contents of the suite tree at
+    path
+    """
+    return _git_tree_key(path) or _stat_key(path)
+
+
+class SuiteCache(object):
+    """
+    The cache entry for a single suite tree.
+
+    An entry holds the matrices built for the tree (one per mincyclicity,
+    since subsets build differently-cycled matrices) and the parsed contents
+    of every yaml fragment in the tree.  It is loaded lazily and written
+    back atomically, so concurrent teuthology-suite and
+    teuthology-describe-tests processes can share it.
+    """
+    def __init__(self, path, cache_dir=None):
+        self.path = os.path.abspath(path)
+        self.cache_dir = cache_dir or os.path.join(
+            config.src_base_path, 'suite_cache')
+        self._key = None
+        self._entry = None
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = tree_key(self.path)
+        return self._key
+
+    @property
+    def entry_path(self):
+        return os.path.join(
+            self.cache_dir, 'v%d-%s.pickle' % (CACHE_VERSION, self.key))
+
+    @property
+    def entry(self):
+        if self._entry is None:
+            self._entry = self._load()
+        return self._entry
+
+    def _load(self):
+        try:
+            with open(self.entry_path, 'rb') as f:
+                entry = pickle.load(f)
+            log.debug("Loaded suite cache entry %s", self.entry_path)
+            return entry
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                log.warning("Could not read suite cache entry %s: %s",
+                            self.entry_path, e)
+        except Exception:
+            log.exception("Ignoring corrupt suite cache entry %s",
+                          self.entry_path)
+        return dict(matrices=dict(), fragments=self._parse_fragments())
+
+    def _parse_fragments(self):
+        fragments = dict()
+        for root, dirs, files in os.walk(self.path, followlinks=True):
+            for name in files:
+                if not name.endswith('.yaml'):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    fragments[os.path.relpath(file_path, self.path)] = \
+                        load_fragment(file_path)
+                except Exception:
+                    # leave it to the caller to hit (and report) the error
+                    log.debug("Not caching %s", file_path, exc_info=True)
+        return fragments
+
+    def save(self):
+        """
+        Atomically write the entry to disk
+        """
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with tempfile.NamedTemporaryFile(
+                    dir=self.cache_dir, prefix='.tmp-', delete=False) as f:
+                pickle.dump(self.entry, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(f.name, self.entry_path)
+        except (IOError, OSError) as e:
+            log.warning("Could not write suite cache entry %s: %s",
+                        self.entry_path, e)
+
+    def get_matrix(self, mincyclicity, build):
+        """
+        Return the matrix for mincyclicity, calling build() and storing its
+        result on a miss.
+        """
+        matrices = self.entry['matrices']
+        if mincyclicity not in matrices:
+            log.debug("Suite cache miss for %s (mincyclicity=%d)",
+                      self.path, mincyclicity)
+            matrices[mincyclicity] = build()
+            self.save()
+        return matrices[mincyclicity]
+
+    def get_fragment(self, path):
+        """
+        Return the parsed contents of the yaml fragment at path.
+
+        Fragments outside of the suite tree (or that failed to parse when the
+        entry was built) are parsed on every call.  The caller owns the
+        returned object and may modify it.
+        """
+        rel_path = os.path.relpath(os.path.abspath(path), self.path)
+        fragments = self.entry['fragments']
+        if rel_path in fragments:
+            return copy.deepcopy(fragments[rel_path])
+        return load_fragment(path)
+
+
+def get_package_version_cache():
+    """
+    Return the PackageVersionCache, or None if it is disabled by setting
+    'suite_package_cache_ttl' to 0.
+    """
+    if not config.suite_package_cache_ttl:
+        return None
+    return PackageVersionCache()
+
+
+class PackageVersionCache(object):
+    """
+    The package versions found for ceph sha1s, shared between teuthology-suite
+    invocations.
+
+    Entries are keyed by builder project, sha1, os_type, os_version and
+    flavor, and expire after ttl seconds. Versions that were not found are
+    never stored, so that packages built since the last lookup are noticed.
+    """
+    def __init__(self, path=None, ttl=None):
+        self.path = path or os.path.join(
+            config.src_base_path, 'suite_cache', 'package_versions.json')
+        self.ttl = config.suite_package_cache_ttl if ttl is None else ttl
+        self._entries = None
+
+    @staticmethod
+    def make_key(project, sha1, os_type, os_version, flavor):
+        return '/'.join(
+            str(x) for x in (project, sha1, os_type, os_version, flavor))
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                log.warning("Could not read package version cache %s: %s",
+                            self.path, e)
+            return dict()
+        except ValueError:
+            log.warning("Ignoring corrupt package version cache %s",
+                        self.path)
+            return dict()
+        now = time.time()
+        return dict(
+            (key, entry) for key, entry in entries.items()
+            if now - entry['time'] < self.ttl
+        )
+
+    def get(self, key):
+        """
+        Return the cached version for key, or None
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry['version']
+
+    def update(self, versions):
+        """
+        Store the found versions and atomically write the cache to disk
+
+        :param versions: A dict mapping keys (see make_key()) to versions
+        """
+        now = time.time()
+        for key, version in versions.items():
+            if version:
+                self.entries[key] = dict(version=version, time=now)
+        cache_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with tempfile.NamedTemporaryFile(
+                    'w', dir=cache_dir, prefix='.tmp-', delete=False) as f:
+                json.dump(self.entries, f)
+            os.rename(f.name, self.path)
+        except (IOError, OSError) as e:
+            log.warning("Could not write package version cache %s: %s",
+                        self.path, e)
@@ -1,6 +1,5 @@
 import os
 import random
-import heapq
 from fractions import gcd
 from functools import reduce
 
@@ -133,8 +132,9 @@ class Product(Matrix):
 
     def _index(self, i, submats):
         """
-        We recursively reduce the N dimension problem to a two
-        dimension problem.
+        We reduce the N dimension problem to a series of two dimension
+        problems, where the left matrix is submats[j] and the right
+        matrix is the product of submats[j+1:].
 
         index(i) = (lmat.index(i % lmat.size()), rmat.index(i %
         rmat.size())) would simply work if lmat.size() and rmat.size()
@@ -146,29 +146,25 @@ class Product(Matrix):
         number on each repeat.  Each of the N repeats must therefore
         be distinct from the previous ones resulting in lmat.size() *
         rmat.size() combinations.
+
+        Since i is the same at every level, the recursion unrolls into
+        a single pass over submats.
         """
         assert len(submats) > 0, \
             "_index requires non-empty submats"
-        if len(submats) == 1:
-            return frozenset([submats[0][1].index(i)])
-
-        lmat = submats[0][1]
-        lsize = lmat.size()
-
-        rsize = submats[0][0]
-
-        cycles = gcd(rsize, lsize)
-        clen = (rsize * lsize) // cycles
-        off = (i // clen) % cycles
-
-        def combine(r, s=frozenset()):
-            if isinstance(r, frozenset):
-                return s | r
-            return s | frozenset([r])
-
-        litems = lmat.index((i - off) % lmat.size())
-        ritems = self._index(i, submats[1:])
-        return combine(litems, combine(ritems))
+        items = []
+        for rsize, lmat in submats[:-1]:
+            lsize = lmat.size()
+            cycles = gcd(rsize, lsize)
+            clen = (rsize * lsize) // cycles
+            off = (i // clen) % cycles
+            litems = lmat.index((i - off) % lsize)
+            if isinstance(litems, frozenset):
+                items.extend(litems)
+            else:
+                items.append(litems)
+        items.append(submats[-1][1].index(i))
+        return frozenset(items)
 
     def index(self, i):
         items = self._index(i, self.submats)
@@ -242,10 +238,16 @@ class Sum(Matrix):
     an offset (position in input list) and a multiple (pseudo_size / size)
     such that the psuedo_index for index i is <offset> + i*<multiple>.
 
-    I don't have a good way to map index to pseudo index, so we'll
-    precompute a mapping in the constructor (self._i_so_sis) from
-    index to (subset_index, subset).
+    Since every multiple is itself a multiple of the number of
+    subsequences, a pseudo index identifies its subsequence by its
+    remainder modulo the number of subsequences.  To map an index to
+    (subset_index, subset) we therefore bisect on the pseudo index
+    (see pseudo_index_to_index()).  Only small sums, which are indexed
+    over and over as facets of a Product, cache the mapping in a table
+    (self._i_to_sis); large ones would need one entry per index.
     """
+    TABLE_MAX_SIZE = 4096
+
     def __init__(self, item, _submats):
         assert len(_submats) > 0, \
             "Sum requires non-empty _submats"
@@ -266,25 +268,15 @@ class Sum(Matrix):
 
             return submat.minscanlen() * multiple
 
-        def index_to_pindex_generator(submats):
-            assert len(submats) > 0, "submats must be non-empty"
-            h = []
-            for (offset, multiple), submat in submats:
-                heapq.heappush(h, (offset, 0, multiple, submat))
-            while True:
-                cur, si, multiple, submat = heapq.heappop(h)
-                heapq.heappush(
-                    h,
-                    (cur + multiple, si + 1, multiple, submat))
-                yield si, submat
-
-        self._i_to_sis = dict(
-            zip(range(self._size), index_to_pindex_generator(self._submats))
-        )
-
         self._minscanlen = self.pseudo_index_to_index(
             max(map(sm_to_pmsl, self._submats)))
 
+        self._i_to_sis = None
+        if self._size <= self.TABLE_MAX_SIZE:
+            self._i_to_sis = [
+                self.index_to_sis(i) for i in range(self._size)
+            ]
+
     def pi_to_sis(self, pi, offset_multiple):
         """
         offset_multiple tuple of offset and multiple
@@ -296,11 +288,36 @@ class Sum(Matrix):
             return -1
         return (pi - offset) // multiple
 
+    def index_to_sis(self, i):
+        """
+        Find the smallest pseudo index pi for which
+        pseudo_index_to_index(pi) == i, and return the corresponding
+        (subset_index, subset).
+        """
+        # pseudo_index_to_index(pi) is always within len(self._submats)
+        # of pi * size / pseudo_size, which gives us tight initial bounds
+        num = len(self._submats)
+        lo = max(0, (i + 1 - num) * self._pseudo_size // self._size)
+        hi = min(self._pseudo_size - 1,
+                 num + -(-(i + 1) * self._pseudo_size // self._size))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.pseudo_index_to_index(mid) < i:
+                lo = mid + 1
+            else:
+                hi = mid
+        (offset, multiple), submat = self._submats[lo % num]
+        return (lo - offset) // multiple, submat
+
     def pseudo_index_to_index(self, pi):
         """
         Count all pseudoindex values <= pi with corresponding subset indices
         """
-        return sum((self.pi_to_sis(pi, i) + 1 for i, _ in self._submats)) - 1
+        count = -1
+        for (offset, multiple), _ in self._submats:
+            if pi >= offset:
+                count += (pi - offset) // multiple + 1
+        return count
 
     def tostr(self, depth):
         ret = '\t'*depth + "Sum({item}):\n".format(item=self.item)
@@ -313,7 +330,10 @@ class Sum(Matrix):
         return self._size
 
     def index(self, i):
-        si, submat = self._i_to_sis[i % self._size]
+        if self._i_to_sis is not None:
+            si, submat = self._i_to_sis[i % self._size]
+        else:
+            si, submat = self.index_to_sis(i % self._size)
         return (self.item, submat.index(si))
 
 def generate_lists(result):
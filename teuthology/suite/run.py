@@ -10,19 +10,23 @@ from datetime import datetime
 from tempfile import NamedTemporaryFile
 
 from teuthology.config import config, JobConfig
-from teuthology.exceptions import (
-    BranchNotFoundError, CommitNotFoundError, VersionNotFoundError
-)
+from teuthology.exceptions import BranchNotFoundError, CommitNotFoundError
 from teuthology.misc import deep_merge, get_results_url
 from teuthology.orchestra.opsys import OS
 from teuthology.repo_utils import build_git_url
 
 from teuthology.suite import util
-from teuthology.suite.build_matrix import combine_path, build_matrix
+from teuthology.suite.build_matrix import combine_path, iterate_matrix
+from teuthology.suite.cache import (
+    get_package_version_cache, get_suite_cache, load_fragment
+)
 from teuthology.suite.placeholder import substitute_placeholders, dict_templ
 
 log = logging.getLogger(__name__)
 
+# Marks fragments that could not be parsed on their own
+UNPARSEABLE = object()
+
 
 class Run(object):
     WAIT_MAX_JOB_TIME = 30 * 60
@@ -30,6 +34,7 @@ class Run(object):
     __slots__ = (
         'args', 'name', 'base_config', 'suite_repo_path', 'base_yaml_paths',
         'base_args', 'package_versions', 'kernel_dict', 'config_input',
+        'suite_cache', 'fragments', 'beanstalk', 'package_cache',
     )
 
     def __init__(self, args):
@@ -47,6 +52,12 @@ class Run(object):
         self.base_config = self.create_initial_config()
         # caches package versions to minimize requests to gbs
         self.package_versions = dict()
+        self.package_cache = get_package_version_cache()
+        # caches parsed yaml fragments, so each is parsed once per run
+        self.suite_cache = None
+        self.fragments = dict()
+        # opened on demand, and shared by all the jobs scheduled by this run
+        self.beanstalk = None
 
         if self.args.suite_dir:
             self.suite_repo_path = self.args.suite_dir
@@ -310,11 +321,7 @@ class Run(object):
             subset = '/'.join(str(i) for i in self.args.subset)
             args.extend(['--subset', subset])
         args.extend(['--seed', str(self.args.seed)])
-        util.teuthology_schedule(
-            args=args,
-            dry_run=self.args.dry_run,
-            verbose=self.args.verbose,
-            log_prefix="Memo: ")
+        self.schedule(args, log_prefix="Memo: ")
 
 
     def write_result(self):
@@ -324,11 +331,7 @@ class Run(object):
             arg.extend(['--email', self.base_config.email])
         if self.args.timeout:
             arg.extend(['--timeout', self.args.timeout])
-        util.teuthology_schedule(
-            args=arg,
-            dry_run=self.args.dry_run,
-            verbose=self.args.verbose,
-            log_prefix="Results: ")
+        self.schedule(arg, log_prefix="Results: ")
         results_url = get_results_url(self.base_config.name)
         if results_url:
             log.info("Test results viewable at %s", results_url)
@@ -357,6 +360,7 @@ class Run(object):
     def collect_jobs(self, arch, configs, newest=False):
         jobs_to_schedule = []
         jobs_missing_packages = []
+        jobs_to_verify = []
         for description, fragment_paths in configs:
             base_frag_paths = [
                 util.strip_fragment_path(x) for x in fragment_paths
@@ -389,9 +393,7 @@ class Run(object):
                 if not is_collected:
                     continue
 
-            raw_yaml = '\n'.join([open(a, 'r').read() for a in fragment_paths])
-
-            parsed_yaml = yaml.safe_load(raw_yaml)
+            parsed_yaml = self.parse_fragments(fragment_paths)
             os_type = parsed_yaml.get('os_type') or self.base_config.os_type
             os_version = parsed_yaml.get('os_version') or self.base_config.os_version
             exclude_arch = parsed_yaml.get('exclude_arch')
@@ -418,28 +420,31 @@ class Run(object):
                 yaml=parsed_yaml,
                 desc=description,
                 sha1=self.base_config.sha1,
-                args=arg
+                args=arg,
+                fragment_paths=fragment_paths,
             )
 
-            sha1 = self.base_config.sha1
             if config.suite_verify_ceph_hash:
                 full_job_config = copy.deepcopy(self.base_config.to_dict())
                 deep_merge(full_job_config, parsed_yaml)
                 flavor = util.get_install_task_flavor(full_job_config)
-                # Get package versions for this sha1, os_type and flavor. If
-                # we've already retrieved them in a previous loop, they'll be
-                # present in package_versions and gitbuilder will not be asked
-                # again for them.
-                try:
-                    self.package_versions = util.get_package_versions(
-                        sha1,
-                        os_type,
-                        os_version,
-                        flavor,
-                        self.package_versions
-                    )
-                except VersionNotFoundError:
-                    pass
+                jobs_to_verify.append((job, (os_type, os_version, flavor)))
+
+            jobs_to_schedule.append(job)
+
+        if jobs_to_verify:
+            sha1 = self.base_config.sha1
+            # Get package versions for this sha1 and every distinct os_type,
+            # os_version and flavor at once. If we've already retrieved them
+            # in a previous loop, they'll be present in package_versions and
+            # gitbuilder will not be asked again for them.
+            self.package_versions = util.get_package_versions_for_distros(
+                sha1,
+                set(distro for _, distro in jobs_to_verify),
+                self.package_versions,
+                cache=self.package_cache,
+            )
+            for job, (os_type, os_version, flavor) in jobs_to_verify:
                 if not util.has_packages_for_distro(
                     sha1, os_type, os_version, flavor, self.package_versions
                 ):
@@ -452,10 +457,109 @@ class Run(object):
                     if newest:
                         return jobs_missing_packages, None
 
-            jobs_to_schedule.append(job)
         return jobs_missing_packages, jobs_to_schedule
 
+    def load_fragment(self, path):
+        """
+        Parse the yaml fragment at path, at most once per run
+        """
+        if path not in self.fragments:
+            try:
+                if self.suite_cache is not None:
+                    parsed = self.suite_cache.get_fragment(path)
+                else:
+                    parsed = load_fragment(path)
+            except yaml.YAMLError:
+                parsed = UNPARSEABLE
+            self.fragments[path] = parsed
+        return self.fragments[path]
+
+    def parse_fragments(self, fragment_paths):
+        """
+        Return the parsed yaml for the concatenation of fragment_paths.
+
+        Parsing the concatenated text lets later top-level keys replace
+        earlier ones; merging the parsed fragments in order does the same,
+        without parsing a fragment again for every job it appears in.  If a
+        fragment doesn't stand on its own as a mapping (e.g. it refers to an
+        anchor defined in another fragment), the concatenated text is parsed
+        instead.
+        """
+        parsed_yaml = None
+        for path in fragment_paths:
+            fragment = self.load_fragment(path)
+            if fragment is None:
+                continue
+            if not isinstance(fragment, dict):
+                raw_yaml = '\n'.join(
+                    [open(a, 'r').read() for a in fragment_paths])
+                return yaml.safe_load(raw_yaml)
+            if parsed_yaml is None:
+                parsed_yaml = dict()
+            parsed_yaml.update(fragment)
+        return copy.deepcopy(parsed_yaml)
+
+    def merge_configs(self, config_paths):
+        """
+        Like misc.merge_configs(), but using the fragments already parsed for
+        this run.  Returns None if any of them could not be parsed, leaving
+        teuthology.schedule to read (and fail on) the files itself.
+        """
+        conf_dict = dict()
+        for path in config_paths:
+            if not os.path.exists(path):
+                continue
+            fragment = self.load_fragment(path)
+            if fragment is UNPARSEABLE:
+                return None
+            # deep_merge() adopts parts of the dicts it merges from
+            conf_dict = deep_merge(conf_dict, copy.deepcopy(fragment))
+        return conf_dict
+
+    def connect(self):
+        """
+        Return the beanstalk connection shared by all the jobs of the run,
+        opening it if needed
+        """
+        if self.beanstalk is None:
+            # Imported here since it needs beanstalkc, which is only required
+            # when jobs are actually scheduled
+            import teuthology.beanstalk
+            self.beanstalk = teuthology.beanstalk.connect()
+        return self.beanstalk
+
+    def disconnect(self):
+        """
+        Close the beanstalk connection, if open, so that the next job opens a
+        new one
+        """
+        if self.beanstalk is not None:
+            self.beanstalk.close()
+            self.beanstalk = None
+
+    def schedule(self, args, log_prefix='', conf_dict=None):
+        """
+        Schedule a single job
+        """
+        try:
+            util.teuthology_schedule(
+                args=args,
+                dry_run=self.args.dry_run,
+                verbose=self.args.verbose,
+                log_prefix=log_prefix,
+                connection=None if self.args.dry_run else self.connect(),
+                conf_dict=conf_dict,
+            )
+        except Exception:
+            # the connection may be out of step with beanstalkd
+            self.disconnect()
+            raise
+
     def schedule_jobs(self, jobs_missing_packages, jobs_to_schedule, name):
+        throttle = self.args.throttle
+        # Unless they must be paced or printed, put all the jobs in one go
+        batch = not (self.args.dry_run or throttle)
+        batched_jobs = []
         for job in jobs_to_schedule:
             log.info(
                 'Scheduling %s', job['desc']
@@ -473,16 +577,26 @@ class Run(object):
                         "hash {sha1}.".format(sha1=self.base_config.sha1),
                         name,
                     )
-            util.teuthology_schedule(
-                args=job['args'],
-                dry_run=self.args.dry_run,
-                verbose=self.args.verbose,
+            conf_dict = self.merge_configs(
+                self.base_yaml_paths + job['fragment_paths'])
+            if batch:
+                batched_jobs.append((job['args'], conf_dict))
+                continue
+            self.schedule(
+                job['args'],
                 log_prefix=log_prefix,
+                conf_dict=conf_dict,
             )
-            throttle = self.args.throttle
             if not self.args.dry_run and throttle:
                 log.info("pause between jobs : --throttle " + str(throttle))
                 time.sleep(int(throttle))
+        if batched_jobs:
+            try:
+                util.teuthology_schedule_jobs(
+                    batched_jobs, connection=self.connect())
+            except Exception:
+                self.disconnect()
+                raise
 
     def schedule_suite(self):
         """
@@ -498,12 +612,15 @@ class Run(object):
             self.base_config.suite.replace(':', '/'),
         ))
         log.debug('Suite %s in %s' % (suite_name, suite_path))
-        configs = [
-            (combine_path(suite_name, item[0]), item[1]) for item in
-            build_matrix(suite_path, subset=self.args.subset, seed=self.args.seed)
-        ]
+        # combinations are generated lazily, so collect_jobs() can stop
+        # (e.g. due to --limit) without generating the whole suite
+        self.suite_cache = get_suite_cache(suite_path)
+        combinations = iterate_matrix(
+            suite_path, subset=self.args.subset, seed=self.args.seed,
+            cache=self.suite_cache)
+        num_configs = len(combinations)
         log.info('Suite %s in %s generated %d jobs (not yet filtered)' % (
-            suite_name, suite_path, len(configs)))
+            suite_name, suite_path, num_configs))
 
         if self.args.dry_run:
             log.debug("Base job config:\n%s" % self.base_config)
@@ -521,6 +638,10 @@ class Run(object):
         backtrack = 0
         limit = self.args.newest
         while backtrack <= limit:
+            configs = (
+                (combine_path(suite_name, desc), fragment_paths)
+                for desc, fragment_paths in combinations
+            )
             jobs_missing_packages, jobs_to_schedule = \
                 self.collect_jobs(arch, configs, self.args.newest)
             if jobs_missing_packages and self.args.newest:
@@ -564,8 +685,8 @@ class Run(object):
             (suite_name, suite_path, count)
         )
         log.info('%d/%d jobs were filtered out.',
-                 (len(configs) - count),
-                 len(configs))
+                 (num_configs - count),
+                 num_configs)
         if missing_count:
             log.warn('Scheduled %d/%d jobs that are missing packages!',
                      missing_count, count)
@@ -316,6 +316,55 @@ class TestBuildMatrix(object):
         result = build_matrix.build_matrix('d0_0')
         assert len(result) == 4
 
+    def test_iterate_matrix(self):
+        fake_fs = {
+            'd0_0': {
+                '%': None,
+                'd1_0': {
+                    'd1_0_0.yaml': None,
+                    'd1_0_1.yaml': None,
+                },
+                'd1_1': {
+                    'd1_1_0.yaml': None,
+                    'd1_1_1.yaml': None,
+                    'd1_1_2.yaml': None,
+                },
+                'd1_2$': {
+                    'd1_2_0.yaml': None,
+                    'd1_2_1.yaml': None,
+                    'd1_2_2.yaml': None,
+                },
+            },
+        }
+        self.start_patchers(fake_fs)
+        expected = build_matrix.build_matrix('d0_0', seed=42)
+        combinations = build_matrix.iterate_matrix('d0_0', seed=42)
+        assert len(combinations) == len(expected) == 6
+        # every pass yields the same combinations, random picks included
+        assert list(combinations) == expected
+        assert list(combinations) == expected
+        expected = build_matrix.build_matrix('d0_0', subset=(1, 2), seed=42)
+        combinations = build_matrix.iterate_matrix(
+            'd0_0', subset=(1, 2), seed=42)
+        assert len(combinations) == len(expected)
+        assert list(combinations) == expected
+
+    def test_iterate_matrix_is_lazy(self):
+        fake_fs = {
+            'd0_0': {
+                'd1_0.yaml': None,
+                'd1_1.yaml': None,
+                'd1_2.yaml': None,
+            },
+        }
+        self.start_patchers(fake_fs)
+        combinations = build_matrix.iterate_matrix('d0_0')
+        with patch.object(combinations.mat, 'index',
+                          wraps=combinations.mat.index) as m_index:
+            first = next(iter(combinations))
+            assert m_index.call_count == 1
+        assert first == build_matrix.build_matrix('d0_0')[0]
+
     def test_emulate_teuthology_noceph(self):
         fake_fs = {
             'teuthology': {
@@ -0,0 +1,148 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from mock import Mock, patch
+
+from teuthology.suite import build_matrix
+from teuthology.suite import cache
+from teuthology.suite import matrix
+
+
+class TestSuiteCache(object):
+    def setup(self):
+        self.temp_path = tempfile.mkdtemp(prefix='test_suite_cache-')
+        self.cache_dir = os.path.join(self.temp_path, 'suite_cache')
+        self.suite_path = os.path.join(self.temp_path, 'suite')
+        self.write('%', '')
+        self.write('clusters/fixed-1.yaml', 'roles:\n- [mon.a, osd.0]\n')
+        self.write('tasks/a.yaml', 'tasks:\n- a:\n')
+        self.write('tasks/b.yaml', 'tasks:\n- b:\n')
+
+    def teardown(self):
+        shutil.rmtree(self.temp_path)
+
+    def write(self, rel_path, content, root=None):
+        path = os.path.join(root or self.suite_path, rel_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def git(self, *args, **kwargs):
+        subprocess.check_call(
+            ('git', '-c', 'user.name=test', '-c', 'user.email=test@test')
+            + args, cwd=kwargs.get('cwd', self.suite_path),
+            stdout=open(os.devnull, 'w'))
+
+    def make_cache(self, path=None):
+        return cache.SuiteCache(path or self.suite_path, self.cache_dir)
+
+    def test_matrix_is_cached(self):
+        expected = build_matrix.build_matrix(self.suite_path)
+        result = build_matrix.build_matrix(
+            self.suite_path, cache=self.make_cache())
+        assert result == expected
+        # a fresh SuiteCache loads the matrix from disk
+        suite_cache = self.make_cache()
+        build = Mock(return_value=matrix.Base('x'))
+        mat = suite_cache.get_matrix(0, build)
+        assert not build.called
+        assert mat.size() == 2
+        # a different mincyclicity is built and stored alongside
+        suite_cache.get_matrix(2, build)
+        assert build.call_count == 1
+        assert sorted(self.make_cache().entry['matrices']) == [0, 2]
+
+    def test_changed_fragment_invalidates(self):
+        suite_cache = self.make_cache()
+        assert suite_cache.key.startswith('stat-')
+        assert suite_cache.get_fragment(
+            os.path.join(self.suite_path, 'tasks/a.yaml')) == \
+            dict(tasks=[dict(a=None)])
+        build_matrix.build_matrix(self.suite_path, cache=suite_cache)
+        self.write('tasks/a.yaml', 'tasks:\n- aa:\n')
+        self.write('tasks/c.yaml', 'tasks:\n- c:\n')
+        old_key = suite_cache.key
+        suite_cache = self.make_cache()
+        assert suite_cache.key != old_key
+        assert suite_cache.entry['matrices'] == {}
+        assert suite_cache.get_fragment(
+            os.path.join(self.suite_path, 'tasks/a.yaml')) == \
+            dict(tasks=[dict(aa=None)])
+        result = build_matrix.build_matrix(self.suite_path, cache=suite_cache)
+        assert len(result) == 3
+
+    def test_get_fragment_returns_copy(self):
+        suite_cache = self.make_cache()
+        path = os.path.join(self.suite_path, 'clusters/fixed-1.yaml')
+        suite_cache.get_fragment(path)['roles'].append(['osd.1'])
+        assert suite_cache.get_fragment(path) == \
+            dict(roles=[['mon.a', 'osd.0']])
+
+    def test_get_fragment_outside_tree(self):
+        self.write('other.yaml', 'foo: bar\n', root=self.temp_path)
+        suite_cache = self.make_cache()
+        assert suite_cache.get_fragment(
+            os.path.join(self.temp_path, 'other.yaml')) == dict(foo='bar')
+
+    def test_git_key(self):
+        self.git('init', '-q')
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'initial')
+        key = self.make_cache().key
+        assert key.startswith('git-')
+        # an identical checkout elsewhere shares the entry
+        clone_path = os.path.join(self.temp_path, 'clone')
+        self.git('clone', '-q', self.suite_path, clone_path)
+        assert self.make_cache(clone_path).key == key
+        # local changes fall back to stat-based keys
+        self.write('tasks/a.yaml', 'tasks:\n- aa:\n')
+        assert self.make_cache().key.startswith('stat-')
+        self.git('commit', '-q', '-a', '-m', 'change')
+        new_key = self.make_cache().key
+        assert new_key.startswith('git-')
+        assert new_key != key
+
+    def test_corrupt_entry(self):
+        suite_cache = self.make_cache()
+        os.makedirs(self.cache_dir)
+        with open(suite_cache.entry_path, 'w') as f:
+            f.write('garbage')
+        result = build_matrix.build_matrix(
+            self.suite_path, cache=self.make_cache())
+        assert len(result) == 2
+
+
+class TestPackageVersionCache(object):
+    def setup(self):
+        self.temp_path = tempfile.mkdtemp(prefix='test_package_cache-')
+        self.path = os.path.join(self.temp_path, 'dir', 'versions.json')
+
+    def teardown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_shared(self):
+        package_cache = cache.PackageVersionCache(self.path, ttl=60)
+        key = package_cache.make_key('P', 'sha1', 'ubuntu', '14.04', 'basic')
+        missing = package_cache.make_key('P', 'sha1', 'rhel', '7', 'basic')
+        package_cache.update({key: '1.0', missing: None})
+        package_cache = cache.PackageVersionCache(self.path, ttl=60)
+        assert package_cache.get(key) == '1.0'
+        assert package_cache.get(missing) is None
+
+    def test_expired(self):
+        package_cache = cache.PackageVersionCache(self.path, ttl=60)
+        package_cache.update({'key': '1.0'})
+        with patch('teuthology.suite.cache.time.time',
+                   return_value=time.time() + 61):
+            assert cache.PackageVersionCache(self.path, ttl=60).get(
+                'key') is None
+
+    def test_corrupt(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('garbage')
+        assert cache.PackageVersionCache(self.path, ttl=60).get('key') is None
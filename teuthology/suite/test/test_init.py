@@ -141,6 +141,15 @@ def test_expand_short_repo_name(orig, shorthand, result):
 
 
 class TestSuiteMain(object):
+    def setup(self):
+        # keep the on-disk suite caches out of config.src_base_path
+        self.orig_caches = (config.suite_cache, config.suite_package_cache_ttl)
+        config.suite_cache = False
+        config.suite_package_cache_ttl = 0
+
+    def teardown(self):
+        config.suite_cache, config.suite_package_cache_ttl = self.orig_caches
+
     def test_main(self):
         suite_name = 'SUITE'
         throttle = '3'
@@ -174,7 +183,8 @@ class TestSuiteMain(object):
                     '--machine-type', machine_type,
                 ])
 
-    def test_schedule_suite_noverify(self):
+    @patch('teuthology.beanstalk.connect')
+    def test_schedule_suite_noverify(self, m_connect):
         suite_name = 'noop'
         suite_dir = os.path.dirname(__file__)
         throttle = '3'
@@ -202,7 +212,8 @@ class TestSuiteMain(object):
             m_sleep.assert_called_with(int(throttle))
             m['get_gitbuilder_hash'].assert_not_called()
 
-    def test_schedule_suite(self):
+    @patch('teuthology.beanstalk.connect')
+    def test_schedule_suite(self, m_connect):
         suite_name = 'noop'
         suite_dir = os.path.dirname(__file__)
         throttle = '3'
@@ -1,3 +1,8 @@
+import heapq
+import random
+
+from mock import patch
+
 from teuthology.suite import matrix
 
 
@@ -80,3 +85,90 @@ class TestMatrix(object):
                     mbs(2, range(2)),
                     mbs(4, range(9)),
                     ]))
+
+
+class ReferenceSum(matrix.Sum):
+    """
+    Sum with the original heap-based, precomputed index mapping
+    """
+    def __init__(self, item, _submats):
+        matrix.Sum.__init__(self, item, _submats)
+        h = []
+        for (offset, multiple), submat in self._submats:
+            heapq.heappush(h, (offset, 0, multiple, submat))
+        self._i_to_sis = {}
+        for i in range(self._size):
+            cur, si, multiple, submat = heapq.heappop(h)
+            heapq.heappush(h, (cur + multiple, si + 1, multiple, submat))
+            self._i_to_sis[i] = (si, submat)
+
+    def index(self, i):
+        si, submat = self._i_to_sis[i % self._size]
+        return (self.item, submat.index(si))
+
+
+class ReferenceProduct(matrix.Product):
+    """
+    Product with the original recursive index computation
+    """
+    def _index(self, i, submats):
+        if len(submats) == 1:
+            return frozenset([submats[0][1].index(i)])
+        rsize, lmat = submats[0]
+        lsize = lmat.size()
+        cycles = matrix.gcd(rsize, lsize)
+        clen = (rsize * lsize) // cycles
+        off = (i // clen) % cycles
+        litems = lmat.index((i - off) % lsize)
+        if not isinstance(litems, frozenset):
+            litems = frozenset([litems])
+        return litems | self._index(i, submats[1:])
+
+
+def build_synthetic(sum_cls, product_cls, sizes):
+    """
+    Build a Product of Sums (one per entry in sizes), where each Sum
+    mixes a plain list of fragments with a small nested Product.
+    """
+    facets = []
+    for num, size in enumerate(sizes):
+        nested = product_cls(num * 10 + 1, [
+            sum_cls(num * 10 + 2, [matrix.Base('a%d' % j) for j in range(2)]),
+            sum_cls(num * 10 + 3, [matrix.Base('b%d' % j) for j in range(3)]),
+        ])
+        facets.append(sum_cls(num * 10, [
+            matrix.Base('f%d_%d' % (num, j)) for j in range(size)
+        ] + [nested]))
+    return product_cls(0, facets)
+
+
+class TestMatrixIndex(object):
+    def test_matches_reference(self):
+        sizes = [2, 3, 4, 6]
+        mat = build_synthetic(matrix.Sum, matrix.Product, sizes)
+        ref = build_synthetic(ReferenceSum, ReferenceProduct, sizes)
+        assert mat.size() == ref.size()
+        for i in range(mat.size()):
+            assert mat.index(i) == ref.index(i)
+
+    def test_matches_reference_without_tables(self):
+        sizes = [2, 3, 4, 6]
+        with patch.object(matrix.Sum, 'TABLE_MAX_SIZE', 0):
+            mat = build_synthetic(matrix.Sum, matrix.Product, sizes)
+            mat = matrix.Sum(99, [mat, matrix.Base('x'), matrix.Base('y')])
+        ref = build_synthetic(ReferenceSum, ReferenceProduct, sizes)
+        ref = ReferenceSum(99, [ref, matrix.Base('x'), matrix.Base('y')])
+        assert mat._i_to_sis is None
+        for i in range(mat.size()):
+            assert mat.index(i) == ref.index(i)
+
+    def test_large_matches_reference(self):
+        sizes = [5, 6, 7, 8, 9, 11, 13]
+        mat = build_synthetic(matrix.Sum, matrix.Product, sizes)
+        ref = build_synthetic(ReferenceSum, ReferenceProduct, sizes)
+        assert mat.size() == ref.size() > 10 ** 6
+        rng = random.Random(0)
+        for i in [0, mat.size() - 1] + \
+                [rng.randrange(mat.size()) for _ in range(2000)]:
+            assert matrix.generate_desc(str.__add__, mat.index(i)) == \
+                matrix.generate_desc(str.__add__, ref.index(i))
@@ -1,6 +1,8 @@
 import os
 import pytest
 import requests
+import shutil
+import tempfile
 import yaml
 import contextlib
 
@@ -10,6 +12,7 @@ from StringIO import StringIO
 
 from teuthology.config import config, YamlConfig
 from teuthology.exceptions import ScheduleFailError
+from teuthology.misc import merge_configs
 from teuthology.suite import run
 from teuthology import packaging
 
@@ -199,10 +202,11 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.run.Run.write_rerun_memo')
     @patch('teuthology.suite.util.has_packages_for_distro')
-    @patch('teuthology.suite.util.get_package_versions')
+    @patch('teuthology.suite.util.get_package_versions_for_distros')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.open')
-    @patch('teuthology.suite.run.build_matrix')
+    @patch('teuthology.suite.run.iterate_matrix')
+    @patch('teuthology.suite.run.get_suite_cache', lambda path: None)
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
     @patch('teuthology.suite.util.git_validate_sha1')
@@ -213,10 +217,10 @@ class TestScheduleSuite(object):
         m_git_validate_sha1,
         m_package_version_for_hash,
         m_git_ls_remote,
-        m_build_matrix,
+        m_iterate_matrix,
         m_open,
         m_get_install_task_flavor,
-        m_get_package_versions,
+        m_get_package_versions_for_distros,
         m_has_packages_for_distro,
         m_write_rerun_memo,
         m_schedule_jobs,
@@ -230,16 +234,16 @@ class TestScheduleSuite(object):
         build_matrix_output = [
             (build_matrix_desc, build_matrix_frags),
         ]
-        m_build_matrix.return_value = build_matrix_output
+        m_iterate_matrix.return_value = build_matrix_output
         frag1_read_output = 'field1: val1'
         frag2_read_output = 'field2: val2'
         m_open.side_effect = [
-            StringIO(frag1_read_output),
-            StringIO(frag2_read_output),
+            contextlib.closing(StringIO(frag1_read_output)),
+            contextlib.closing(StringIO(frag2_read_output)),
             contextlib.closing(StringIO())
         ]
         m_get_install_task_flavor.return_value = 'basic'
-        m_get_package_versions.return_value = dict()
+        m_get_package_versions_for_distros.return_value = dict()
         m_has_packages_for_distro.return_value = True
         # schedule_jobs() is just neutered; check calls below
 
@@ -265,6 +269,7 @@ class TestScheduleSuite(object):
                 build_matrix_frags[1],
             ],
             desc=os.path.join(self.args.suite, build_matrix_desc),
+            fragment_paths=build_matrix_frags,
         )
 
         m_schedule_jobs.assert_has_calls(
@@ -275,10 +280,11 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.util.find_git_parent')
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.util.has_packages_for_distro')
-    @patch('teuthology.suite.util.get_package_versions')
+    @patch('teuthology.suite.util.get_package_versions_for_distros')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.open', create=True)
-    @patch('teuthology.suite.run.build_matrix')
+    @patch('teuthology.suite.run.iterate_matrix')
+    @patch('teuthology.suite.run.get_suite_cache', lambda path: None)
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
     @patch('teuthology.suite.util.git_validate_sha1')
@@ -289,10 +295,10 @@ class TestScheduleSuite(object):
         m_git_validate_sha1,
         m_package_version_for_hash,
         m_git_ls_remote,
-        m_build_matrix,
+        m_iterate_matrix,
         m_open,
         m_get_install_task_flavor,
-        m_get_package_versions,
+        m_get_package_versions_for_distros,
         m_has_packages_for_distro,
         m_schedule_jobs,
         m_find_git_parent,
@@ -306,10 +312,11 @@ class TestScheduleSuite(object):
         build_matrix_output = [
             (build_matrix_desc, build_matrix_frags),
         ]
-        m_build_matrix.return_value = build_matrix_output
-        m_open.side_effect = [StringIO('field: val\n') for i in range(11)]
+        m_iterate_matrix.return_value = build_matrix_output
+        # the fragment is only read and parsed once, despite backtracking
+        m_open.side_effect = [contextlib.closing(StringIO('field: val\n'))]
         m_get_install_task_flavor.return_value = 'basic'
-        m_get_package_versions.return_value = dict()
+        m_get_package_versions_for_distros.return_value = dict()
         m_has_packages_for_distro.side_effect = [
             False for i in range(11)
         ]
@@ -330,10 +337,11 @@ class TestScheduleSuite(object):
     @patch('teuthology.suite.run.Run.schedule_jobs')
     @patch('teuthology.suite.run.Run.write_rerun_memo')
     @patch('teuthology.suite.util.has_packages_for_distro')
-    @patch('teuthology.suite.util.get_package_versions')
+    @patch('teuthology.suite.util.get_package_versions_for_distros')
     @patch('teuthology.suite.util.get_install_task_flavor')
     @patch('__builtin__.open', create=True)
-    @patch('teuthology.suite.run.build_matrix')
+    @patch('teuthology.suite.run.iterate_matrix')
+    @patch('teuthology.suite.run.get_suite_cache', lambda path: None)
     @patch('teuthology.suite.util.git_ls_remote')
     @patch('teuthology.suite.util.package_version_for_hash')
     @patch('teuthology.suite.util.git_validate_sha1')
@@ -344,10 +352,10 @@ class TestScheduleSuite(object):
         m_git_validate_sha1,
         m_package_version_for_hash,
         m_git_ls_remote,
-        m_build_matrix,
+        m_iterate_matrix,
         m_open,
         m_get_install_task_flavor,
-        m_get_package_versions,
+        m_get_package_versions_for_distros,
         m_has_packages_for_distro,
         m_write_rerun_memo,
         m_schedule_jobs,
@@ -365,14 +373,14 @@ class TestScheduleSuite(object):
         build_matrix_output = [
             (build_matrix_desc, build_matrix_frags),
         ]
-        m_build_matrix.return_value = build_matrix_output
+        m_iterate_matrix.return_value = build_matrix_output
+        # the fragment is only read and parsed once, despite backtracking
         m_open.side_effect = [
-            StringIO('field: val\n') for i in range(NUM_FAILS+1)
-        ] + [
-            contextlib.closing(StringIO())
-        ] 
+            contextlib.closing(StringIO('field: val\n')),
+            contextlib.closing(StringIO()),
+        ]
         m_get_install_task_flavor.return_value = 'basic'
-        m_get_package_versions.return_value = dict()
+        m_get_package_versions_for_distros.return_value = dict()
         # NUM_FAILS, then success
         m_has_packages_for_distro.side_effect = \
             [False for i in range(NUM_FAILS)] + [True]
@@ -391,3 +399,131 @@ class TestScheduleSuite(object):
         m_find_git_parent.assert_has_calls(
             [call('ceph', 'ceph_sha1' + i * '^') for i in range(NUM_FAILS)]
         )
+
+
+class TestParseFragments(object):
+    fragments = [
+        'overrides:\n  ceph:\n    log-whitelist: [a]\ntasks:\n- install:\n',
+        '# nothing but a comment\n',
+        'roles:\n- [mon.a, osd.0]\n',
+        'overrides:\n  ceph:\n    conf: {osd: {debug osd: 20}}\n',
+        'tasks:\n- ceph:\n- workunit: {clients: {all: [x.sh]}}\n',
+    ]
+
+    def setup(self):
+        self.temp_path = tempfile.mkdtemp(prefix='test_parse_fragments-')
+        self.runobj = run.Run.__new__(run.Run)
+        self.runobj.suite_cache = None
+        self.runobj.fragments = dict()
+
+    def teardown(self):
+        shutil.rmtree(self.temp_path)
+
+    def write_fragments(self, contents):
+        paths = []
+        for i, content in enumerate(contents):
+            path = os.path.join(self.temp_path, '%d.yaml' % i)
+            with open(path, 'w') as f:
+                f.write(content)
+            paths.append(path)
+        return paths
+
+    def test_same_as_concatenation(self):
+        paths = self.write_fragments(self.fragments)
+        for i in range(len(paths)):
+            for subset in (paths[i:], paths[:i] + paths[i + 1:]):
+                expected = yaml.safe_load('\n'.join(
+                    [open(path).read() for path in subset]))
+                assert self.runobj.parse_fragments(subset) == expected
+
+    def test_parsed_once(self):
+        paths = self.write_fragments(self.fragments)
+        with patch.object(run, 'load_fragment',
+                          wraps=run.load_fragment) as m_load_fragment:
+            first = self.runobj.parse_fragments(paths)
+            first['tasks'].append('modified')
+            second = self.runobj.parse_fragments(paths)
+        assert m_load_fragment.call_count == len(paths)
+        assert 'modified' not in second['tasks']
+
+    def test_anchor_across_fragments(self):
+        paths = self.write_fragments([
+            'roles: &roles\n- [mon.a]\n',
+            'more_roles: *roles\n',
+        ])
+        assert self.runobj.parse_fragments(paths) == dict(
+            roles=[['mon.a']], more_roles=[['mon.a']])
+
+    def test_all_empty(self):
+        paths = self.write_fragments(['', '# comment\n'])
+        assert self.runobj.parse_fragments(paths) is None
+
+    def test_merge_configs(self):
+        paths = self.write_fragments(self.fragments)
+        paths.insert(1, os.path.join(self.temp_path, 'missing.yaml'))
+        expected = merge_configs(paths)
+        first = self.runobj.merge_configs(paths)
+        assert first == expected
+        first['tasks'].append('modified')
+        assert self.runobj.merge_configs(paths) == expected
+
+    def test_merge_configs_unparseable(self):
+        paths = self.write_fragments(['roles: &roles\n- [mon.a]\n',
+                                      'more_roles: *roles\n'])
+        assert self.runobj.merge_configs(paths) is None
+
+
+class TestScheduleJobs(object):
+    def setup(self):
+        self.runobj = run.Run.__new__(run.Run)
+        self.runobj.args = YamlConfig.from_dict(dict(
+            dry_run=False, verbose=0, throttle=None))
+        self.runobj.base_yaml_paths = []
+        self.runobj.suite_cache = None
+        self.runobj.fragments = dict()
+        self.runobj.beanstalk = None
+
+    def make_jobs(self, count):
+        return [dict(desc='job%d' % i, args=['--description', 'job%d' % i],
+                     fragment_paths=[]) for i in range(count)]
+
+    @patch('teuthology.suite.util.teuthology_schedule_jobs')
+    @patch('teuthology.beanstalk.connect')
+    def test_batch(self, m_connect, m_teuthology_schedule_jobs):
+        self.runobj.schedule_jobs([], self.make_jobs(3), 'name')
+        m_teuthology_schedule_jobs.assert_called_once_with(
+            [(['--description', 'job%d' % i], dict()) for i in range(3)],
+            connection=m_connect.return_value,
+        )
+
+    @patch('teuthology.suite.util.teuthology_schedule_jobs')
+    @patch('teuthology.beanstalk.connect')
+    def test_failure_disconnects(self, m_connect,
+                                 m_teuthology_schedule_jobs):
+        m_teuthology_schedule_jobs.side_effect = RuntimeError('lost')
+        with pytest.raises(RuntimeError):
+            self.runobj.schedule_jobs([], self.make_jobs(3), 'name')
+        m_connect.return_value.close.assert_called_once_with()
+        assert self.runobj.beanstalk is None
+
+    @patch('teuthology.suite.run.time.sleep')
+    @patch('teuthology.suite.util.teuthology_schedule')
+    @patch('teuthology.beanstalk.connect')
+    def test_throttle_one_connection(self, m_connect, m_teuthology_schedule,
+                                     m_sleep):
+        self.runobj.args.throttle = '3'
+        self.runobj.schedule_jobs([], self.make_jobs(3), 'name')
+        m_connect.assert_called_once_with()
+        assert m_teuthology_schedule.call_count == 3
+        assert m_sleep.call_count == 3
+        for call_ in m_teuthology_schedule.call_args_list:
+            assert call_[1]['connection'] is m_connect.return_value
+            assert call_[1]['conf_dict'] == dict()
+
+    @patch('teuthology.suite.util.teuthology_schedule')
+    @patch('teuthology.beanstalk.connect')
+    def test_dry_run_does_not_connect(self, m_connect, m_teuthology_schedule):
+        self.runobj.args.dry_run = True
+        self.runobj.schedule_jobs([], self.make_jobs(1), 'name')
+        m_connect.assert_not_called()
+        assert m_teuthology_schedule.call_args[1]['connection'] is None
@@ -3,7 +3,7 @@ import pytest
 import tempfile
 
 from copy import deepcopy
-from mock import Mock, patch
+from mock import Mock, call, patch
 
 from teuthology.config import config
 from teuthology.orchestra.opsys import OS
@@ -145,6 +145,52 @@ class TestUtil(object):
         assert len(m_requests_get.mock_calls) == 2
         assert parent_sha1 == 'sha1_p'
 
+    @patch('teuthology.schedule.report')
+    def test_teuthology_schedule(self, m_report):
+        connection = Mock()
+        connection.put.side_effect = [1, 2]
+        args = ['--name', 'run', '--worker', 'smithi', '--num', '2',
+                '--description', 'a job', '--']
+        util.teuthology_schedule(
+            args, verbose=0, dry_run=False, connection=connection,
+            conf_dict=dict(roles=[['mon.a']]),
+        )
+        connection.use.assert_called_once_with('smithi')
+        assert connection.put.call_count == 2
+        job_configs = m_report.try_push_jobs_info.call_args[0][0]
+        assert [job['job_id'] for job in job_configs] == ['1', '2']
+        assert job_configs[0]['description'] == 'a job'
+        assert job_configs[0]['roles'] == [['mon.a']]
+        assert 'tube' not in job_configs[0]
+
+    @patch('teuthology.schedule.report')
+    def test_teuthology_schedule_jobs(self, m_report):
+        connection = Mock()
+        connection.put.side_effect = range(1, 4)
+        jobs = [
+            (['--name', 'run', '--worker', worker, '--description', desc,
+              '--'], dict(roles=[[desc]]))
+            for worker, desc in (('smithi', 'a'), ('smithi', 'b'),
+                                 ('mira', 'c'))
+        ]
+        job_ids = util.teuthology_schedule_jobs(jobs, connection=connection)
+        assert job_ids == ['1', '2', '3']
+        assert connection.use.call_args_list == [
+            call('smithi'), call('mira')]
+        job_configs = m_report.try_push_jobs_info.call_args[0][0]
+        assert [job['roles'] for job in job_configs] == [
+            [['a']], [['b']], [['c']]]
+
+    @patch('teuthology.schedule.main')
+    def test_teuthology_schedule_dry_run(self, m_main):
+        args = ['--name', 'run', '--dry-run', '--description', 'a job']
+        util.teuthology_schedule(list(args), verbose=1, dry_run=True)
+        m_main.assert_not_called()
+        util.teuthology_schedule(list(args), verbose=2, dry_run=True)
+        schedule_args = m_main.call_args[0][0]
+        assert schedule_args['--dry-run']
+        assert schedule_args['--description'] == 'a job'
+
 
 class TestFlavor(object):
 
@@ -302,6 +348,46 @@ class TestMissingPackages(object):
             "basic",)
         assert not result
 
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_package_versions_for_distros(self, m_package_version_for_hash):
+        def package_version_for_hash(sha1, flavor, distro, distro_version):
+            if distro == 'centos':
+                return None
+            return '%s-%s-%s' % (distro, distro_version, flavor)
+        m_package_version_for_hash.side_effect = package_version_for_hash
+        distros = [('ubuntu', '14.04', 'basic'), ('rhel', '7.0', 'basic'),
+                   ('rhel', '7.0', 'notcmalloc'), ('centos', '7', 'basic')]
+        result = util.get_package_versions_for_distros(
+            "sha1", distros, package_versions=self.pv)
+        # ubuntu was already known
+        assert m_package_version_for_hash.call_count == 3
+        assert result['sha1']['ubuntu'] == {'14.04': {'basic': '1.0'}}
+        assert result['sha1']['rhel'] == {
+            '7.0': {'basic': 'rhel-7.0-basic',
+                    'notcmalloc': 'rhel-7.0-notcmalloc'}}
+        for distro in distros:
+            assert util.has_packages_for_distro(
+                "sha1", *distro, package_versions=result) == \
+                (distro[0] != 'centos')
+
+    @patch("teuthology.suite.util.package_version_for_hash")
+    def test_package_versions_for_distros_cache(
+            self, m_package_version_for_hash):
+        m_package_version_for_hash.return_value = None
+        cache = Mock()
+        cache.make_key.side_effect = lambda *args: '/'.join(args)
+        cache.get.side_effect = lambda key: (
+            'cached' if key.endswith('/rhel/7.0/basic') else None)
+        result = util.get_package_versions_for_distros(
+            "sha1", [('rhel', '7.0', 'basic'), ('centos', '7', 'basic')],
+            cache=cache)
+        m_package_version_for_hash.assert_called_once_with(
+            "sha1", "basic", distro="centos", distro_version="7")
+        assert result['sha1']['rhel']['7.0']['basic'] == 'cached'
+        assert result['sha1']['centos']['7']['basic'] is None
+        stored = cache.update.call_args[0][0]
+        assert list(stored.values()) == [None]
+
 
 class TestDistroDefaults(object):
     def setup(self):
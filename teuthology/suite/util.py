@@ -1,10 +1,10 @@
 import copy
+import gevent.pool
 import logging
 import os
 import requests
 import smtplib
 import socket
-import subprocess
 import sys
 
 from email.mime.text import MIMEText
@@ -14,7 +14,9 @@ import teuthology.lock.util
 from teuthology import repo_utils
 
 from teuthology.config import config
-from teuthology.exceptions import BranchNotFoundError, ScheduleFailError
+from teuthology.exceptions import (
+    BranchNotFoundError, ScheduleFailError, VersionNotFoundError
+)
 from teuthology.misc import deep_merge
 from teuthology.repo_utils import fetch_qa_suite, fetch_teuthology
 from teuthology.orchestra.opsys import OS
@@ -389,6 +391,74 @@ def get_package_versions(sha1, os_type, os_version, flavor,
     return package_versions
 
 
+def get_package_versions_for_distros(sha1, distros, package_versions=None,
+                                    cache=None, workers=8):
+    """
+    Like get_package_versions(), but for several distros and flavors at once.
+
+    Versions that are in neither package_versions nor cache are retrieved
+    concurrently, using at most workers connections.
+
+    :param sha1:             The sha1 hash of the ceph version.
+    :param distros:          An iterable of (os_type, os_version, flavor)
+                             tuples
+    :param package_versions: Use this optionally to use cached results of
+                             previous calls to gitbuilder.
+    :param cache:            An optional PackageVersionCache, to share
+                             results with other teuthology-suite invocations.
+    :param workers:          How many versions to retrieve at once.
+    :returns:                The package_versions dict, updated.
+    """
+    if package_versions is None:
+        package_versions = dict()
+    project = get_builder_project().__name__
+
+    found = dict()
+    to_fetch = set()
+    for os_type, os_version, flavor in distros:
+        os_type = str(os_type)
+        flavors = package_versions.get(sha1, dict()).get(
+            os_type, dict()).get(os_version, dict())
+        if flavor in flavors:
+            continue
+        distro = (os_type, os_version, flavor)
+        version = None
+        if cache is not None:
+            version = cache.get(cache.make_key(project, sha1, *distro))
+        if version:
+            found[distro] = version
+        else:
+            to_fetch.add(distro)
+
+    def fetch(distro):
+        os_type, os_version, flavor = distro
+        try:
+            version = package_version_for_hash(
+                sha1,
+                flavor,
+                distro=os_type,
+                distro_version=os_version,
+            )
+        except VersionNotFoundError:
+            version = None
+        return distro, version
+
+    if to_fetch:
+        pool = gevent.pool.Pool(workers)
+        fetched = dict(pool.imap_unordered(fetch, sorted(to_fetch)))
+        if cache is not None:
+            cache.update(dict(
+                (cache.make_key(project, sha1, *distro), version)
+                for distro, version in fetched.items()
+            ))
+        found.update(fetched)
+
+    for (os_type, os_version, flavor), version in found.items():
+        package_versions.setdefault(sha1, dict()).setdefault(
+            os_type, dict()).setdefault(os_version, dict())[flavor] = version
+    return package_versions
+
+
 def has_packages_for_distro(sha1, os_type, os_version, flavor,
                             package_versions=None):
     """
@@ -417,15 +487,24 @@ def has_packages_for_distro(sha1, os_type, os_version, flavor,
     return bool(flavors.get(flavor, None))
 
 
-def teuthology_schedule(args, verbose, dry_run, log_prefix=''):
+def teuthology_schedule(args, verbose, dry_run, log_prefix='',
+                        connection=None, conf_dict=None):
     """
-    Run teuthology-schedule to schedule individual jobs.
+    Schedule an individual job, as teuthology-schedule would.
+
+    The job is scheduled in-process; running teuthology-schedule for each job
+    would re-import teuthology, re-read its config and reconnect to beanstalk
+    every time.
 
     If --dry-run has been passed but --verbose has been passed just once, don't
-    actually run the command - only print what would be executed.
+    actually schedule anything - only print the command that would be executed.
 
     If --dry-run has been passed and --verbose has been passed multiple times,
     do both.
+
+    :param args:       The arguments to teuthology-schedule
+    :param connection: A beanstalk connection to share between jobs
+    :param conf_dict:  The already-merged contents of the job's config files
     """
     exec_path = os.path.join(
         os.path.dirname(sys.argv[0]),
@@ -445,7 +524,34 @@ def teuthology_schedule(args, verbose, dry_run, log_prefix=''):
             ' '.join(printable_args),
         ))
     if not dry_run or (dry_run and verbose > 1):
-        subprocess.check_call(args=args)
+        # Imported here since teuthology.schedule needs beanstalkc, which is
+        # only required when jobs are actually scheduled
+        import teuthology.schedule
+        schedule_args = teuthology.schedule.parse_args(args[1:])
+        teuthology.schedule.main(
+            schedule_args, connection=connection, conf_dict=conf_dict)
+
+
+def teuthology_schedule_jobs(jobs, connection=None):
+    """
+    Schedule several jobs as teuthology_schedule() would schedule each of
+    them, but putting them into beanstalk and reporting them to the results
+    server in bulk. This is never a dry run.
+
+    :param jobs:       A list of (args, conf_dict) tuples, as would be passed
+                       to teuthology_schedule()
+    :param connection: The beanstalk connection to use
+    :returns:          The list of scheduled job ids
+    """
+    import teuthology.schedule
+    job_configs = []
+    for args, conf_dict in jobs:
+        schedule_args = teuthology.schedule.parse_args(args)
+        teuthology.schedule.check_args(schedule_args)
+        job_config = teuthology.schedule.build_config(
+            schedule_args, conf_dict)
+        job_configs.extend([job_config] * int(schedule_args['--num']))
+    return teuthology.schedule.schedule_jobs(job_configs, connection)
 
 
 def find_git_parent(project, sha1):
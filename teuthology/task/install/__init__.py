@@ -7,6 +7,7 @@ import yaml
 
 from teuthology import misc as teuthology
 from teuthology import contextutil, packaging
+from teuthology.config import config as teuth_config
 from teuthology.parallel import parallel
 from teuthology.task import ansible
 
@@ -75,7 +76,7 @@ def install_packages(ctx, pkgs, config):
         "deb": deb._update_package_list_and_install,
         "rpm": rpm._update_package_list_and_install,
     }
-    with parallel() as p:
+    with parallel(limit=teuth_config.parallel_limit) as p:
         for remote in ctx.cluster.remotes.keys():
             system_type = teuthology.get_system_type(remote)
             p.spawn(
@@ -99,7 +100,7 @@ def remove_packages(ctx, config, pkgs):
         "deb": deb._remove,
         "rpm": rpm._remove,
     }
-    with parallel() as p:
+    with parallel(limit=teuth_config.parallel_limit) as p:
         for remote in ctx.cluster.remotes.keys():
             system_type = teuthology.get_system_type(remote)
             p.spawn(remove_pkgs[
@@ -117,7 +118,7 @@ def remove_sources(ctx, config):
         'deb': deb._remove_sources_list,
         'rpm': rpm._remove_sources_list,
     }
-    with parallel() as p:
+    with parallel(limit=teuth_config.parallel_limit) as p:
         project = config.get('project', 'ceph')
         log.info("Removing {proj} sources lists".format(
             proj=project))
@@ -4,6 +4,7 @@ import yaml
 import os
 
 from teuthology import packaging
+from teuthology.config import config as teuth_config
 from teuthology.orchestra import run
 from teuthology.parallel import parallel
 
@@ -62,7 +63,7 @@ def install(ctx, config):
         log.info("%s is a supported version", version)
     else:
         raise RuntimeError("Unsupported RH Ceph version %s", version)
-    with parallel() as p:
+    with parallel(limit=teuth_config.parallel_limit) as p:
         for remote in ctx.cluster.remotes.keys():
             if remote.os.name == 'rhel':
                 log.info("Installing on RHEL node: %s", remote.shortname)
@@ -78,7 +79,7 @@ def install(ctx, config):
         if config.get('skip_uninstall'):
             log.info("Skipping uninstall of Ceph")
         else:
-            with parallel() as p:
+            with parallel(limit=teuth_config.parallel_limit) as p:
                 for remote in ctx.cluster.remotes.keys():
                     p.spawn(uninstall_pkgs, ctx, remote, downstream_config)
 
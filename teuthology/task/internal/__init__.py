@@ -166,9 +166,16 @@ def connect(ctx, config):
     Connect to all remotes in ctx.cluster
     """
     log.info('Opening connections...')
-    for rem in ctx.cluster.remotes.keys():
-        log.debug('connecting to %s', rem.name)
-        rem.connect()
+    timings = ctx.cluster.connect()
+    if timings:
+        slowest = max(timings, key=timings.get)
+        log.info('Connected to %d hosts; slowest was %s (%.1fs)',
+                 len(timings), slowest, timings[slowest])
+    if getattr(ctx, 'archive', None) is not None:
+        with open(os.path.join(ctx.archive, 'connect_times.yaml'), 'w') as f:
+            yaml.safe_dump(timings, f, default_flow_style=False)
+    log.info('Gathering facts...')
+    ctx.cluster.gather_facts()
 
 
 def push_inventory(ctx, config):
@@ -245,7 +252,12 @@ def serialize_remote_roles(ctx, config):
         with open(os.path.join(ctx.archive, 'info.yaml'), 'r+') as info_file:
             info_yaml = yaml.safe_load(info_file)
             info_file.seek(0)
-            info_yaml['cluster'] = dict([(rem.name, {'roles': roles}) for rem, roles in ctx.cluster.remotes.items()])
+            info_yaml['cluster'] = dict()
+            for rem, roles in ctx.cluster.remotes.items():
+                node = {'roles': roles}
+                if getattr(rem, 'facts', None) is not None:
+                    node['facts'] = rem.facts.to_dict()
+                info_yaml['cluster'][rem.name] = node
             yaml.safe_dump(info_yaml, info_file, default_flow_style=False)
 
 
@@ -328,6 +340,70 @@ def fetch_binaries_for_coredumps(path, remote):
             remote.get_file(debug_path, coredump_path)
 
 
+def pull_archive(remote, archive_dir, path, limiter=None, tries=3):
+    """
+    Transfer a remote's archive directory to path, resuming where a failed
+    attempt left off, and pull binaries for any coredumps found.
+
+    Returns a summary of the transfer.
+    """
+    compress = misc.choose_archive_compression(remote, archive_dir)
+    done = dict()
+    start = time.time()
+    for attempt in range(1, tries + 1):
+        try:
+            transferred = misc.pull_directory(
+                remote, archive_dir, path, compress=compress,
+                limiter=limiter, done=done)
+            break
+        except Exception:
+            if attempt == tries:
+                raise
+            log.exception('Transferring archived files from %s failed; '
+                          'resuming after %d files', remote.shortname,
+                          len(done))
+    summary = dict(
+        files=len(done),
+        bytes=sum(done.values()),
+        transferred_bytes=transferred,
+        compression=compress or 'none',
+        attempts=attempt,
+        seconds=round(time.time() - start, 1),
+    )
+    log.info('Transferred %d files (%d bytes) from %s in %ss',
+             summary['files'], summary['bytes'], remote.shortname,
+             summary['seconds'])
+    # Check for coredumps and pull binaries
+    fetch_binaries_for_coredumps(path, remote)
+    return summary
+
+
+def pull_archives(ctx, archive_dir, logdir):
+    """
+    Transfer every remote's archive directory to logdir/<shortname>,
+    concurrently, and write a summary of the transfers to
+    archive_transfer.yaml in the job's archive.
+    """
+    limit = teuth_config.archive_bandwidth_limit
+    limiter = misc.RateLimiter(limit * 1024 * 1024) if limit else None
+    results = ctx.cluster.apply(
+        lambda rem: pull_archive(
+            rem, archive_dir, os.path.join(logdir, rem.shortname), limiter),
+        workers=teuth_config.parallel_limit,
+    )
+    summary = dict(
+        (rem.shortname, result)
+        for rem, result in results.by_remote().items() if result is not None
+    )
+    for rem, exc_info in results.failures.items():
+        log.error('Could not transfer archived files from %s: %s',
+                  rem.shortname, exc_info[1])
+        summary[rem.shortname] = dict(error=str(exc_info[1]))
+    with open(os.path.join(ctx.archive, 'archive_transfer.yaml'), 'w') as f:
+        yaml.safe_dump(summary, f, default_flow_style=False)
+    results.raise_first()
+
+
 @contextlib.contextmanager
 def archive(ctx, config):
     """
@@ -356,11 +432,7 @@ def archive(ctx, config):
             logdir = os.path.join(ctx.archive, 'remote')
             if (not os.path.exists(logdir)):
                 os.mkdir(logdir)
-            for rem in ctx.cluster.remotes.keys():
-                path = os.path.join(logdir, rem.shortname)
-                misc.pull_directory(rem, archive_dir, path)
-                # Check for coredumps and pull binaries
-                fetch_binaries_for_coredumps(path, rem)
+            pull_archives(ctx, archive_dir, logdir)
 
         log.info('Removing archive directory...')
         run.wait(
@@ -446,10 +518,13 @@ def coredump(ctx, config):
 
         # set status = 'fail' if the dir is still there = coredumps were
         # seen
-        for rem in ctx.cluster.remotes.keys():
-            try:
-                rem.sh("test -e " + archive_dir + "/coredump")
-            except run.CommandFailedError:
+        results = ctx.cluster.apply(
+            lambda rem: rem.sh("test -e " + archive_dir + "/coredump"))
+        for rem in results.remotes:
+            if rem in results.failures:
+                if not isinstance(results.failures[rem][1],
+                                  run.CommandFailedError):
+                    results.raise_first()
                 continue
             log.warning('Found coredumps on %s, flagging run as failed', rem)
             set_status(ctx.summary, 'fail')
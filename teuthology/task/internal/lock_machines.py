@@ -3,6 +3,7 @@ import logging
 import time
 import yaml
 
+import teuthology.lock.broker
 import teuthology.lock.ops
 import teuthology.lock.query
 import teuthology.lock.util
@@ -44,106 +45,117 @@ def lock_machines(ctx, config):
 
     all_locked = dict()
     requested = total_requested
-    while True:
-        # get a candidate list of machines
-        machines = teuthology.lock.query.list_locks(machine_type=machine_type, up=True,
-                                                    locked=False, count=requested + reserved)
-        if machines is None:
-            if ctx.block:
-                log.error('Error listing machines, trying again')
-                time.sleep(20)
-                continue
-            else:
-                raise RuntimeError('Error listing machines')
+    # queue up with the other jobs on this host that are waiting for
+    # machines; see teuthology.lock.broker
+    job_id = ctx.config.get('job_id')
+    with teuthology.lock.broker.waiting(
+            machine_type, job_id, total_requested,
+            priority=ctx.config.get('priority'),
+            enabled=ctx.block and job_id is not None) as ticket:
+        while True:
+            ticket.wait_turn()
+            # get a candidate list of machines
+            machines = teuthology.lock.query.list_locks(machine_type=machine_type, up=True,
+                                                        locked=False, count=requested + reserved)
+            if machines is None:
+                if ctx.block:
+                    log.error('Error listing machines, trying again')
+                    ticket.sleep(20)
+                    continue
+                else:
+                    raise RuntimeError('Error listing machines')
+
+            # make sure there are machines for non-automated jobs to run
+            if len(machines) < reserved + requested and ctx.owner.startswith('scheduled'):
+                if ctx.block:
+                    log.info(
+                        'waiting for more %s machines to be free (need %s + %s, have %s)...',
+                        machine_type,
+                        reserved,
+                        requested,
+                        len(machines),
+                    )
+                    ticket.sleep(10)
+                    continue
+                else:
+                    assert 0, ('not enough machines free; need %s + %s, have %s' %
+                               (reserved, requested, len(machines)))
 
-        # make sure there are machines for non-automated jobs to run
-        if len(machines) < reserved + requested and ctx.owner.startswith('scheduled'):
-            if ctx.block:
-                log.info(
-                    'waiting for more %s machines to be free (need %s + %s, have %s)...',
-                    machine_type,
-                    reserved,
-                    requested,
-                    len(machines),
+            try:
+                newly_locked = teuthology.lock.ops.lock_many(ctx, requested, machine_type,
+                                                             ctx.owner, ctx.archive, os_type,
+                                                             os_version, arch)
+            except Exception:
+                # Lock failures should map to the 'dead' status instead of 'fail'
+                set_status(ctx.summary, 'dead')
+                raise
+            all_locked.update(newly_locked)
+            log.info(
+                '{newly_locked} {mtype} machines locked this try, '
+                '{total_locked}/{total_requested} locked so far'.format(
+                    newly_locked=len(newly_locked),
+                    mtype=machine_type,
+                    total_locked=len(all_locked),
+                    total_requested=total_requested,
                 )
-                time.sleep(10)
-                continue
+            )
+            if len(all_locked) == total_requested:
+                # Leave the queue now; waiting for any VMs to come up
+                # shouldn't hold up the jobs behind this one
+                break
+            elif not ctx.block:
+                assert 0, 'not enough machines are available'
             else:
-                assert 0, ('not enough machines free; need %s + %s, have %s' %
-                           (reserved, requested, len(machines)))
+                requested = requested - len(newly_locked)
+                assert requested > 0, "lock_machines: requested counter went" \
+                                      "negative, this shouldn't happen"
 
-        try:
-            newly_locked = teuthology.lock.ops.lock_many(ctx, requested, machine_type,
-                                                         ctx.owner, ctx.archive, os_type,
-                                                         os_version, arch)
-        except Exception:
-            # Lock failures should map to the 'dead' status instead of 'fail'
-            set_status(ctx.summary, 'dead')
-            raise
-        all_locked.update(newly_locked)
-        log.info(
-            '{newly_locked} {mtype} machines locked this try, '
-            '{total_locked}/{total_requested} locked so far'.format(
-                newly_locked=len(newly_locked),
-                mtype=machine_type,
-                total_locked=len(all_locked),
-                total_requested=total_requested,
+            log.info(
+                "{total} machines locked ({new} new); need {more} more".format(
+                    total=len(all_locked), new=len(newly_locked), more=requested)
             )
-        )
-        if len(all_locked) == total_requested:
-            vmlist = []
-            for lmach in all_locked:
-                if teuthology.lock.query.is_vm(lmach):
-                    vmlist.append(lmach)
-            if vmlist:
-                log.info('Waiting for virtual machines to come up')
-                keys_dict = dict()
-                loopcount = 0
-                while len(keys_dict) != len(vmlist):
-                    loopcount += 1
-                    time.sleep(10)
-                    keys_dict = misc.ssh_keyscan(vmlist)
-                    log.info('virtual machine is still unavailable')
-                    if loopcount == 40:
-                        loopcount = 0
-                        log.info('virtual machine(s) still not up, ' +
-                                 'recreating unresponsive ones.')
-                        for guest in vmlist:
-                            if guest not in keys_dict.keys():
-                                log.info('recreating: ' + guest)
-                                full_name = misc.canonicalize_hostname(guest)
-                                provision.destroy_if_vm(ctx, full_name)
-                                provision.create_if_vm(ctx, full_name)
-                if teuthology.lock.ops.do_update_keys(keys_dict)[0]:
-                    log.info("Error in virtual machine keys")
-                newscandict = {}
-                for dkey in all_locked.keys():
-                    stats = teuthology.lock.query.get_status(dkey)
-                    newscandict[dkey] = stats['ssh_pub_key']
-                ctx.config['targets'] = newscandict
-            else:
-                ctx.config['targets'] = all_locked
-            locked_targets = yaml.safe_dump(
-                ctx.config['targets'],
-                default_flow_style=False
-            ).splitlines()
-            log.info('\n  '.join(['Locked targets:', ] + locked_targets))
-            # successfully locked machines, change status back to running
-            report.try_push_job_info(ctx.config, dict(status='running'))
-            break
-        elif not ctx.block:
-            assert 0, 'not enough machines are available'
-        else:
-            requested = requested - len(newly_locked)
-            assert requested > 0, "lock_machines: requested counter went" \
-                                  "negative, this shouldn't happen"
+            log.warn('Could not lock enough machines, waiting...')
+            ticket.sleep(10)
 
-        log.info(
-            "{total} machines locked ({new} new); need {more} more".format(
-                total=len(all_locked), new=len(newly_locked), more=requested)
-        )
-        log.warn('Could not lock enough machines, waiting...')
-        time.sleep(10)
+    vmlist = []
+    for lmach in all_locked:
+        if teuthology.lock.query.is_vm(lmach):
+            vmlist.append(lmach)
+    if vmlist:
+        log.info('Waiting for virtual machines to come up')
+        keys_dict = dict()
+        loopcount = 0
+        while len(keys_dict) != len(vmlist):
+            loopcount += 1
+            time.sleep(10)
+            keys_dict = misc.ssh_keyscan(vmlist)
+            log.info('virtual machine is still unavailable')
+            if loopcount == 40:
+                loopcount = 0
+                log.info('virtual machine(s) still not up, ' +
+                         'recreating unresponsive ones.')
+                for guest in vmlist:
+                    if guest not in keys_dict.keys():
+                        log.info('recreating: ' + guest)
+                        full_name = misc.canonicalize_hostname(guest)
+                        provision.destroy_if_vm(ctx, full_name)
+                        provision.create_if_vm(ctx, full_name)
+        if teuthology.lock.ops.do_update_keys(keys_dict)[0]:
+            log.info("Error in virtual machine keys")
+        newscandict = {}
+        for dkey in all_locked.keys():
+            stats = teuthology.lock.query.get_status(dkey)
+            newscandict[dkey] = stats['ssh_pub_key']
+        ctx.config['targets'] = newscandict
+    else:
+        ctx.config['targets'] = all_locked
+    locked_targets = yaml.safe_dump(
+        ctx.config['targets'],
+        default_flow_style=False
+    ).splitlines()
+    log.info('\n  '.join(['Locked targets:', ] + locked_targets))
+    # successfully locked machines, change status back to running
+    report.try_push_job_info(ctx.config, dict(status='running'))
     try:
         yield
     finally:
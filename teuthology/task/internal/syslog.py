@@ -41,19 +41,21 @@ def syslog(ctx, config):
         '*.*;kern.none -{misc_log};RSYSLOG_FileFormat'.format(
             misc_log=misc_log),
     ]
-    conf_fp = BytesIO('\n'.join(conf_lines).encode())
+    conf_data = '\n'.join(conf_lines).encode()
+
+    def setup_remote(rem):
+        log_context = 'system_u:object_r:var_log_t:s0'
+        for log_path in (kern_log, misc_log):
+            rem.run(args=['install', '-m', '666', '/dev/null', log_path])
+            rem.chcon(log_path, log_context)
+        misc.sudo_write_file(
+            remote=rem,
+            path=CONF,
+            data=BytesIO(conf_data),
+        )
+
     try:
-        for rem in ctx.cluster.remotes.keys():
-            log_context = 'system_u:object_r:var_log_t:s0'
-            for log_path in (kern_log, misc_log):
-                rem.run(args=['install', '-m', '666', '/dev/null', log_path])
-                rem.chcon(log_path, log_context)
-            misc.sudo_write_file(
-                remote=rem,
-                path=CONF,
-                data=conf_fp,
-            )
-            conf_fp.seek(0)
+        ctx.cluster.apply(setup_remote).raise_first()
         run.wait(
             ctx.cluster.run(
                 args=[
@@ -1,4 +1,13 @@
+import os
+import shutil
+import tempfile
+import yaml
+
+from mock import patch, Mock
+
 from teuthology.config import FakeNamespace
+from teuthology.orchestra.cluster import Cluster
+from teuthology.orchestra.remote import RemoteFacts
 from teuthology.task import internal
 
 
@@ -55,3 +64,61 @@ class TestInternal(object):
         assert internal.buildpackages_prep(self.ctx,
                                            self.ctx.config) == internal.BUILDPACKAGES_REMOVED
         assert self.ctx.config == {'tasks': []}
+
+    @patch('teuthology.task.internal.fetch_binaries_for_coredumps')
+    @patch('teuthology.misc.choose_archive_compression')
+    @patch('teuthology.misc.pull_directory')
+    def test_pull_archives(self, m_pull_directory, m_choose, m_fetch):
+        self.ctx.archive = tempfile.mkdtemp(prefix='test_internal-')
+        remotes = [Mock(shortname='host%d' % i) for i in range(2)]
+        for remote in remotes:
+            remote.name = remote.shortname
+        self.ctx.cluster = Cluster(remotes=[(r, []) for r in remotes])
+        m_choose.return_value = 'gz'
+        calls = []
+
+        def pull(remote, remotedir, localdir, compress, limiter, done):
+            calls.append((remote.shortname, dict(done)))
+            done['./%s.log' % len(calls)] = 10
+            if len(calls) == 1:
+                raise IOError('connection lost')
+            return 5
+
+        m_pull_directory.side_effect = pull
+        try:
+            internal.pull_archives(self.ctx, '/archive', self.ctx.archive)
+            # the failed transfer was resumed
+            assert calls[1] == ('host0', {'./1.log': 10})
+            with open(os.path.join(
+                    self.ctx.archive, 'archive_transfer.yaml')) as f:
+                summary = yaml.safe_load(f)
+            assert summary['host0']['attempts'] == 2
+            assert summary['host0']['bytes'] == 20
+            assert summary['host1']['files'] == 1
+            assert summary['host1']['compression'] == 'gz'
+        finally:
+            shutil.rmtree(self.ctx.archive)
+
+    def test_serialize_remote_roles(self):
+        self.ctx.archive = tempfile.mkdtemp(prefix='test_internal-')
+        with_facts = Mock()
+        with_facts.name = 'user@host0'
+        with_facts.facts = RemoteFacts(hostname='host0', arch='x86_64')
+        without_facts = Mock(facts=None)
+        without_facts.name = 'user@host1'
+        self.ctx.cluster = Cluster(remotes=[
+            (with_facts, ['mon.a']), (without_facts, ['osd.0']),
+        ])
+        info_path = os.path.join(self.ctx.archive, 'info.yaml')
+        with open(info_path, 'w') as f:
+            yaml.safe_dump(dict(name='job'), f)
+        try:
+            internal.serialize_remote_roles(self.ctx, dict())
+            with open(info_path) as f:
+                info = yaml.safe_load(f)
+            assert info['name'] == 'job'
+            assert info['cluster']['user@host0']['roles'] == ['mon.a']
+            assert info['cluster']['user@host0']['facts']['arch'] == 'x86_64'
+            assert info['cluster']['user@host1'] == dict(roles=['osd.0'])
+        finally:
+            shutil.rmtree(self.ctx.archive)
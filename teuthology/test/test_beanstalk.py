@@ -0,0 +1,167 @@
+import beanstalkc
+import yaml
+
+from mock import Mock, patch
+from StringIO import StringIO
+
+from teuthology import beanstalk
+
+
+class TestPutJobs(object):
+    def make_connection(self, responses):
+        connection = beanstalkc.Connection.__new__(beanstalkc.Connection)
+        connection._socket = Mock()
+        connection._socket_file = StringIO(responses)
+        return connection
+
+    def test_pipelined(self):
+        connection = self.make_connection(
+            'USING a\r\nINSERTED 1\r\nINSERTED 2\r\n'
+            'USING b\r\nINSERTED 3\r\n'
+        )
+        jobs = [('a', 'one', 10, 60), ('a', 'two', 10, 60),
+                ('b', 'three', 20, 60)]
+        assert beanstalk.put_jobs(connection, jobs) == [1, 2, 3]
+        # everything was sent before any response was read
+        connection._socket.sendall.assert_called_once_with(
+            'use a\r\nput 10 0 60 3\r\none\r\nput 10 0 60 3\r\ntwo\r\n'
+            'use b\r\nput 20 0 60 5\r\nthree\r\n'
+        )
+
+    def test_batches(self):
+        connection = self.make_connection(
+            'USING a\r\n' + ''.join('INSERTED %d\r\n' % i for i in range(5))
+        )
+        jobs = [('a', 'job', 1, 60)] * 5
+        assert beanstalk.put_jobs(connection, jobs, batch_size=2) == \
+            list(range(5))
+        assert connection._socket.sendall.call_count == 3
+
+    def test_failed_put(self):
+        connection = self.make_connection(
+            'USING a\r\nINSERTED 1\r\nJOB_TOO_BIG\r\nINSERTED 3\r\n'
+        )
+        results = beanstalk.put_jobs(connection, [('a', 'job', 1, 60)] * 3)
+        assert results[0] == 1
+        assert isinstance(results[1], beanstalkc.CommandFailed)
+        assert results[2] == 3
+
+    def test_connection_lost(self):
+        # the connection drops after the first job was put
+        connection = self.make_connection('USING a\r\nINSERTED 1\r\n')
+        results = beanstalk.put_jobs(connection, [('a', 'job', 1, 60)] * 3)
+        assert results[0] == 1
+        assert isinstance(results[1], beanstalkc.SocketError)
+        assert results[2] is results[1]
+        # it can't be used any further
+        connection._socket.close.assert_called_once_with()
+
+    def test_serial_fallback(self):
+        connection = Mock()
+        connection.put.side_effect = [
+            1, beanstalkc.CommandFailed('put', 'DRAINING', [])]
+        results = beanstalk.put_jobs(
+            connection, [('a', 'one', 1, 60), ('a', 'two', 1, 60)])
+        connection.use.assert_called_once_with('a')
+        assert results[0] == 1
+        assert isinstance(results[1], beanstalkc.CommandFailed)
+
+
+def yaml_response(status, body, *args):
+    return '%s %s\r\n%s\r\n' % (
+        ' '.join((status,) + args), len(body), body)
+
+
+class TestPeekJobs(object):
+    job_body = (
+        'description: a/very/long/description/that/is/wrapped/across/'
+        'several\n  lines/by/yaml.safe_dump\n'
+        'name: run-%d\npriority: %d\n'
+        'tasks:\n- install: null\n- ceph: {conf: {osd: {debug: 20}}}\n'
+        'tube: smithi\n'
+    )
+
+    def stats_job(self, job_id, tube, state='ready', pri=100):
+        return yaml_response(
+            'OK', '---\nid: %d\ntube: %s\nstate: %s\npri: %d\n' % (
+                job_id, tube, state, pri))
+
+    def make_connection(self, responses):
+        connection = beanstalkc.Connection.__new__(beanstalkc.Connection)
+        connection._socket = Mock()
+        connection._socket_file = StringIO(''.join(responses))
+        connection._parse_yaml = yaml.safe_load
+        return connection
+
+    def test_peek(self):
+        # job 2 is in another tube; 3 is reserved; 1 was deleted
+        responses = [
+            yaml_response('OK', '---\ncurrent-jobs-ready: 2\n'),
+            yaml_response('OK', '---\ntotal-jobs: 4\n'),
+            'USING smithi\r\n',
+            yaml_response('FOUND', self.job_body % (4, 10), '4'),
+            self.stats_job(4, 'smithi', pri=10),
+            self.stats_job(3, 'smithi', state='reserved'),
+            self.stats_job(2, 'mira'),
+            'NOT_FOUND\r\n',
+            self.stats_job(5, 'smithi', pri=5),
+            'NOT_FOUND\r\n',
+            'NOT_FOUND\r\n',
+            'NOT_FOUND\r\n',
+            yaml_response('FOUND', self.job_body % (5, 5), '5'),
+            yaml_response('FOUND', self.job_body % (4, 10), '4'),
+        ]
+        connection = self.make_connection(responses)
+        processor = beanstalk.JobProcessor()
+        beanstalk.peek_jobs(connection, 'smithi', processor,
+                            fields=['priority', 'description'],
+                            batch_size=4)
+        assert list(processor.jobs) == ['5', '4']
+        job_config = processor.jobs['4']['job_config']
+        assert job_config == dict(
+            name='run-4', priority=10,
+            description='a/very/long/description/that/is/wrapped/across/'
+                        'several lines/by/yaml.safe_dump',
+        )
+        assert not processor.jobs['4']['job_obj'].reserved
+        sent = ''.join(
+            c[0][0] for c in connection._socket.sendall.call_args_list)
+        assert 'reserve' not in sent
+
+    def test_job_gone_during_scan(self):
+        # two jobs were ready, but 99 was reserved before its stats were
+        # asked for
+        responses = [
+            yaml_response('OK', '---\ncurrent-jobs-ready: 2\n'),
+            yaml_response('OK', '---\ntotal-jobs: 100\n'),
+            'USING smithi\r\n',
+            yaml_response('FOUND', self.job_body % (100, 10), '100'),
+            self.stats_job(100, 'smithi', pri=10),
+            'NOT_FOUND\r\n',
+            'NOT_FOUND\r\n',
+            'NOT_FOUND\r\n',
+            # the count is looked up again after a batch of missing ids
+            yaml_response('OK', '---\ncurrent-jobs-ready: 1\n'),
+            yaml_response('FOUND', self.job_body % (100, 10), '100'),
+        ]
+        connection = self.make_connection(responses)
+        processor = beanstalk.JobProcessor()
+        with patch('teuthology.beanstalk.log') as m_log:
+            beanstalk.peek_jobs(connection, 'smithi', processor,
+                                batch_size=2)
+        assert list(processor.jobs) == ['100']
+        sent = ''.join(
+            c[0][0] for c in connection._socket.sendall.call_args_list)
+        # 100 down to 97, and no further
+        assert sent.count('stats-job ') == 4
+        assert 'stats-job 96\r\n' not in sent
+        assert m_log.warning.call_args[0][1:] == (1, 2, 'smithi')
+
+    def test_parse_job_fields(self):
+        body = self.job_body % (1, 10)
+        assert beanstalk.parse_job_fields(body, ['tasks', 'tube']) == dict(
+            tasks=[dict(install=None), dict(ceph=dict(conf=dict(
+                osd=dict(debug=20))))],
+            tube='smithi',
+        )
+        assert beanstalk.parse_job_fields(body, ['missing']) == dict()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock import patch
+
+from teuthology import heartbeat
+
+
+class TestHeartbeatSpool(object):
+    def setup(self):
+        self.path = tempfile.mkdtemp(prefix='test_heartbeat-')
+        self.spool = heartbeat.HeartbeatSpool(self.path, interval=60)
+
+    def teardown(self):
+        shutil.rmtree(self.path)
+
+    def job_info(self, job_id):
+        return dict(name='run', job_id=str(job_id))
+
+    @patch('teuthology.heartbeat.report')
+    def test_coalesced(self, m_report):
+        # the first beat flushes, since nothing was ever flushed
+        heartbeat.beat([self.job_info(1)], spool=self.spool)
+        assert m_report.try_push_jobs_info.call_count == 1
+        # further beats wait for the next flush
+        for job_id in (1, 2, 3):
+            heartbeat.beat([self.job_info(job_id)], spool=self.spool)
+        assert m_report.try_push_jobs_info.call_count == 1
+        assert self.spool.flush(force=True)
+        pushed = m_report.try_push_jobs_info.call_args[0][0]
+        assert sorted(pushed, key=lambda i: i['job_id']) == [
+            self.job_info(job_id) for job_id in (1, 2, 3)]
+        assert not m_report.try_push_job_info.called
+        metrics = self.spool.metrics()
+        assert metrics['heartbeats'] == 3
+        assert 0 <= metrics['max_lag'] < 60
+
+    @patch('teuthology.heartbeat.report')
+    def test_forgotten(self, m_report):
+        self.spool.record(self.job_info(1))
+        self.spool.record(self.job_info(2))
+        heartbeat.forget('1', spool=self.spool)
+        heartbeat.forget('3', spool=self.spool)
+        self.spool.flush(force=True)
+        assert m_report.try_push_jobs_info.call_args[0][0] == [
+            self.job_info(2)]
+
+    @patch('teuthology.heartbeat.report')
+    def test_stale(self, m_report):
+        self.spool.record(self.job_info(1))
+        with patch('teuthology.heartbeat.time.time',
+                   return_value=time.time() + 24 * 60 * 60):
+            self.spool.flush(force=True)
+        assert m_report.try_push_jobs_info.call_args[0][0] == []
+        assert not os.path.exists(os.path.join(self.path, '1.json'))
+
+    @patch('teuthology.heartbeat.report')
+    def test_concurrent_flush(self, m_report):
+        self.spool.record(self.job_info(1))
+        lock_path = os.path.join(self.path, self.spool.lock_file)
+        # lockf() locks are per process, so hold the lock from another one
+        holder = subprocess.Popen(
+            [sys.executable, '-c',
+             'import fcntl, sys; f = open(sys.argv[1], "w"); '
+             'fcntl.lockf(f, fcntl.LOCK_EX); print("locked"); '
+             'sys.stdout.flush(); sys.stdin.read()', lock_path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert holder.stdout.readline().strip() == b'locked'
+            assert not self.spool.flush(force=True)
+        finally:
+            holder.communicate()
+        assert self.spool.flush(force=True)
+
+    @patch('teuthology.heartbeat.report')
+    def test_fallback(self, m_report):
+        spool = heartbeat.HeartbeatSpool(
+            os.path.join(self.path, 'file', 'spool'))
+        with open(os.path.join(self.path, 'file'), 'w'):
+            pass
+        heartbeat.beat([self.job_info(1), self.job_info(2)], spool=spool)
+        assert m_report.try_push_job_info.call_count == 2
+        assert not m_report.try_push_jobs_info.called
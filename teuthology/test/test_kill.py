@@ -0,0 +1,64 @@
+from mock import patch
+
+from teuthology import kill
+
+
+class TestKill(object):
+    @patch('teuthology.lock.ops.do_update_keys')
+    @patch('teuthology.lock.query.list_locks')
+    def test_find_targets(self, m_list_locks, m_do_update_keys):
+        def node(name, description, locked_by='owner', up=True,
+                 is_vm=False):
+            return dict(name=name, description=description,
+                        locked_by=locked_by, up=up, is_vm=is_vm,
+                        ssh_pub_key='key-%s' % name)
+
+        m_list_locks.return_value = [
+            node('n1', '/archive/the-run/1'),
+            node('n2', '/archive/the-run/2', is_vm=True),
+            node('n3', '/archive/the-run/3', up=False),
+            node('n4', '/archive/the-run/4', locked_by='someone'),
+            node('n5', '/archive/other-run/5'),
+            node('n6', None),
+        ]
+        m_do_update_keys.return_value = (0, dict(n2='new-key'))
+        assert kill.find_targets('the-run', 'owner') == dict(
+            targets=dict(n1='key-n1', n2='new-key'))
+        m_do_update_keys.assert_called_once_with(['n2'], _raise=False)
+        assert kill.find_targets('no-run', 'owner') == {}
+
+    @patch('teuthology.nuke.nuke')
+    def test_nuke_targets(self, m_nuke):
+        m_nuke.return_value = dict(n2='key-n2')
+        outcomes = kill.nuke_targets(
+            dict(targets=dict(n1='key-n1', n2='key-n2')), 'owner')
+        assert outcomes == dict(n1='nuked', n2='failed')
+        ctx = m_nuke.call_args[0][0]
+        assert ctx.config == dict(targets=dict(n1='key-n1', n2='key-n2'))
+        assert ctx.owner == 'owner'
+        assert m_nuke.call_args[1] == dict(
+            should_unlock=True, sync_clocks=False, reboot_all=True)
+        m_nuke.side_effect = RuntimeError('lock server is down')
+        assert kill.nuke_targets(dict(targets=dict(n1='key-n1')),
+                                 'owner') == dict(n1='failed')
+        assert kill.nuke_targets(dict(), 'owner') == {}
+
+    @patch('teuthology.kill.nuke_targets')
+    @patch('teuthology.kill.kill_processes')
+    @patch('teuthology.report.ResultsSerializer')
+    def test_main_jobs(self, m_serializer, m_kill_processes,
+                       m_nuke_targets):
+        def job_info(run_name, job_id):
+            return dict(owner='owner', pid=int(job_id),
+                        targets={'n%s' % job_id: 'key'})
+
+        m_serializer.return_value.job_info.side_effect = job_info
+        m_nuke_targets.side_effect = lambda targets, owner: dict(
+            (target, 'nuked') for target in targets['targets'])
+        with patch('teuthology.kill.report_outcomes') as m_report:
+            kill.main({
+                '--run': 'the-run', '--job': ['1', '2'], '--jobspec': None,
+                '--archive': '/archive', '--owner': None,
+                '--machine-type': None, '--preserve-queue': False,
+            })
+        m_report.assert_called_once_with(dict(n1='nuked', n2='nuked'))
@@ -1,4 +1,9 @@
 import argparse
+import io
+import os
+import shutil
+import tarfile
+import tempfile
 from datetime import datetime
 
 from mock import Mock, patch
@@ -293,6 +298,44 @@ class TestHostnames(object):
         assert result == 'box1'
 
 
+class TestSshKeyscan(object):
+    @patch('teuthology.misc.time.sleep')
+    @patch('teuthology.misc.subprocess.Popen')
+    def test_ssh_keyscan(self, m_popen, m_sleep):
+        calls = []
+
+        def popen(args, stdout, stderr):
+            calls.append(args[5:])
+            answering = [name for name in args[5:]
+                         if not (name.startswith('b') and len(calls) == 1)]
+            proc = Mock()
+            proc.communicate.return_value = (
+                ''.join('%s ssh-rsa KEY-%s\n' % (name, name)
+                        for name in answering),
+                '# a.front.sepia.ceph.com:22 SSH-2.0-OpenSSH\n',
+            )
+            return proc
+
+        m_popen.side_effect = popen
+        keys = misc.ssh_keyscan(['a', 'b', 'c'])
+        assert keys == dict(
+            ('%s.front.sepia.ceph.com' % name,
+             'ssh-rsa KEY-%s.front.sepia.ceph.com' % name)
+            for name in 'abc'
+        )
+        # all the hosts are scanned at once, and only b again
+        assert calls == [
+            ['a.front.sepia.ceph.com', 'b.front.sepia.ceph.com',
+             'c.front.sepia.ceph.com'],
+            ['b.front.sepia.ceph.com'],
+        ]
+
+    @patch('teuthology.misc.subprocess.Popen')
+    def test_ssh_keyscan_missing(self, m_popen):
+        m_popen.return_value.communicate.return_value = ('', '')
+        assert misc.ssh_keyscan(['a'], _raise=False) == dict()
+
+
 class TestMergeConfigs(object):
     """ Tests merge_config and deep_merge in teuthology.misc """
 
@@ -366,3 +409,89 @@ class TestIsInDict(object):
 
     def test_nonmembership_with_presence_at_lower_level(self):
         assert not misc.is_in_dict('a', 'foo', {'a':{'a': 'foo'}})
+
+
+class TestPullDirectory(object):
+    def setup(self):
+        self.temp_path = tempfile.mkdtemp(prefix='test_pull_directory-')
+        self.remote = Mock(shortname='host')
+        self.remote.mktemp.return_value = '/tmp/exclude'
+
+    def teardown(self):
+        shutil.rmtree(self.temp_path)
+
+    def make_stream(self, files, mode='w|gz'):
+        data = io.BytesIO()
+        tar = tarfile.open(mode=mode, fileobj=data)
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        tar.close()
+        data.seek(0)
+        return Mock(stdout=data)
+
+    def test_pull(self):
+        self.remote.get_tar_stream.return_value = self.make_stream(
+            [('./a.log', b'aaa'), ('./sub/b.log', b'bb')])
+        done = dict()
+        transferred = misc.pull_directory(
+            self.remote, '/archive', self.temp_path, done=done)
+        assert transferred > 0
+        assert done == {'./a.log': 3, './sub/b.log': 2}
+        with open(os.path.join(self.temp_path, 'sub', 'b.log')) as f:
+            assert f.read() == 'bb'
+        self.remote.get_tar_stream.assert_called_once_with(
+            '/archive', sudo=True, compress='gz', exclude_from=None)
+
+    @patch('teuthology.misc.write_file')
+    def test_resume(self, m_write_file):
+        self.remote.get_tar_stream.return_value = self.make_stream(
+            [('./sub/b.log', b'bb')], mode='w|')
+        done = {'./a.log': 3}
+        misc.pull_directory(self.remote, '/archive', self.temp_path,
+                            compress=None, done=done)
+        m_write_file.assert_called_once_with(
+            self.remote, '/tmp/exclude', './a.log\n')
+        self.remote.get_tar_stream.assert_called_once_with(
+            '/archive', sudo=True, compress=None,
+            exclude_from='/tmp/exclude')
+        self.remote.remove.assert_called_once_with('/tmp/exclude')
+        assert done == {'./a.log': 3, './sub/b.log': 2}
+
+    @patch('teuthology.orchestra.run.wait')
+    def test_failure_stops_tar(self, m_wait):
+        stream = self.make_stream([('./a.log', b'aaa' * 1000)], mode='w|')
+        # the connection drops halfway through
+        stream.stdout = io.BytesIO(stream.stdout.getvalue()[:1024])
+        stream.stdout.channel = Mock()
+        self.remote.get_tar_stream.return_value = stream
+        with pytest.raises(tarfile.ReadError):
+            misc.pull_directory(self.remote, '/archive', self.temp_path,
+                                compress=None)
+        stream.stdout.channel.close.assert_called_once_with()
+        m_wait.assert_called_once_with([stream], timeout=60)
+
+    def test_choose_compression(self):
+        self.remote.sh.return_value = '900 1000\nzstd\n'
+        assert misc.choose_archive_compression(self.remote, '/a') is None
+        self.remote.sh.return_value = '100 1000\nzstd\n'
+        with patch('teuthology.misc.zstandard', None):
+            assert misc.choose_archive_compression(self.remote, '/a') == 'gz'
+        with patch('teuthology.misc.zstandard', Mock()):
+            assert misc.choose_archive_compression(self.remote, '/a') == \
+                'zstd'
+        self.remote.sh.side_effect = RuntimeError()
+        assert misc.choose_archive_compression(self.remote, '/a') == 'gz'
+
+
+class TestRateLimiter(object):
+    @patch('teuthology.misc.time')
+    def test_consume(self, m_time):
+        m_time.time.return_value = 100.0
+        limiter = misc.RateLimiter(1000)
+        limiter.consume(500)
+        m_time.sleep.assert_called_with(0.5)
+        # another consumer queues up behind the first
+        limiter.consume(1000)
+        m_time.sleep.assert_called_with(1.5)
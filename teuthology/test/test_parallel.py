@@ -1,3 +1,7 @@
+import gevent
+import pytest
+
+from teuthology.exceptions import ParallelTaskTimeout
 from teuthology.parallel import parallel
 
 
@@ -26,3 +30,48 @@ class TestParallel(object):
             for result in para:
                 in_set.remove(result)
 
+    def test_finished_before_next_spawn(self):
+        with parallel() as para:
+            para.spawn(identity, 1)
+            gevent.sleep(0.01)
+            para.spawn(identity, 2)
+            assert sorted(para) == [1, 2]
+
+    def test_ordered(self):
+        def sleepy(i):
+            gevent.sleep(0.001 * (10 - i))
+            return i
+        with parallel(ordered=True) as para:
+            for i in range(10):
+                para.spawn(sleepy, i)
+            assert list(para) == list(range(10))
+
+    def test_limit(self):
+        running = []
+        peak = []
+
+        def task(i):
+            running.append(i)
+            peak.append(len(running))
+            gevent.sleep(0.001)
+            running.remove(i)
+            return i
+        with parallel(limit=3) as para:
+            for i in range(10):
+                para.spawn(task, i)
+            assert sorted(para) == list(range(10))
+        assert max(peak) == 3
+
+    def test_timeout(self):
+        with pytest.raises(ParallelTaskTimeout):
+            with parallel(timeout=0.01) as para:
+                para.spawn(gevent.sleep, 1)
+                para.spawn(identity, 1)
+
+    def test_latencies(self):
+        with parallel() as para:
+            para.spawn(gevent.sleep, 0.01)
+            para.spawn(identity, 'host1')
+        assert sorted(d for d, l in para.latencies) == \
+            ['identity(host1)', 'sleep']
+        assert dict(para.latencies)['sleep'] >= 0.01
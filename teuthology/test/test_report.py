@@ -1,5 +1,8 @@
 import yaml
 import json
+import requests
+from mock import patch
+from teuthology.config import config
 from teuthology.test import fake_archive
 from teuthology import report
 
@@ -75,3 +78,31 @@ class TestSerializer(object):
         assert full_obj == out_obj
 
 
+
+
+class TestPushJobsInfo(object):
+    def setup(self):
+        self.orig_results_server = config.results_server
+        config.results_server = 'http://results.example.com'
+
+    def teardown(self):
+        config.results_server = self.orig_results_server
+
+    @patch('teuthology.report.ResultsReporter.report_job')
+    def test_each_job_reported(self, m_report_job):
+        job_configs = [dict(name='run', job_id=str(i)) for i in range(25)]
+        report.try_push_jobs_info(job_configs, dict(status='queued'))
+        assert sorted(c[0][1] for c in m_report_job.call_args_list) == \
+            sorted(str(i) for i in range(25))
+        for c in m_report_job.call_args_list:
+            assert c[0][2]['status'] == 'queued'
+
+    @patch('teuthology.report.ResultsReporter.report_job')
+    def test_failure_does_not_stop_others(self, m_report_job):
+        def report_job(run_name, job_id, job_info):
+            if job_id == '1':
+                raise requests.exceptions.ConnectionError()
+        m_report_job.side_effect = report_job
+        job_configs = [dict(name='run', job_id=str(i)) for i in range(3)]
+        report.try_push_jobs_info(job_configs, batch_size=2)
+        assert m_report_job.call_count == 3
@@ -10,13 +10,16 @@ from scripts import run as scripts_run
 class TestRun(object):
     """ Tests for teuthology.run """
 
+    @patch("teuthology.orchestra.run.set_output_dir")
     @patch("teuthology.log.setLevel")
     @patch("teuthology.setup_log_file")
     @patch("os.mkdir")
-    def test_set_up_logging(self, m_mkdir, m_setup_log_file, m_setLevel):
+    def test_set_up_logging(self, m_mkdir, m_setup_log_file, m_setLevel,
+                            m_set_output_dir):
         run.set_up_logging(True, "path/to/archive")
         m_mkdir.assert_called_with("path/to/archive")
         m_setup_log_file.assert_called_with("path/to/archive/teuthology.log")
+        m_set_output_dir.assert_called_with("path/to/archive/remote_output")
         assert m_setLevel.called
 
     # because of how we import things, mock merge_configs from run - where it's used
@@ -1,4 +1,9 @@
-from teuthology.schedule import build_config
+import beanstalkc
+import pytest
+
+from mock import Mock, patch
+
+from teuthology.schedule import build_config, schedule_jobs
 from teuthology.misc import get_user
 
 
@@ -43,3 +48,32 @@ class TestSchedule(object):
         job_dict = build_config(self.basic_args)
         assert job_dict['owner'] == 'scheduled_%s' % get_user()
 
+
+    @patch('teuthology.schedule.report')
+    def test_schedule_jobs_failure(self, m_report):
+        connection = Mock()
+        connection.put.side_effect = [
+            1, beanstalkc.CommandFailed('put', 'JOB_TOO_BIG', []), 3]
+        job_configs = [
+            dict(name='NAME', tube='tala', priority=99, description=str(i))
+            for i in range(3)
+        ]
+        with pytest.raises(beanstalkc.CommandFailed):
+            schedule_jobs(job_configs, connection)
+        queued = m_report.try_push_jobs_info.call_args[0][0]
+        assert [job['job_id'] for job in queued] == ['1', '3']
+
+    @patch('teuthology.schedule.report')
+    def test_schedule_jobs_connection_lost(self, m_report):
+        connection = Mock()
+        connection.put.side_effect = [1, beanstalkc.SocketError()]
+        job_configs = [
+            dict(name='NAME', tube='tala', priority=99, description=str(i))
+            for i in range(3)
+        ]
+        with pytest.raises(beanstalkc.SocketError):
+            schedule_jobs(job_configs, connection)
+        # the job put before the connection was lost is still reported
+        queued = m_report.try_push_jobs_info.call_args[0][0]
+        assert [job['job_id'] for job in queued] == ['1']
+        connection.close.assert_called_once_with()
@@ -16,6 +16,7 @@ class TestWorker(object):
         self.ctx.archive_dir = '/archive/dir'
         self.ctx.log_dir = '/log/dir'
         self.ctx.tube = 'tube'
+        self.ctx.slots = 1
 
     @patch("os.path.exists")
     def test_restart_file_path_doesnt_exist(self, m_exists):
@@ -301,3 +302,97 @@ class TestWorker(object):
         for i in range(len(jobs)):
             push_call = m_try_push_job_info.call_args_list[i]
             assert push_call[0][1]['status'] == 'dead'
+
+
+class TestSlots(object):
+    def setup(self):
+        self.ctx = Mock()
+        self.ctx.verbose = False
+        self.ctx.archive_dir = '/archive/dir'
+        self.ctx.slots = 2
+
+    def make_job(self, job_id, body):
+        job = Mock(spec=beanstalkc.Job)
+        job.jid = job_id
+        job.body = body
+        return job
+
+    def make_process(self, polls):
+        process = Mock()
+        process.poll.side_effect = polls
+        process.returncode = 0
+        return process
+
+    @patch("teuthology.worker.sentinel", return_value=False)
+    @patch("teuthology.worker.load_config")
+    @patch("teuthology.worker.heartbeat")
+    @patch("teuthology.worker.report")
+    @patch("teuthology.worker.teuth_config")
+    @patch("teuthology.worker.start_job")
+    @patch("teuthology.worker.prep_job")
+    @patch("time.sleep")
+    def test_concurrent(self, m_sleep, m_prep_job, m_start_job, m_t_config,
+                        m_report, m_heartbeat, m_load_config, m_sentinel):
+        m_t_config.watchdog_interval = 0
+        m_t_config.max_job_time = 1000
+        jobs = [self.make_job(1, 'name: a'),
+                self.make_job(2, 'name: b\nstop_worker: true')]
+        connection = Mock()
+        connection.reserve.side_effect = jobs
+        m_prep_job.side_effect = lambda job_config, *args: (
+            job_config, '/bin/path')
+        # job 1 runs for three iterations, job 2 for two
+        running = [
+            worker.RunningJob(
+                job, dict(name=name, job_id=str(job.jid)),
+                self.make_process(polls), Mock())
+            for job, name, polls in (
+                (jobs[0], 'a', [None, None, None, 0]),
+                (jobs[1], 'b', [None, 0]),
+            )
+        ]
+        m_start_job.side_effect = running
+        for running_job in running:
+            running_job.log_symlinked = True
+        worker.run_slots(self.ctx, connection, '/log/path')
+        # both jobs were reserved before either finished
+        assert connection.reserve.call_count == 2
+        for job in jobs:
+            job.bury.assert_called_once_with()
+            job.delete.assert_called_once_with()
+        # heartbeats were sent for the running jobs together
+        pushed = [c[0][0] for c in m_heartbeat.beat.call_args_list]
+        assert [dict(name='a', job_id='1'), dict(name='b', job_id='2')] in \
+            pushed
+        assert m_report.try_push_job_info.call_count == 2
+
+    @patch("teuthology.worker.sentinel", return_value=False)
+    @patch("teuthology.worker.load_config")
+    @patch("teuthology.worker.run_results")
+    @patch("teuthology.worker.prep_job")
+    @patch("time.sleep")
+    def test_results_job(self, m_sleep, m_prep_job, m_run_results,
+                         m_load_config, m_sentinel):
+        job = self.make_job(
+            1, 'name: a\nlast_in_suite: true\nstop_worker: true')
+        connection = Mock()
+        connection.reserve.side_effect = [job]
+        m_prep_job.side_effect = lambda job_config, *args: (
+            job_config, '/bin/path')
+        worker.run_slots(self.ctx, connection, '/log/path')
+        assert m_run_results.call_count == 1
+        job.delete.assert_called_once_with()
+
+    @patch("teuthology.worker.kill_job")
+    @patch("teuthology.worker.heartbeat")
+    @patch("teuthology.worker.teuth_config")
+    def test_watchdog_kills(self, m_t_config, m_heartbeat, m_kill_job):
+        m_t_config.max_job_time = 60
+        running_job = worker.RunningJob(
+            Mock(), dict(name='a', job_id='1', owner='owner'), Mock(), Mock())
+        running_job.start_time -= timedelta(seconds=61)
+        worker.watchdog([running_job])
+        m_kill_job.assert_called_once_with(
+            'a', '1', m_t_config.archive_base, 'owner')
+        m_heartbeat.beat.assert_called_once_with(
+            [dict(name='a', job_id='1')])
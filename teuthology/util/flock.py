@@ -1,22 +1,43 @@
+import errno
 import fcntl
 
 
 class FileLock(object):
-    def __init__(self, filename, noop=False):
+    """
+    An exclusive lock on filename, held while in the with block.
+
+    If blocking is False, the with block is entered whether or not the lock
+    could be taken; check the acquired attribute.
+    """
+    def __init__(self, filename, noop=False, blocking=True):
         self.filename = filename
         self.file = None
         self.noop = noop
+        self.blocking = blocking
+        self.acquired = False
 
     def __enter__(self):
         if not self.noop:
             assert self.file is None
             self.file = open(self.filename, 'w')
-            fcntl.lockf(self.file, fcntl.LOCK_EX)
+            flags = fcntl.LOCK_EX
+            if not self.blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.lockf(self.file, flags)
+            except IOError as e:
+                if self.blocking or e.errno not in (errno.EACCES,
+                                                    errno.EAGAIN):
+                    raise
+                return self
+        self.acquired = True
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if not self.noop:
             assert self.file is not None
-            fcntl.lockf(self.file, fcntl.LOCK_UN)
+            if self.acquired:
+                fcntl.lockf(self.file, fcntl.LOCK_UN)
             self.file.close()
             self.file = None
+        self.acquired = False
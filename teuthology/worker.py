@@ -10,6 +10,7 @@ from datetime import datetime
 
 from teuthology import setup_log_file, install_except_hook
 from teuthology import beanstalk
+from teuthology import heartbeat
 from teuthology import report
 from teuthology import safepath
 from teuthology.config import config as teuth_config
@@ -22,6 +23,9 @@ log = logging.getLogger(__name__)
 start_time = datetime.utcnow()
 restart_file_path = '/tmp/teuthology-restart-workers'
 stop_file_path = '/tmp/teuthology-stop-workers'
+# How often a multi-slot worker checks on its jobs, and reloads its config
+SLOT_POLL_INTERVAL = 10
+CONFIG_LOAD_INTERVAL = 60
 
 
 def sentinel(path):
@@ -82,6 +86,10 @@ def main(ctx):
         fetch_teuthology('master')
     fetch_qa_suite('master')
 
+    if ctx.slots > 1:
+        run_slots(ctx, connection, log_file_path)
+        return
+
     keep_running = True
     while keep_running:
         # Check to see if we have a teuthology-results process hanging around
@@ -128,12 +136,179 @@ def main(ctx):
         except SkipJob:
             continue
 
-        # This try/except block is to keep the worker from dying when
-        # beanstalkc throws a SocketError
+        delete_job(job)
+
+
+def run_slots(ctx, connection, log_file_path):
+    """
+    The main loop of a worker that runs up to ctx.slots jobs at once.
+
+    Jobs are only reserved while a slot is free. The running jobs are all
+    supervised from this loop: their exits are noticed within
+    SLOT_POLL_INTERVAL seconds, and their watchdog heartbeats are sent
+    together. Once a restart or stop is requested (or a job asks the worker
+    to stop), no more jobs are reserved, and the worker restarts or stops
+    when the running jobs have finished.
+    """
+    running_jobs = list()
+    keep_running = True
+    last_load = last_heartbeat = time.time()
+    while keep_running or running_jobs:
+        for running_job in list(running_jobs):
+            if running_job.poll() is not None:
+                running_job.finish()
+                running_jobs.remove(running_job)
+
+        if sentinel(restart_file_path) or sentinel(stop_file_path):
+            if keep_running and running_jobs:
+                log.info("Waiting for %d running jobs to finish",
+                         len(running_jobs))
+            keep_running = False
+
+        now = time.time()
+        if now - last_heartbeat >= teuth_config.watchdog_interval:
+            watchdog(running_jobs)
+            last_heartbeat = now
+
+        if not keep_running or len(running_jobs) >= ctx.slots:
+            time.sleep(SLOT_POLL_INTERVAL)
+            continue
+
+        if now - last_load >= CONFIG_LOAD_INTERVAL:
+            load_config()
+            last_load = now
+
+        job = connection.reserve(timeout=SLOT_POLL_INTERVAL)
+        if job is None:
+            continue
+
+        # bury the job so it won't be re-run if it fails
+        job.bury()
+        job_id = job.jid
+        log.info('Reserved job %d', job_id)
+        log.info('Config is: %s', job.body)
+        job_config = yaml.safe_load(job.body)
+        job_config['job_id'] = str(job_id)
+
+        if job_config.get('stop_worker'):
+            keep_running = False
+
         try:
-            job.delete()
-        except Exception:
-            log.exception("Saw exception while trying to delete job")
+            job_config, teuth_bin_path = prep_job(
+                job_config,
+                log_file_path,
+                ctx.archive_dir,
+            )
+            running_job = start_job(
+                job,
+                job_config,
+                teuth_bin_path,
+                ctx.archive_dir,
+                ctx.verbose,
+            )
+        except SkipJob:
+            continue
+        if running_job is None:
+            delete_job(job)
+        else:
+            running_jobs.append(running_job)
+
+    if sentinel(restart_file_path):
+        restart()
+    elif sentinel(stop_file_path):
+        stop()
+
+
+def start_job(job, job_config, teuth_bin_path, archive_dir, verbose):
+    """
+    Like run_job(), but return as soon as the job has started
+
+    :returns: A RunningJob, or None for first- and last-in-suite jobs, whose
+              teuthology-results process runs on its own
+    """
+    if job_config.get('first_in_suite') or job_config.get('last_in_suite'):
+        run_results(job_config, teuth_bin_path, archive_dir)
+        return None
+    arg = build_job_args(job_config, teuth_bin_path, verbose)
+    config_file = tempfile.NamedTemporaryFile(
+        prefix='teuthology-worker.', suffix='.tmp', mode='w+t')
+    process = spawn_job(job_config, arg, config_file)
+    return RunningJob(job, job_config, process, config_file)
+
+
+class RunningJob(object):
+    """
+    A job started by a multi-slot worker, with what's needed to supervise it
+    """
+    def __init__(self, job, job_config, process, config_file):
+        self.job = job
+        self.job_config = job_config
+        self.process = process
+        self.config_file = config_file
+        self.start_time = datetime.utcnow()
+        self.log_symlinked = False
+        # Only push the information that's relevant to the watchdog, to save
+        # db load
+        self.job_info = dict(
+            name=job_config['name'],
+            job_id=job_config['job_id'],
+        )
+
+    @property
+    def run_time(self):
+        run_time = datetime.utcnow() - self.start_time
+        return run_time.days * 60 * 60 * 24 + run_time.seconds
+
+    def poll(self):
+        # Give the child time to start up and create the archive dir before
+        # linking the worker log into it
+        if not self.log_symlinked and self.run_time >= 5:
+            symlink_worker_log(self.job_config['worker_log'],
+                               self.job_config['archive_path'])
+            self.log_symlinked = True
+        return self.process.poll()
+
+    def finish(self):
+        if self.process.returncode != 0:
+            log.error('Job %s exited with code %d', self.job_info['job_id'],
+                      self.process.returncode)
+        else:
+            log.info('Job %s succeeded', self.job_info['job_id'])
+        self.config_file.close()
+        if teuth_config.results_server:
+            # See run_with_watchdog()
+            heartbeat.forget(self.job_info['job_id'])
+            report.try_push_job_info(self.job_info, dict(status='dead'))
+        delete_job(self.job)
+
+
+def watchdog(running_jobs):
+    """
+    Do what run_with_watchdog() does on each of its iterations, for all the
+    jobs of a multi-slot worker at once
+    """
+    if not teuth_config.results_server or not running_jobs:
+        return
+    for running_job in running_jobs:
+        # Kill jobs that have been running longer than the global max
+        if running_job.run_time > teuth_config.max_job_time:
+            log.warning("Job %s ran longer than %ss. Killing...",
+                        running_job.job_info['job_id'],
+                        teuth_config.max_job_time)
+            kill_job(running_job.job_info['name'],
+                     running_job.job_info['job_id'],
+                     teuth_config.archive_base,
+                     running_job.job_config['owner'])
+    heartbeat.beat([running_job.job_info for running_job in running_jobs])
+
+
+def delete_job(job):
+    # This try/except block is to keep the worker from dying when
+    # beanstalkc throws a SocketError
+    try:
+        job.delete()
+    except Exception:
+        log.exception("Saw exception while trying to delete job")
 
 
 def prep_job(job_config, log_file_path, archive_dir):
@@ -189,42 +364,84 @@ def prep_job(job_config, log_file_path, archive_dir):
 
 
 def run_job(job_config, teuth_bin_path, archive_dir, verbose):
-    safe_archive = safepath.munge(job_config['name'])
     if job_config.get('first_in_suite') or job_config.get('last_in_suite'):
+        run_results(job_config, teuth_bin_path, archive_dir)
+        return
+
+    arg = build_job_args(job_config, teuth_bin_path, verbose)
+
+    with tempfile.NamedTemporaryFile(prefix='teuthology-worker.',
+                                     suffix='.tmp', mode='w+t') as tmp:
+        p = spawn_job(job_config, arg, tmp)
+
         if teuth_config.results_server:
-            report.try_delete_jobs(job_config['name'], job_config['job_id'])
-        suite_archive_dir = os.path.join(archive_dir, safe_archive)
-        safepath.makedirs('/', suite_archive_dir)
-        args = [
-            os.path.join(teuth_bin_path, 'teuthology-results'),
-            '--archive-dir', suite_archive_dir,
-            '--name', job_config['name'],
-        ]
-        if job_config.get('first_in_suite'):
-            log.info('Generating memo for %s', job_config['name'])
-            if job_config.get('seed'):
-                args.extend(['--seed', job_config['seed']])
-            if job_config.get('subset'):
-                args.extend(['--subset', job_config['subset']])
+            log.info("Running with watchdog")
+            try:
+                run_with_watchdog(p, job_config)
+            except Exception:
+                log.exception("run_with_watchdog had an unhandled exception")
+                raise
         else:
-            log.info('Generating results for %s', job_config['name'])
-            timeout = job_config.get('results_timeout',
-                                     teuth_config.results_timeout)
-            args.extend(['--timeout', str(timeout)])
-            if job_config.get('email'):
-                args.extend(['--email', job_config['email']])
-        # Execute teuthology-results, passing 'preexec_fn=os.setpgrp' to
-        # make sure that it will continue to run if this worker process
-        # dies (e.g. because of a restart)
-        result_proc = subprocess.Popen(args=args, preexec_fn=os.setpgrp)
-        log.info("teuthology-results PID: %s", result_proc.pid)
-        return
+            log.info("Running without watchdog")
+            # This sleep() is to give the child time to start up and create the
+            # archive dir.
+            time.sleep(5)
+            symlink_worker_log(job_config['worker_log'],
+                               job_config['archive_path'])
+            p.wait()
+
+        if p.returncode != 0:
+            log.error('Child exited with code %d', p.returncode)
+        else:
+            log.info('Success!')
+
 
+def run_results(job_config, teuth_bin_path, archive_dir):
+    """
+    Start the teuthology-results process for a first- or last-in-suite job
+
+    :returns: The teuthology-results process
+    """
+    safe_archive = safepath.munge(job_config['name'])
+    if teuth_config.results_server:
+        report.try_delete_jobs(job_config['name'], job_config['job_id'])
+    suite_archive_dir = os.path.join(archive_dir, safe_archive)
+    safepath.makedirs('/', suite_archive_dir)
+    args = [
+        os.path.join(teuth_bin_path, 'teuthology-results'),
+        '--archive-dir', suite_archive_dir,
+        '--name', job_config['name'],
+    ]
+    if job_config.get('first_in_suite'):
+        log.info('Generating memo for %s', job_config['name'])
+        if job_config.get('seed'):
+            args.extend(['--seed', job_config['seed']])
+        if job_config.get('subset'):
+            args.extend(['--subset', job_config['subset']])
+    else:
+        log.info('Generating results for %s', job_config['name'])
+        timeout = job_config.get('results_timeout',
+                                 teuth_config.results_timeout)
+        args.extend(['--timeout', str(timeout)])
+        if job_config.get('email'):
+            args.extend(['--email', job_config['email']])
+    # Execute teuthology-results, passing 'preexec_fn=os.setpgrp' to
+    # make sure that it will continue to run if this worker process
+    # dies (e.g. because of a restart)
+    result_proc = subprocess.Popen(args=args, preexec_fn=os.setpgrp)
+    log.info("teuthology-results PID: %s", result_proc.pid)
+    return result_proc
+
+
+def build_job_args(job_config, teuth_bin_path, verbose):
+    """
+    Create the job's archive dir, and return the arguments to run teuthology
+    with, up to (but not including) the path of the job's config file
+    """
     log.info('Creating archive dir %s', job_config['archive_path'])
     safepath.makedirs('/', job_config['archive_path'])
     log.info('Running job %s', job_config['job_id'])
 
-    suite_path = job_config['suite_path']
     arg = [
         os.path.join(teuth_bin_path, 'teuthology'),
     ]
@@ -252,41 +469,27 @@ def run_job(job_config, teuth_bin_path, archive_dir, verbose):
     if job_config['description'] is not None:
         arg.extend(['--description', job_config['description']])
     arg.append('--')
+    return arg
 
-    with tempfile.NamedTemporaryFile(prefix='teuthology-worker.',
-                                     suffix='.tmp', mode='w+t') as tmp:
-        yaml.safe_dump(data=job_config, stream=tmp)
-        tmp.flush()
-        arg.append(tmp.name)
-        env = os.environ.copy()
-        python_path = env.get('PYTHONPATH', '')
-        python_path = ':'.join([suite_path, python_path]).strip(':')
-        env['PYTHONPATH'] = python_path
-        log.debug("Running: %s" % ' '.join(arg))
-        p = subprocess.Popen(args=arg, env=env)
-        log.info("Job archive: %s", job_config['archive_path'])
-        log.info("Job PID: %s", str(p.pid))
 
-        if teuth_config.results_server:
-            log.info("Running with watchdog")
-            try:
-                run_with_watchdog(p, job_config)
-            except Exception:
-                log.exception("run_with_watchdog had an unhandled exception")
-                raise
-        else:
-            log.info("Running without watchdog")
-            # This sleep() is to give the child time to start up and create the
-            # archive dir.
-            time.sleep(5)
-            symlink_worker_log(job_config['worker_log'],
-                               job_config['archive_path'])
-            p.wait()
+def spawn_job(job_config, arg, config_file):
+    """
+    Write the job's config to config_file, and start teuthology on it
 
-        if p.returncode != 0:
-            log.error('Child exited with code %d', p.returncode)
-        else:
-            log.info('Success!')
+    :returns: The teuthology process
+    """
+    yaml.safe_dump(data=job_config, stream=config_file)
+    config_file.flush()
+    arg.append(config_file.name)
+    env = os.environ.copy()
+    python_path = env.get('PYTHONPATH', '')
+    python_path = ':'.join([job_config['suite_path'], python_path]).strip(':')
+    env['PYTHONPATH'] = python_path
+    log.debug("Running: %s" % ' '.join(arg))
+    p = subprocess.Popen(args=arg, env=env)
+    log.info("Job archive: %s", job_config['archive_path'])
+    log.info("Job PID: %s", str(p.pid))
+    return p
 
 
 def run_with_watchdog(process, job_config):
@@ -312,9 +515,9 @@ def run_with_watchdog(process, job_config):
             kill_job(job_info['name'], job_info['job_id'],
                      teuth_config.archive_base, job_config['owner'])
 
-        # calling this without a status just updates the jobs updated time
-        report.try_push_job_info(job_info)
+        heartbeat.beat([job_info])
         time.sleep(teuth_config.watchdog_interval)
+    heartbeat.forget(job_info['job_id'])
 
     # we no longer support testing theses old branches
     assert(job_config.get('teuthology_branch') not in ('argonaut', 'bobtail',